@@ -0,0 +1,18 @@
+"""The URLs served under ASGI (see `mattshop.asgi`).
+
+These are the same as `mattshop.urls`, but with the read endpoints served by async views, so that a single worker can
+serve many concurrent requests.
+"""
+from django.urls import path
+
+from mattshop import urls
+from mattshop.healthcheck.views import heartbeat_async
+from mattshop.orders.views import order_list_async
+from mattshop.products.views import product_export_async, product_list_async
+
+urlpatterns = [
+    path('healthcheck/heartbeat/', heartbeat_async),
+    path('products/list/', product_list_async),
+    path('products/export/', product_export_async),
+    path('orders/history/', order_list_async),
+] + urls.urlpatterns
@@ -0,0 +1,58 @@
+"""Support for the async views served under ASGI (see `mattshop.asgi_urls`).
+
+DRF's views are synchronous, so the async views are plain Django views, which make their queries with Django's async
+ORM. They reuse DRF's serializers, pagination and JSON rendering, so their responses match those of the DRF views.
+"""
+from functools import wraps
+
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from mattshop.authentication.authentication import CachedTokenAuthentication, SignedTokenAuthentication
+from mattshop.metrics import TimedJSONRenderer
+
+
+AUTHENTICATORS = [CachedTokenAuthentication(), SignedTokenAuthentication()]
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(
+        TimedJSONRenderer().render(data), status=status, headers=headers, content_type='application/json'
+    )
+
+
+async def authenticate(request):
+    """Authenticates a request as DRF would with the default authentication classes, or raises `NotAuthenticated`."""
+    for authenticator in AUTHENTICATORS:
+        result = await authenticator.aauthenticate(request)
+        if result is not None:
+            return result[0]
+    raise exceptions.NotAuthenticated()
+
+
+def async_api_view(authenticated=True):
+    """Decorates an async, read-only view taking a DRF `Request`.
+
+    Args:
+        authenticated (bool): Whether the request must be authenticated, setting `request.user`.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                detail = 'Method "{}" not allowed.'.format(request.method)
+                return render({'detail': detail}, status=405, headers={'Allow': 'GET, HEAD'})
+
+            api_request = Request(request)
+            try:
+                if authenticated:
+                    api_request.user = await authenticate(api_request)
+                return await view(api_request, *args, **kwargs)
+            except exceptions.APIException as e:
+                headers = None
+                if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    headers = {'WWW-Authenticate': AUTHENTICATORS[0].authenticate_header(api_request)}
+                return render({'detail': e.detail}, status=e.status_code, headers=headers)
+        return wrapped
+    return decorator
@@ -0,0 +1,168 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+
+from mattshop.authentication.models import AccessTokenUser
+from mattshop.authentication.tokens import InvalidAccessToken, verify_access_token
+
+
+class TokenCache:
+    """A bounded, thread-safe LRU cache of token key -> (user, token), whose entries expire after `ttl` seconds.
+
+    With `shared` set, lookups missing this process's cache fall back to the Django cache, so that processes (e.g. uwsgi
+    workers) can reuse each other's lookups.
+    """
+    shared_key_prefix = 'auth:token:'
+
+    def __init__(self, max_size, ttl, shared=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached (user, token) for a token key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.shared:
+            value = cache.get(self.shared_key(key))
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared:
+            cache.set(self.shared_key(key), value, timeout=self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            cache.delete(self.shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+            }
+
+    def shared_key(self, key):
+        # tokens are credentials, so aren't written to the shared cache in the clear
+        return self.shared_key_prefix + hashlib.sha256(key.encode()).hexdigest()
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(
+    max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+    shared=settings.AUTH_TOKEN_CACHE_SHARED,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF's token authentication, caching each token's user rather than querying for it on every request.
+
+    Cached tokens are invalidated when deleted (including when regenerated), and when their user is saved - e.g. on
+    being deactivated (see `mattshop.authentication.signals`). Invalidation only reaches this process's cache and the
+    shared cache, so other processes may go on accepting a token for up to `AUTH_TOKEN_CACHE_TTL` seconds.
+    """
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token))
+        return user, token
+
+    async def aauthenticate(self, request):
+        """An async equivalent of `authenticate`, looking up uncached tokens with the async ORM."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            token = await self.get_model().objects.select_related('user').aget(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+
+        token_cache.set(key, (token.user, token))
+        return token.user, token
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticates `Authorization: Bearer <access token>` headers, with signed access tokens (see `tokens`).
+
+    The signature is trusted without looking the user up, so `request.user` is a read-only `AccessTokenUser` carrying
+    only its primary key - enough to filter and create rows by user, but without any of the user's other details.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid bearer header.")
+
+        try:
+            user_id = verify_access_token(auth[1].decode())
+        except (InvalidAccessToken, UnicodeError) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        return AccessTokenUser(pk=user_id, is_active=True), None
+
+    async def aauthenticate(self, request):
+        return self.authenticate(request)  # makes no queries, so is safe to call from async code
+
+    def authenticate_header(self, request):
+        return self.keyword
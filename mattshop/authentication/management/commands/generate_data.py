@@ -0,0 +1,203 @@
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from rest_framework.authtoken.models import Token
+
+from mattshop.orders.models import Order, OrderItem
+from mattshop.orders.partitions import create_partitions
+from mattshop.orders.summaries import rebuild_order_summaries
+from mattshop.products.models import CatalogueEntry, Product, ProductPrice
+from mattshop.products.operations import refresh_catalogue
+
+
+def _rng(seed, kind, chunk):
+    """A random generator for one chunk of data, so each chunk's contents depend only on the seed and its position -
+    not on how many workers there are or which of them generates it."""
+    return random.Random('{}:{}:{}'.format(seed, kind, chunk))
+
+
+def _skewed_choice(rng, values):
+    """Picks from `values`, favouring those near the start - some products and customers are far busier than others."""
+    return values[int(len(values) * rng.random() ** 3)]
+
+
+def _chunks(total, chunk_size):
+    return [(chunk, start, min(chunk_size, total - start)) for chunk, start in enumerate(range(0, total, chunk_size))]
+
+
+def generate_users(options, chunk, start, count):
+    rng = _rng(options['seed'], 'users', chunk)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username='{}{}'.format(options['prefix'], i),
+                password=options['password_hash'],
+                date_joined=options['now'],
+            )
+            for i in range(start, start + count)
+        ])
+        Token.objects.bulk_create([Token(key='{:040x}'.format(rng.getrandbits(160)), user=user) for user in users])
+    return count
+
+
+def generate_products(options, chunk, start, count):
+    rng = _rng(options['seed'], 'products', chunk)
+    with transaction.atomic():
+        products = Product.objects.bulk_create([
+            Product(
+                name='Product {}'.format(i),
+                enabled=rng.random() > 0.05,
+                quantity_in_stock=rng.randint(0, 1000),
+            )
+            for i in range(start, start + count)
+        ])
+        prices = []
+        for product in products:
+            # a history of prices, the last of which is current
+            effective_from = options['now'] - timedelta(days=options['days'])
+            price = Decimal(rng.randint(100, 100000)) / 100
+            for _ in range(options['prices']):
+                prices.append(ProductPrice(product=product, price=price, effective_from=effective_from))
+                effective_from += timedelta(seconds=rng.randint(0, options['days'] * 86400 // options['prices']))
+                price = max(Decimal('0.01'), (price * Decimal(rng.uniform(0.8, 1.2))).quantize(Decimal('0.01')))
+        ProductPrice.objects.bulk_create(prices)
+    return count
+
+
+def _copy(cursor, model, columns, rows):
+    with cursor.copy('COPY {} ({}) FROM STDIN'.format(model._meta.db_table, ', '.join(columns))) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def _reserve_ids(cursor, model, count):
+    """Takes `count` ids from the model's primary key sequence, so rows referencing them can be written by COPY."""
+    cursor.execute(
+        'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+        [model._meta.db_table, model._meta.pk.column, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def generate_orders(options, chunk, start, count):
+    rng = _rng(options['seed'], 'orders', chunk)
+    user_ids = _load_user_ids(options['prefix'])
+    products = _load_products()
+
+    orders = []
+    items = []
+    for _ in range(count):
+        user_id = _skewed_choice(rng, user_ids)
+        created_at = options['now'] - timedelta(seconds=rng.randint(0, options['days'] * 86400))
+        # an order has each product at most once
+        order_products = dict.fromkeys(_skewed_choice(rng, products) for _ in range(rng.randint(1, options['items'])))
+        order_items = [(product_id, name, price, rng.randint(1, 3)) for product_id, name, price in order_products]
+        orders.append((user_id, sum(price * quantity for _, _, price, quantity in order_items), created_at))
+        items.append(order_items)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        order_ids = _reserve_ids(cursor, Order, count)
+        _copy(cursor, Order, ['id', 'user_id', 'total_price', 'created_at'], (
+            (order_id, *order) for order_id, order in zip(order_ids, orders)
+        ))
+        item_columns = ['order_id', 'product_id', 'product_name', 'product_price', 'quantity', 'created_at']
+        _copy(cursor, OrderItem, item_columns, (
+            (order_id, *item, order[2]) for order_id, order, order_items in zip(order_ids, orders, items)
+            for item in order_items
+        ))
+    return count
+
+
+_id_cache = {}
+
+
+def _load_user_ids(prefix):
+    # loaded once per worker process, rather than per chunk. They're ordered by what was generated, rather than by id -
+    # ids depend on the order parallel workers happened to insert in
+    if 'users' not in _id_cache:
+        _id_cache['users'] = list(
+            User.objects.filter(username__startswith=prefix).order_by('username').values_list('id', flat=True)
+        )
+    return _id_cache['users']
+
+
+def _load_products():
+    if 'products' not in _id_cache:
+        _id_cache['products'] = list(
+            CatalogueEntry.objects.listable().order_by('name').values_list('product_id', 'name', 'price')
+        )
+    return _id_cache['products']
+
+
+def _run_chunk(args):
+    generate, options, chunk, start, count = args
+    return generate(options, chunk, start, count)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates large volumes of synthetic users (with auth tokens), products (with price histories) and orders, "
+        "for load testing. The data is deterministic for a given seed and `--until`, and independent of the number of "
+        "workers. Run against an empty, disposable database - tokens are derived from the seed, and every user shares "
+        "a password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help="Number of users to create.")
+        parser.add_argument('--products', type=int, default=10000, help="Number of products to create.")
+        parser.add_argument('--prices', type=int, default=3, help="Number of prices in each product's history.")
+        parser.add_argument('--orders', type=int, default=100000, help="Number of orders to create.")
+        parser.add_argument('--items', type=int, default=5, help="Maximum number of items on each order.")
+        parser.add_argument('--days', type=int, default=365, help="Number of days of history to spread orders over.")
+        parser.add_argument(
+            '--until', type=datetime.fromisoformat,
+            help="End of the history, as an ISO 8601 date(time). Defaults to now.",
+        )
+        parser.add_argument('--seed', default='mattshop', help="Seed to generate the data from.")
+        parser.add_argument('--prefix', default='loadtest', help="Prefix of generated usernames.")
+        parser.add_argument('--password', default='loadtest', help="Password of every generated user.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Number of rows generated per transaction.")
+        parser.add_argument('--workers', type=int, default=1, help="Number of processes to generate data in.")
+
+    def handle(self, *args, **options):
+        if options['prices'] < 1 or options['items'] < 1:
+            raise CommandError("--prices and --items must be at least 1.")
+        options['now'] = options['until'] or datetime.now().replace(microsecond=0)
+        # hashing is deliberately slow, so every user shares one hash
+        options['password_hash'] = make_password(options['password'])
+
+        self.generate('users', generate_users, options['users'], options)
+        self.generate('products', generate_products, options['products'], options)
+        start = time.perf_counter()
+        refresh_catalogue()
+        print("Refreshed catalogue in {:.1f}s.".format(time.perf_counter() - start))
+        if options['orders'] and not CatalogueEntry.objects.listable().exists():
+            raise CommandError("No products to order.")
+        # orders outside the months with partitions would all land in the default partition
+        create_partitions(options['now'] - timedelta(days=options['days']), options['now'])
+        self.generate('orders', generate_orders, options['orders'], options)
+        # orders are copied in directly, so their users' summaries are built afterwards
+        start = time.perf_counter()
+        rebuild_order_summaries(chunk_size=options['chunk_size'], workers=options['workers'])
+        print("Rebuilt order summaries in {:.1f}s.".format(time.perf_counter() - start))
+
+    def generate(self, kind, generate, total, options):
+        chunks = [(generate, options, *chunk) for chunk in _chunks(total, options['chunk_size'])]
+        start = time.perf_counter()
+        _id_cache.clear()
+        if options['workers'] > 1:
+            # forked workers must each open their own database connection
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+                generated = sum(pool.imap_unordered(_run_chunk, chunks))
+        else:
+            generated = sum(map(_run_chunk, chunks))
+        elapsed = time.perf_counter() - start
+        print("Generated {} {} in {:.1f}s ({:.0f}/s).".format(generated, kind, elapsed, generated / (elapsed or 1)))
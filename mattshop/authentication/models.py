@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+
+
+class AccessTokenUser(User):
+    """The user of a request authenticated by a signed access token (see `SignedTokenAuthentication`).
+
+    The token is trusted without looking the user up, so this carries only the user's primary key - enough to filter
+    and create rows by user. Its other fields are blank rather than the user's, so it can't be saved or deleted, which
+    would overwrite or remove the real user. Look the `User` up to change it. It's never staff, whatever the real user
+    is, so staff-only endpoints need a `Token`.
+    """
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise NotImplementedError("Access token users are read-only - look the User up to change it.")
+
+    def delete(self, *args, **kwargs):
+        raise NotImplementedError("Access token users are read-only - look the User up to delete it.")
+
+    def set_password(self, raw_password):
+        raise NotImplementedError("Access token users are read-only - look the User up to change it.")
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from mattshop.authentication.authentication import token_cache
+
+
+def invalidate_tokens(keys):
+    """Removes tokens from the cache, both now and once the current transaction commits.
+
+    Waiting for the commit alone would let this process keep using the cached token in the meantime, while removing
+    it only now would let a concurrent request re-cache the old data before the transaction commits.
+    """
+    def invalidate():
+        for key in keys:
+            token_cache.delete(key)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created=False, raw=False, **kwargs):
+    """Stops cached tokens outliving changes to their user, such as being deactivated."""
+    if created or raw:
+        return
+    invalidate_tokens(list(Token.objects.filter(user=instance).values_list('key', flat=True)))
@@ -0,0 +1,59 @@
+"""Short-lived, signed access tokens.
+
+An access token is the user's id and an expiry time, signed with HMAC (see `django.core.signing`). Verifying one needs
+no database lookup - the signature proves that we issued it. The trade-off is that an access token can't be revoked, so
+it only lives for `ACCESS_TOKEN_LIFETIME` seconds. Clients then use their long-lived refresh token - the existing
+`Token` - to get a new one.
+
+Tokens are signed with the first of `ACCESS_TOKEN_SIGNING_KEYS`, and accepted if signed with any of them. To rotate
+keys, add a new key to the front of the list, then remove the old key once every token signed with it has expired.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+
+
+SALT = 'mattshop.authentication.access-token'
+
+
+class InvalidAccessToken(Exception):
+    pass
+
+
+def issue_access_token(user, now=None):
+    """Issues an access token for a user.
+
+    Returns:
+        The access token, and the number of seconds it is valid for.
+    """
+    now = now or time.time()
+    lifetime = settings.ACCESS_TOKEN_LIFETIME
+    token = signing.dumps(
+        {'user_id': user.pk, 'exp': int(now + lifetime)}, key=settings.ACCESS_TOKEN_SIGNING_KEYS[0], salt=SALT
+    )
+    return token, lifetime
+
+
+def verify_access_token(token, now=None):
+    """Checks an access token's signature and expiry.
+
+    Returns:
+        The id of the user the token was issued to.
+
+    Raises:
+        InvalidAccessToken: If the token is malformed, wasn't signed by any current key, or has expired.
+    """
+    try:
+        payload = signing.loads(
+            token,
+            key=settings.ACCESS_TOKEN_SIGNING_KEYS[0],
+            fallback_keys=settings.ACCESS_TOKEN_SIGNING_KEYS[1:],
+            salt=SALT,
+        )
+    except signing.BadSignature:
+        raise InvalidAccessToken("Invalid access token.")
+
+    if payload['exp'] <= (now or time.time()):
+        raise InvalidAccessToken("Access token has expired.")
+    return payload['user_id']
@@ -1,6 +1,8 @@
 from django.urls import path
-from rest_framework.authtoken import views
+
+from mattshop.authentication.views import LoginView, RefreshAccessTokenView
 
 urlpatterns = [
-    path('login/', views.obtain_auth_token),
+    path('login/', LoginView.as_view()),
+    path('token/refresh/', RefreshAccessTokenView.as_view()),
 ]
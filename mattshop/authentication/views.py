@@ -0,0 +1,50 @@
+from rest_framework import serializers, status
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from mattshop.authentication.tokens import issue_access_token
+
+
+class LoginView(ObtainAuthToken):
+    """Issues the user's long-lived `token`, and a short-lived signed `access_token`.
+
+    `token` can be used directly, as before, or as the refresh token for getting new access tokens.
+    """
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, _ = Token.objects.get_or_create(user=user)
+        access_token, expires_in = issue_access_token(user)
+        return Response({
+            'token': token.key,
+            'access_token': access_token,
+            'expires_in': expires_in,
+        })
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField()
+
+
+class RefreshAccessTokenView(APIView):
+    """Issues a new access token, in exchange for a refresh token (the user's `token` from logging in)."""
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        refresh_data = RefreshTokenSerializer(data=request.data)
+        if not refresh_data.is_valid():
+            return Response(refresh_data.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        token = Token.objects.select_related('user').filter(key=refresh_data.validated_data['refresh_token']).first()
+        if token is None or not token.user.is_active:
+            return Response({'message': "Invalid refresh token."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        access_token, expires_in = issue_access_token(token.user)
+        return Response({
+            'access_token': access_token,
+            'expires_in': expires_in,
+        })
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class HealthcheckConfig(AppConfig):
     name = 'mattshop.healthcheck'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from mattshop.metrics import install_query_recorder
+        connection_created.connect(install_query_recorder)
@@ -0,0 +1,85 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+async def fetch(url, headers, client_delay):
+    """Makes a GET request on a new connection, returning its status code.
+
+    With `client_delay`, the request is sent slowly - its headers trickle in over that many seconds - as from a client
+    on a slow network. A synchronous worker is tied up for all of that time, an async one isn't.
+    """
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        lines = ['GET {} HTTP/1.1'.format(path), 'Host: {}'.format(parts.netloc), 'Connection: close']
+        lines += ['{}: {}'.format(name, value) for name, value in headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+        if client_delay:
+            writer.write(request[:-2])
+            await writer.drain()
+            await asyncio.sleep(client_delay)
+            request = request[-2:]
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def run_benchmark(url, headers, concurrency, requests, client_delay):
+    latencies = []
+    statuses = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            statuses.append(await fetch(url, headers, client_delay))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies, statuses
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the throughput and latency of an endpoint under concurrent load, on one or more servers - e.g. to "
+        "compare the uwsgi (WSGI) and uvicorn (ASGI) services in docker-compose."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="Full URLs to benchmark, e.g. http://api:8000/products/list/")
+        parser.add_argument('--concurrency', type=int, default=50, help="Number of concurrent clients.")
+        parser.add_argument('--requests', type=int, default=1000, help="Total number of requests per URL.")
+        parser.add_argument('--token', help="An auth token, for endpoints requiring authentication.")
+        parser.add_argument(
+            '--client-delay', type=float, default=0,
+            help="Seconds each client takes to send its request, to simulate slow clients.",
+        )
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': 'Token {}'.format(options['token'])} if options['token'] else {}
+
+        print("{:<50} {:>10} {:>8} {:>10} {:>10} {:>10}".format(
+            'url', 'req/s', 'errors', 'p50 ms', 'p99 ms', 'max ms'
+        ))
+        for url in options['urls']:
+            elapsed, latencies, statuses = asyncio.run(run_benchmark(
+                url, headers, options['concurrency'], options['requests'], options['client_delay']
+            ))
+            percentiles = statistics.quantiles(latencies, n=100)
+            print("{:<50} {:>10.1f} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                url,
+                len(latencies) / elapsed,
+                len([status for status in statuses if status >= 400]),
+                1000 * percentiles[49],
+                1000 * percentiles[98],
+                1000 * max(latencies),
+            ))
@@ -0,0 +1,66 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from mattshop.orders.factories import OrderFactory, OrderItemFactory
+from mattshop.orders.models import Order
+from mattshop.orders.serializers import OrderRowSerializer, OrderSerializer
+from mattshop.products.factories import ProductFactory
+from mattshop.products.models import CatalogueEntry
+from mattshop.products.serializers import CatalogueEntryRowSerializer, CatalogueEntrySerializer
+from mattshop.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the time taken to serialize and render a page of the catalogue, and of an order history, with DRF's "
+        "model serializers and JSON renderer against the row serializers and fast JSON renderer, checking their output "
+        "is identical. Its data is created in a transaction which is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20, help="Number of products and orders on each page.")
+        parser.add_argument('--iterations', type=int, default=2000, help="Number of times each page is serialized.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options['page_size'], options['iterations'])
+            transaction.set_rollback(True)
+
+    def benchmark(self, page_size, iterations):
+        user = User.objects.create_user(username='benchmark-serialization')
+        ProductFactory.create_batch(page_size, quantity_in_stock=1)
+        for order in OrderFactory.create_batch(page_size, user=user):
+            OrderItemFactory.create_batch(2, order=order)
+
+        entries = CatalogueEntry.objects.listable().order_by('name', 'product')[:page_size]
+        catalogue_page = list(entries)
+        catalogue_rows = list(CatalogueEntryRowSerializer.select(entries))
+        orders = Order.objects.filter(user=user).order_by('-created_at', '-id')
+        order_page = list(orders.prefetch_related('items'))
+        order_rows = list(OrderRowSerializer.select(orders))
+        order_items = OrderRowSerializer.fetch_items(order_rows)
+
+        cases = [
+            (
+                'catalogue',
+                lambda: JSONRenderer().render(CatalogueEntrySerializer(catalogue_page, many=True).data),
+                lambda: FastJSONRenderer().render(CatalogueEntryRowSerializer(catalogue_rows).data),
+            ),
+            (
+                'order history',
+                lambda: JSONRenderer().render(OrderSerializer(order_page, many=True).data),
+                lambda: FastJSONRenderer().render(OrderRowSerializer(order_rows, items=order_items).data),
+            ),
+        ]
+
+        print("{:<16} {:>18} {:>18} {:>10}".format('page', 'serializer us', 'row serializer us', 'speedup'))
+        for name, serialize, serialize_rows in cases:
+            if serialize() != serialize_rows():
+                raise CommandError("The row serializer's output for the {} differs.".format(name))
+            slow = min(timeit.repeat(serialize, number=iterations, repeat=3)) / iterations
+            fast = min(timeit.repeat(serialize_rows, number=iterations, repeat=3)) / iterations
+            print("{:<16} {:>18.1f} {:>18.1f} {:>9.1f}x".format(name, 1e6 * slow, 1e6 * fast, slow / fast))
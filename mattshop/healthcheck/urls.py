@@ -1,8 +1,10 @@
 from django.urls import path
 
-from mattshop.healthcheck.views import heartbeat
+from mattshop.healthcheck.views import database, heartbeat, metrics
 
 
 urlpatterns = [
     path('heartbeat/', heartbeat, name='heartbeat'),
+    path('database/', database, name='database'),
+    path('metrics/', metrics, name='metrics'),
 ]
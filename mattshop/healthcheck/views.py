@@ -1,7 +1,77 @@
+from django.conf import settings
+from django.db import connection
 from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from mattshop import metrics as request_metrics
+from mattshop.authentication.authentication import token_cache
 
 
 def heartbeat(request):
     """Just a simple view that returns an HTTP response"""
     return HttpResponse()
 
+
+async def heartbeat_async(request):
+    """`heartbeat`, for serving under ASGI without a thread"""
+    return HttpResponse()
+
+
+def connection_stats(connection):
+    """Describes how a database connection is managed, with the pool's statistics if it's pooled."""
+    settings_dict = connection.settings_dict
+    pool = connection.pool if settings_dict['OPTIONS'].get('pool') else None
+    if pool is not None:
+        mode = 'pool'
+    elif settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        mode = 'pgbouncer'
+    elif settings_dict['CONN_MAX_AGE']:
+        mode = 'persistent'
+    else:
+        mode = 'per-request'
+
+    return {
+        'mode': mode,
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+        'conn_health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+        'pool': pool.get_stats() if pool is not None else None,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def database(request):
+    """How this process's database connections are managed, and how busy its pool is - for sizing the pool."""
+    return Response(connection_stats(connection))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """This process's metrics, in Prometheus' text exposition format. Like `database`, it reveals how busy the process
+    and its pool are, so needs a staff user's token - which Prometheus sends as the scrape's `authorization`."""
+    sections = [histogram.expose() for histogram in request_metrics.HISTOGRAMS]
+
+    for name, value in token_cache.stats().items():
+        metric_type = 'gauge' if name == 'size' else 'counter'
+        metric = 'mattshop_auth_token_cache_{}{}'.format(name, '_total' if metric_type == 'counter' else '')
+        sections.append('# TYPE {} {}\n{} {}'.format(metric, metric_type, metric, value))
+
+    if settings.ORDER_GROUP_COMMIT:
+        from mattshop.orders.group_commit import get_order_batcher
+        batch_sizes = request_metrics.Histogram(
+            'mattshop_order_group_commit_batch_size', "Orders placed per group-commit batch.", (),
+            (1, 2, 5, 10, 20, 50, 100),
+        )
+        for size, count in get_order_batcher().stats()['batch_sizes'].items():
+            batch_sizes.observe(size, count=count)
+        sections.append(batch_sizes.expose())
+
+    pool = connection_stats(connection)['pool']
+    for name, value in (pool or {}).items():
+        metric = 'mattshop_db_{}'.format(name)
+        sections.append('# TYPE {} gauge\n{} {}'.format(metric, metric, value))
+
+    return HttpResponse('\n'.join(sections) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,234 @@
+"""Per-request performance metrics.
+
+`MetricsMiddleware` times each request, and through a database execute wrapper, counts its queries and the time spent
+in them - including the time spent in statements which lock rows (`SELECT ... FOR UPDATE` and `UPDATE`), which under
+contention is almost entirely waiting for other transactions' locks - and any deadlocks or serialization failures. Views
+time their own phases with `phase`, e.g. serialization. Code outside of a request can be measured the same way with
+`measure`. Work done for a request on another thread, which doesn't share its context - such as a group-commit batch
+(see `mattshop.orders.group_commit`) - is measured there, and added to the request's metrics with `add_queries`.
+
+Each response carries the timings in a `Server-Timing` header, and they're aggregated, per view, into histograms which
+are served in Prometheus' text format by `/healthcheck/metrics/`. Histograms are held in memory, per process.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import DatabaseError
+
+from mattshop.renderers import FastJSONRenderer
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# postgres error codes counted as conflicts between concurrent transactions
+DEADLOCK_DETECTED = '40P01'
+SERIALIZATION_FAILURE = '40001'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """A Prometheus-style histogram - cumulative counts of observations no greater than each bucket's upper bound, for
+    each set of label values."""
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values, count=1):
+        """Records `count` observations of `value`, against the given label values."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += count
+            series['count'] += count
+            series['sum'] += value * count
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        """Renders the histogram in Prometheus' text exposition format."""
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ['{}="{}"'.format(name, value) for name, value in zip(self.labels, label_values)]
+                for bound, count in zip(self.buckets + ('+Inf',), series['buckets'] + [series['count']]):
+                    bucket_labels = ','.join(labels + ['le="{}"'.format(bound)])
+                    lines.append('{}_bucket{{{}}} {}'.format(self.name, bucket_labels, count))
+                labels = '{{{}}}'.format(','.join(labels)) if labels else ''
+                lines.append('{}_sum{} {}'.format(self.name, labels, series['sum']))
+                lines.append('{}_count{} {}'.format(self.name, labels, series['count']))
+        return '\n'.join(lines)
+
+
+request_duration = Histogram(
+    'mattshop_request_phase_seconds',
+    "Time spent handling requests, by view and phase (total, db, lock_wait, serialization).",
+    ('view', 'phase'),
+    DURATION_BUCKETS,
+)
+request_queries = Histogram(
+    'mattshop_request_db_queries', "Database queries made per request, by view.", ('view',), QUERY_COUNT_BUCKETS
+)
+HISTOGRAMS = [request_duration, request_queries]
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0
+        self.lock_wait = 0
+        self.deadlocks = 0
+        self.serialization_failures = 0
+        self.phases = {}
+
+    def add_queries(self, other):
+        """Adds the database queries measured by another `RequestMetrics` to these."""
+        self.db_queries += other.db_queries
+        self.db_time += other.db_time
+        self.lock_wait += other.lock_wait
+        self.deadlocks += other.deadlocks
+        self.serialization_failures += other.serialization_failures
+
+    def timings(self):
+        """The request's timings so far, in seconds, by phase."""
+        return {
+            'total': time.perf_counter() - self.start,
+            'db': self.db_time,
+            'lock_wait': self.lock_wait,
+            **self.phases,
+        }
+
+
+def current():
+    """The `RequestMetrics` of the request (or `measure` block) being handled, if there is one."""
+    return _current.get()
+
+
+@contextmanager
+def measure():
+    """Gathers the metrics of the enclosed block as those of a request, yielding its `RequestMetrics`."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as part of the named phase of the current request, if there is one."""
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.phases[name] = metrics.phases.get(name, 0) + time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    """A database execute wrapper, adding each query to the current request's metrics.
+
+    This is installed on every connection as it's created (see `HealthcheckConfig`), and uses a context variable to
+    find the current request, so counts queries made from any thread the request runs code in, including the async ORM.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except DatabaseError as e:
+        code = getattr(e.__cause__, 'sqlstate', None)
+        metrics.deadlocks += code == DEADLOCK_DETECTED
+        metrics.serialization_failures += code == SERIALIZATION_FAILURE
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.db_queries += 1
+        metrics.db_time += elapsed
+        if sql.startswith('UPDATE') or 'FOR UPDATE' in sql:
+            metrics.lock_wait += elapsed
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return getattr(match.func, 'view_class', match.func).__name__
+
+
+class MetricsMiddleware:
+    """Records the metrics of each request, adding them to the histograms and the `Server-Timing` response header."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with measure() as metrics:
+            response = self.get_response(request)
+        return self.record(request, response, metrics)
+
+    async def __acall__(self, request):
+        with measure() as metrics:
+            response = await self.get_response(request)
+        return self.record(request, response, metrics)
+
+    def record(self, request, response, metrics):
+        view = view_name(request)
+        timings = metrics.timings()
+        for name, seconds in timings.items():
+            request_duration.observe(seconds, view, name)
+        request_queries.observe(metrics.db_queries, view)
+
+        server_timing = ['{};dur={:.2f}'.format(name, 1000 * seconds) for name, seconds in timings.items()]
+        server_timing.append('queries;desc="{}"'.format(metrics.db_queries))
+        for name in ('deadlocks', 'serialization_failures'):
+            if getattr(metrics, name):
+                server_timing.append('{};desc="{}"'.format(name, getattr(metrics, name)))
+        response['Server-Timing'] = ', '.join(server_timing)
+        return response
+
+
+class TimedJSONRenderer(FastJSONRenderer):
+    """`FastJSONRenderer`, timing rendering as part of the `serialization` phase."""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase('serialization'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedListMixin:
+    """For list views, timing the serialization of each page as part of the `serialization` phase."""
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        with phase('serialization'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
@@ -0,0 +1,249 @@
+"""A concurrency stress test and throughput benchmark for placing orders.
+
+`run_benchmark` has many clients place orders at once, each in its own thread or process with its own database
+connection, either by calling `create_order` directly or through the `/orders/create/` endpoint of a running server. It
+reports throughput, latency, time spent waiting for row locks and conflicts between transactions, and checks that no
+stock was oversold: each product's stock must have fallen by exactly the number of units on its orders.
+
+Two workloads are provided:
+* `hot` - every order is for one unit of a single product, the worst case for contention on a product's row.
+* `spread` - orders are for a few random products out of many, in random quantities. Contention is lower, but
+  orders lock overlapping sets of products, so can deadlock if their locks aren't taken in a consistent order.
+"""
+import http.client
+import json
+import math
+import multiprocessing
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import Sum
+from rest_framework.authtoken.models import Token
+
+from mattshop import metrics
+from mattshop.orders import exceptions
+from mattshop.orders.models import Order, OrderItem
+from mattshop.orders.operations import create_order
+from mattshop.products.models import Product, ProductPrice
+from mattshop.products.operations import refresh_catalogue
+
+
+HOT = 'hot'
+SPREAD = 'spread'
+WORKLOADS = (HOT, SPREAD)
+
+
+class Sample:
+    """The outcome of placing one order."""
+    def __init__(self, latency, units, placed=False, error=False, lock_wait=0, deadlocks=0, serialization_failures=0):
+        self.latency = latency
+        self.units = units
+        self.placed = placed
+        self.error = error
+        self.lock_wait = lock_wait
+        self.deadlocks = deadlocks
+        self.serialization_failures = serialization_failures
+
+
+def _order_contents(workload, rng, product_ids):
+    if workload == HOT:
+        return [{'product_id': product_ids[0], 'quantity': 1}]
+    return [
+        {'product_id': product_id, 'quantity': rng.randint(1, 3)}
+        for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 4)))
+    ]
+
+
+def _place_directly(user, contents, allocation):
+    with metrics.measure() as measured:
+        try:
+            create_order(user, contents, allocation=allocation)
+            placed, error = True, False
+        except exceptions.OrderError:
+            placed, error = False, False
+        except Exception:
+            placed, error = False, True
+    return placed, error, measured
+
+
+def _server_timing(response):
+    timings = {}
+    for metric in filter(None, (response.getheader('Server-Timing') or '').split(', ')):
+        name, _, value = metric.partition(';')
+        timings[name] = float(value.partition('=')[2].strip('"'))
+    return timings
+
+
+def run_client(config, client, user, token):
+    """Places one client's orders, one at a time, returning a `Sample` for each."""
+    rng = random.Random('{}:{}'.format(config['seed'], client))
+    samples = []
+    if config['url']:
+        url = urlsplit(config['url'])
+        http_connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        headers = {'Authorization': 'Token {}'.format(token), 'Content-Type': 'application/json'}
+
+    try:
+        for _ in range(config['orders']):
+            contents = _order_contents(config['workload'], rng, config['product_ids'])
+            units = sum(item['quantity'] for item in contents)
+            start = time.perf_counter()
+            if config['url']:
+                http_connection.request(
+                    'PUT', url.path.rstrip('/') + '/orders/create/', json.dumps({'items': contents}), headers
+                )
+                response = http_connection.getresponse()
+                response.read()
+                latency = time.perf_counter() - start
+                timings = _server_timing(response)
+                samples.append(Sample(
+                    latency,
+                    units,
+                    placed=response.status == 201,
+                    error=response.status >= 500,
+                    lock_wait=timings.get('lock_wait', 0) / 1000,
+                    deadlocks=int(timings.get('deadlocks', 0)),
+                    serialization_failures=int(timings.get('serialization_failures', 0)),
+                ))
+            else:
+                placed, error, measured = _place_directly(user, contents, config['allocation'])
+                samples.append(Sample(
+                    time.perf_counter() - start,
+                    units,
+                    placed=placed,
+                    error=error,
+                    lock_wait=measured.lock_wait,
+                    deadlocks=measured.deadlocks,
+                    serialization_failures=measured.serialization_failures,
+                ))
+    finally:
+        if config['url']:
+            http_connection.close()
+        connection.close()
+    return samples
+
+
+def _run_client(args):
+    return run_client(*args)
+
+
+def _percentile(latencies, percentile):
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0
+    return statistics.quantiles(latencies, n=100, method='inclusive')[percentile - 1]
+
+
+def run_benchmark(
+    workload=HOT, clients=16, orders=50, allocation=None, url=None, processes=False, products=100, stock_ratio=0.5,
+    seed='mattshop',
+):
+    """Runs a benchmark, creating (then deleting) its own users, products and orders.
+
+    Args:
+        workload (str): `HOT` or `SPREAD`.
+        clients (int): Number of concurrent clients.
+        orders (int): Number of orders placed by each client.
+        allocation (str): The stock allocation strategy, when calling `create_order` directly. Defaults to the setting.
+        url (str): Base URL of a server to place orders through, e.g. `http://api:8000`, rather than calling
+            `create_order` directly. It must be using the same database.
+        processes (bool): Run each client in its own process rather than a thread.
+        products (int): Number of products ordered from, for the `SPREAD` workload.
+        stock_ratio (float): Stock given to products, as a proportion of the units clients are expected to order.
+            With less than 1, products sell out part way through.
+        seed (str): Seed for the clients' choices of products and quantities.
+
+    Returns:
+        A dict of the results, which can be serialized as JSON.
+    """
+    products = 1 if workload == HOT else products
+    expected_units = clients * orders * (1 if workload == HOT else 5)
+    stock = max(1, math.ceil(expected_units * stock_ratio / products))
+
+    run_id = time.time_ns()
+    users = [User.objects.create_user(username='benchmark-{}-{}'.format(run_id, i)) for i in range(clients)]
+    tokens = [Token.objects.create(user=user).key for user in users]
+    created_products = Product.objects.bulk_create([
+        Product(name='benchmark-{}-{}'.format(run_id, i), quantity_in_stock=stock) for i in range(products)
+    ])
+    ProductPrice.objects.bulk_create([
+        ProductPrice(product=product, price=1, effective_from=datetime(2020, 1, 1)) for product in created_products
+    ])
+    product_ids = [product.id for product in created_products]
+    refresh_catalogue(product_ids)
+
+    config = {
+        'workload': workload,
+        'orders': orders,
+        'allocation': allocation,
+        'url': url,
+        'seed': seed,
+        'product_ids': product_ids,
+    }
+    client_args = [(config, client, user, token) for client, (user, token) in enumerate(zip(users, tokens))]
+    try:
+        start = time.perf_counter()
+        if processes:
+            # forked processes must each open their own database connection
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(clients) as pool:
+                results = pool.map(_run_client, client_args)
+        else:
+            with ThreadPoolExecutor(clients) as executor:
+                results = list(executor.map(_run_client, client_args))
+        elapsed = time.perf_counter() - start
+
+        samples = [sample for client_samples in results for sample in client_samples]
+        return _results(config, clients, processes, elapsed, samples, stock, product_ids)
+    finally:
+        Order.objects.filter(user__in=users).delete()
+        Product.objects.filter(id__in=product_ids).delete()
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def _results(config, clients, processes, elapsed, samples, stock, product_ids):
+    placed = [sample for sample in samples if sample.placed]
+    latencies = [sample.latency for sample in samples]
+
+    final_stock = sum(
+        product.get_available_stock() for product in Product.objects.with_stock().filter(id__in=product_ids)
+    )
+    sold = OrderItem.objects.filter(product__in=product_ids).aggregate(sold=Sum('quantity'))['sold'] or 0
+    initial_stock = stock * len(product_ids)
+
+    return {
+        'workload': config['workload'],
+        'target': config['url'] or 'create_order',
+        'allocation': config['allocation'],
+        'clients': clients,
+        'processes': processes,
+        'orders_per_client': config['orders'],
+        'elapsed': elapsed,
+        'orders': len(samples),
+        'placed': len(placed),
+        'failed': len(samples) - len(placed),
+        'errors': len([sample for sample in samples if sample.error]),
+        'orders_per_second': len(placed) / elapsed,
+        'latency_ms': {
+            'mean': 1000 * statistics.mean(latencies),
+            'p50': 1000 * _percentile(latencies, 50),
+            'p99': 1000 * _percentile(latencies, 99),
+            'max': 1000 * max(latencies),
+        },
+        'mean_lock_wait_ms': 1000 * statistics.mean(sample.lock_wait for sample in samples),
+        'deadlocks': sum(sample.deadlocks for sample in samples),
+        'serialization_failures': sum(sample.serialization_failures for sample in samples),
+        'stock': {
+            'initial': initial_stock,
+            'final': final_stock,
+            'sold': sold,
+            'consistent': final_stock >= 0 and initial_stock - final_stock == sold == sum(
+                sample.units for sample in placed
+            ),
+        },
+    }
@@ -4,4 +4,8 @@ class OrderError(Exception):
 
 class OutOfStockOrderError(OrderError):
     """Raised when an order fails due to an item being out of stock."""
-    pass
\ No newline at end of file
+    pass
+
+class UnpricedProductOrderError(OrderError):
+    """Raised when an order fails due to an item having no currently-effective price."""
+    pass
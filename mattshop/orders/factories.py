@@ -9,8 +9,10 @@ from mattshop.products.factories import ProductFactory
 
 class OrderItemFactory(DjangoModelFactory):
     product = factory.SubFactory(ProductFactory)
+    product_name = factory.SelfAttribute('product.name')
     product_price = factory.Faker("pydecimal", min_value=0.01, max_value=1000, right_digits=2)
     quantity = factory.Faker('random_int')
+    created_at = factory.SelfAttribute('order.created_at')
 
     class Meta:
         model = OrderItem
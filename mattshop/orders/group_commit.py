@@ -0,0 +1,150 @@
+"""Group commit for orders.
+
+Each order placed normally is its own transaction, taking its own locks and paying for its own commit. Under high
+concurrency, that overhead grows in step with the rate of orders. With `ORDER_GROUP_COMMIT` enabled, `create_order`
+instead hands orders to an `OrderBatcher` - a background thread which gathers together orders arriving within a short
+window (`ORDER_GROUP_COMMIT_WINDOW` seconds, up to `ORDER_GROUP_COMMIT_MAX_BATCH_SIZE` orders), and places them all in
+a single transaction with `place_orders`. Each caller still gets the result of its own order, and the batch's
+database queries are added to each caller's request metrics, as the time its order spent in the database.
+
+Batches are gathered per process, so this pays off when each process handles many requests at once (e.g. uwsgi with
+`--threads`).
+
+Each statement in a batch's transaction is limited to `ORDER_GROUP_COMMIT_STATEMENT_TIMEOUT` seconds, so one stuck
+batch can't hold up those queued behind it indefinitely, and callers give up waiting for their order after
+`result_timeout` seconds. Should placing a batch fail in any other way, its orders fail with the error, and the
+batcher carries on with the next batch.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from mattshop import metrics as request_metrics
+from mattshop.orders.operations import place_orders
+
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBatcher:
+    def __init__(self, max_batch_size, window):
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.batch_sizes = Counter()
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, user, order_contents):
+        """Queues an order to be placed in the next batch.
+
+        Returns:
+            A `Future`, resolving to the newly-created order or raising the `OrderError` the order failed with.
+        """
+        future = Future()
+        self._ensure_running()
+        self._queue.put((user, order_contents, future, request_metrics.current()))
+        return future
+
+    def stats(self):
+        """Returns the number of batches placed, and orders placed in them, plus a count of batches by size."""
+        batch_sizes = dict(self.batch_sizes)
+        return {
+            'batches': sum(batch_sizes.values()),
+            'orders': sum(size * count for size, count in batch_sizes.items()),
+            'batch_sizes': batch_sizes,
+        }
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='order-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                close_old_connections()
+                self.place_batch(batch)
+                close_old_connections()
+            except Exception as e:
+                # anything escaping `place_batch` would otherwise end this thread, leaving its callers waiting
+                logger.exception("Failed placing batch of %s orders", len(batch))
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _next_batch(self):
+        """Waits for an order, then gathers any more which arrive within the window, up to the maximum batch size."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def place_batch(self, batch):
+        """Places a batch of (user, order_contents, future, metrics) orders in one transaction, resolving their futures.
+
+        An order which fails, however unexpectedly, fails only its own future (see `place_orders`). Only an error
+        failing the whole transaction, such as losing the database connection, is set on every future in the batch.
+
+        The batch's queries run on this thread, outside of the requests which submitted its orders, so are measured
+        here and added to each of their `RequestMetrics` (where given) before their futures resolve. Each request
+        waited on the whole batch, so is attributed all of its queries.
+        """
+        self.batch_sizes[len(batch)] += 1
+        logger.debug("Placing batch of %s orders", len(batch))
+        with request_metrics.measure() as batch_metrics:
+            try:
+                results = place_orders(
+                    [(user, order_contents) for user, order_contents, _, _ in batch],
+                    statement_timeout=settings.ORDER_GROUP_COMMIT_STATEMENT_TIMEOUT,
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+        for _, _, _, metrics in batch:
+            if metrics is not None:
+                metrics.add_queries(batch_metrics)
+
+        for (_, _, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def result_timeout():
+    """How long (in seconds) a caller waits for its order to be placed - time for the batch ahead of it, then its own,
+    each gathered within the window, and retried up to `ORDER_RETRY_ATTEMPTS` times."""
+    attempt = settings.ORDER_GROUP_COMMIT_WINDOW + settings.ORDER_GROUP_COMMIT_STATEMENT_TIMEOUT
+    return 2 * settings.ORDER_RETRY_ATTEMPTS * attempt
+
+
+_order_batcher = None
+_order_batcher_lock = threading.Lock()
+
+
+def get_order_batcher():
+    """Returns this process's `OrderBatcher`, creating it if need be."""
+    global _order_batcher
+    with _order_batcher_lock:
+        if _order_batcher is None:
+            _order_batcher = OrderBatcher(
+                max_batch_size=settings.ORDER_GROUP_COMMIT_MAX_BATCH_SIZE,
+                window=settings.ORDER_GROUP_COMMIT_WINDOW,
+            )
+        return _order_batcher
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mattshop.orders.partitions import archivable_months, archive_partition, month_start, partition_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Archives each month of orders older than ORDER_ARCHIVE_AFTER_MONTHS to a gzipped NDJSON file, then drops its "
+        "partitions. Run periodically, off-peak - dropping a month briefly locks the order tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month', type=lambda value: month_start(datetime.strptime(value, '%Y-%m')),
+            help="Archive only this month (YYYY-MM), however recent, as long as it's over.",
+        )
+        parser.add_argument('--directory', help="Directory to write archives to. Defaults to ORDER_ARCHIVE_DIR.")
+
+    def handle(self, *args, **options):
+        if options['month']:
+            if options['month'] not in partition_months():
+                raise CommandError("No order partition for {:%Y-%m}.".format(options['month']))
+            if options['month'] >= month_start(datetime.now()):
+                raise CommandError("Orders can only be archived once their month is over.")
+            months = [options['month']]
+        else:
+            months = archivable_months()
+
+        for month in months:
+            archive = archive_partition(month, options['directory'])
+            print("Archived {} orders from {:%Y-%m} to {}.".format(archive.order_count, month, archive.path))
+        print("Archived {} months.".format(len(months)))
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mattshop.orders.benchmark import WORKLOADS, run_benchmark
+from mattshop.orders.operations import OPTIMISTIC, PESSIMISTIC
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress tests placing orders with many concurrent clients, reporting throughput, latency, lock wait and "
+        "conflicts, and failing if any stock was oversold. Run against a disposable database - it creates (then "
+        "deletes) its own users, products and orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workload', nargs='+', choices=WORKLOADS, default=list(WORKLOADS), help="Workloads to run."
+        )
+        parser.add_argument(
+            '--allocation', nargs='+', choices=[PESSIMISTIC, OPTIMISTIC], default=[None],
+            help="Stock allocation strategies to compare. Defaults to the ORDER_STOCK_ALLOCATION setting.",
+        )
+        parser.add_argument('--clients', type=int, default=16, help="Number of concurrent clients.")
+        parser.add_argument('--orders', type=int, default=50, help="Number of orders placed by each client.")
+        parser.add_argument('--processes', action='store_true', help="Run each client in a process, not a thread.")
+        parser.add_argument(
+            '--url', help="Place orders through this server's API (e.g. http://api:8000), rather than directly."
+        )
+        parser.add_argument('--products', type=int, default=100, help="Number of products in the spread workload.")
+        parser.add_argument(
+            '--stock-ratio', type=float, default=0.5,
+            help="Stock given to products, as a proportion of the units expected to be ordered.",
+        )
+        parser.add_argument('--seed', default='mattshop', help="Seed for clients' choices of products.")
+        parser.add_argument('--output', help="File to write the results to, as JSON.")
+
+    def handle(self, *args, **options):
+        if options['url'] and options['allocation'] != [None]:
+            raise CommandError("--allocation can't be set when ordering through --url - it's the server's setting.")
+
+        started_at = datetime.now()
+        print("{:<10} {:<12} {:>10} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+            'workload', 'allocation', 'orders/s', 'failed', 'errors', 'p50 ms', 'p99 ms', 'lock ms', 'deadlocks',
+            'ser. fails',
+        ))
+        runs = []
+        for workload in options['workload']:
+            for allocation in options['allocation']:
+                result = run_benchmark(
+                    workload=workload,
+                    clients=options['clients'],
+                    orders=options['orders'],
+                    allocation=allocation,
+                    url=options['url'],
+                    processes=options['processes'],
+                    products=options['products'],
+                    stock_ratio=options['stock_ratio'],
+                    seed=options['seed'],
+                )
+                runs.append(result)
+                print("{:<10} {:<12} {:>10.1f} {:>8} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10} {:>12}".format(
+                    workload,
+                    allocation or 'default',
+                    result['orders_per_second'],
+                    result['failed'],
+                    result['errors'],
+                    result['latency_ms']['p50'],
+                    result['latency_ms']['p99'],
+                    result['mean_lock_wait_ms'],
+                    result['deadlocks'],
+                    result['serialization_failures'],
+                ))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'started_at': started_at.isoformat(), 'runs': runs}, f, indent=2)
+
+        oversold = [run for run in runs if not run['stock']['consistent']]
+        if oversold:
+            raise CommandError("Stock was inconsistent after: {}".format(
+                ', '.join('{} ({})'.format(run['workload'], run['stock']) for run in oversold)
+            ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from mattshop.orders.partitions import ensure_future_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly order partitions up to ORDER_PARTITION_MONTHS_AHEAD months ahead, moving in any orders "
+        "from the default partition. Run periodically."
+    )
+
+    def handle(self, *args, **options):
+        months = ensure_future_partitions()
+        print("Created order partitions for {} months.".format(len(months)))
+        for month in months:
+            print("  {:%Y-%m}".format(month))
@@ -0,0 +1,45 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mattshop.orders.operations import process_pending_orders
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Places orders submitted asynchronously, in batches. Any number of these workers can be run at once, across "
+        "processes and hosts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Maximum number of orders placed per batch.")
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help="Seconds to wait before checking again, when none are pending.",
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once there are no pending orders left.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                processed = process_pending_orders(options['batch_size'])
+            except Exception:
+                # the batch is left pending, to be retried - the worker carries on, rather than leaving the queue
+                # unprocessed until it's restarted
+                if options['once']:
+                    raise
+                logger.exception("Failed to process a batch of pending orders")
+                time.sleep(options['poll_interval'])
+                continue
+            if processed:
+                print("Processed {} pending orders.".format(processed))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
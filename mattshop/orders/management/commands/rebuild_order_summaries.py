@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mattshop.orders.summaries import rebuild_order_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every user's order summary from their orders, e.g. to backfill summaries or repair them after "
+        "orders are deleted. Safe to run while orders are being placed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Number of user ids rebuilt per transaction.")
+        parser.add_argument('--workers', type=int, default=1, help="Number of processes to rebuild in.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = rebuild_order_summaries(chunk_size=options['chunk_size'], workers=options['workers'])
+        print("Rebuilt order summaries of {} users in {:.1f}s.".format(users, time.perf_counter() - start))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_product_names(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    OrderItem.objects.update(
+        product_name=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('name')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_user_created_idx'),
+        ('products', '0003_catalogueentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_product_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,149 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from datetime import date, datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# the tables partitioned by `created_at` month, in an order in which they can be copied - items reference orders
+PARTITIONED_TABLES = ['orders_order', 'orders_orderitem']
+# future months given partitions up front - after this, `create_order_partitions` creates them
+MONTHS_AHEAD = 3
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_table(cursor, table, months):
+    """Replaces a table with one range-partitioned by `created_at`, with a partition for each of `months` (named as in
+    `mattshop.orders.partitions`) and a default partition for anything outside them, then copies its rows across."""
+    old_table = '{}_unpartitioned'.format(table)
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname != %s",
+        [table, '{}_pkey'.format(table)],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, old_table))
+    # index names are unique across the schema, so the old table's are dropped to make way for the new table's
+    cursor.execute('ALTER TABLE {} DROP CONSTRAINT {}_pkey'.format(old_table, table))
+    for name, _ in indexes:
+        cursor.execute('DROP INDEX {}'.format(name))
+
+    cursor.execute(
+        'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+        'PARTITION BY RANGE (created_at)'.format(table, old_table)
+    )
+    for month in months:
+        cursor.execute(
+            "CREATE TABLE {}_p{:%Y_%m} PARTITION OF {} FOR VALUES FROM ('{}') TO ('{}')".format(
+                table, month, table, month, _next_month(month)
+            )
+        )
+    cursor.execute('CREATE TABLE {0}_default PARTITION OF {0} DEFAULT'.format(table))
+
+    cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(table, old_table))
+    cursor.execute(
+        "SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {}".format(
+            table
+        ),
+        [table],
+    )
+    cursor.execute('DROP TABLE {}'.format(old_table))
+    # the new table's sequence was named around the old one's
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    cursor.execute('ALTER SEQUENCE {} RENAME TO {}_id_seq'.format(cursor.fetchone()[0], table))
+
+    # a partitioned table's primary key must include its partition key
+    cursor.execute('ALTER TABLE {0} ADD CONSTRAINT {0}_pkey PRIMARY KEY (id, created_at)'.format(table))
+    for _, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(table, name, definition))
+
+
+def partition_tables(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(created_at) FROM orders_order')
+        first = (cursor.fetchone()[0] or datetime.now()).date().replace(day=1)
+        last = datetime.now().date().replace(day=1)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        months = [first]
+        while months[-1] < last:
+            months.append(_next_month(months[-1]))
+
+        for table in PARTITIONED_TABLES:
+            _partition_table(cursor, table, months)
+        cursor.execute(
+            'ALTER TABLE orders_orderitem ADD CONSTRAINT orderitem_order_fk FOREIGN KEY (order_id, created_at) '
+            'REFERENCES orders_order (id, created_at) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_alter_order_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('path', models.CharField(max_length=255)),
+                ('order_count', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ordersummary',
+            name='archived_last_order_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ordersummary',
+            name='archived_order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordersummary',
+            name='archived_total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=100),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='pendingorder',
+            name='order',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='orders.order'),
+        ),
+        migrations.RunSQL(
+            'UPDATE orders_orderitem SET created_at = orders_order.created_at FROM orders_order '
+            'WHERE orders_order.id = orders_orderitem.order_id',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.RunPython(partition_tables),
+    ]
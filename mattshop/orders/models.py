@@ -5,15 +5,79 @@ from mattshop.products.models import Product
 
 
 class Order(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    """An order placed by a user.
+
+    Orders and their items are stored in tables range-partitioned by `created_at` month, so that old months can be
+    archived and dropped without touching recent ones - see `mattshop.orders.partitions`. The partitioned tables'
+    primary keys are `(id, created_at)`, as they must include the partition key, but ids remain unique.
+    """
+    # indexed by `order_user_created_idx`, which leads with the user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     total_price = models.DecimalField(max_digits=100, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # supports order history, filtered by user and keyset-paginated on (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # enforced by the `orderitem_order_fk` constraint on `(order_id, created_at)`, as a foreign key to a partitioned
+    # table must reference its whole primary key
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=100)
     product_price = models.DecimalField(max_digits=100, decimal_places=2)
-    quantity = models.PositiveIntegerField(default=1)
\ No newline at end of file
+    quantity = models.PositiveIntegerField(default=1)
+    # the order's, by which items are partitioned alongside their orders
+    created_at = models.DateTimeField()
+
+
+class OrderSummary(models.Model):
+    """Totals of a user's orders, maintained as orders are placed - see `mattshop.orders.summaries`."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='order_summary')
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=100, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True)
+    # the part of the totals from orders which have since been archived, so they're kept when summaries are rebuilt
+    archived_order_count = models.PositiveIntegerField(default=0)
+    archived_total_spent = models.DecimalField(max_digits=100, decimal_places=2, default=0)
+    archived_last_order_at = models.DateTimeField(null=True)
+
+
+class OrderArchive(models.Model):
+    """A month of orders which has been archived to a file, and dropped from the database."""
+    month = models.DateField(unique=True)
+    path = models.CharField(max_length=255)
+    order_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class PendingOrder(models.Model):
+    """An order submitted asynchronously, waiting to be placed by the `process_pending_orders` worker."""
+    PENDING = 'pending'
+    PLACED = 'placed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PLACED, 'Placed'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    contents = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # without a database constraint, as for `OrderItem.order`. Cleared when the order is archived
+    order = models.OneToOneField(Order, null=True, blank=True, on_delete=models.SET_NULL, db_constraint=False)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # covers only the queue of orders still to be placed, which workers take from in id order
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='pending_order_queue_idx'),
+        ]
@@ -1,59 +1,404 @@
-from django.db import transaction
+import logging
+import random
+import time
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, F, Q, When
 
 from mattshop.orders import exceptions
-from mattshop.orders.models import Order, OrderItem
+from mattshop.orders.models import Order, OrderItem, PendingOrder
+from mattshop.orders.summaries import record_orders
 from mattshop.products.models import Product
+from mattshop.products.operations import adjust_catalogue_stock, allocate_sharded_stock
+from mattshop.routers import pin_to_primary
+
+
+logger = logging.getLogger(__name__)
 
+PESSIMISTIC = 'pessimistic'
+OPTIMISTIC = 'optimistic'
 
-def create_order(user, order_contents):
+# postgres error codes for transactions which failed only because of concurrent transactions, and can be retried
+RETRYABLE_ERROR_CODES = {
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+}
+
+
+def create_order(user, order_contents, allocation=None):
     """Creates an order with given content.
 
     Args:
         user (User): User who created the order.
         order_contents (list): The contents of a desired order from the given user. A list of dicts
             with keys 'product_id' and 'quantity'.
+        allocation (str): The stock allocation strategy to use, `PESSIMISTIC` or `OPTIMISTIC`. Defaults to the
+            `ORDER_STOCK_ALLOCATION` setting.
 
     Returns:
         The instance of the newly-created order.
 
-    The tricky part of this task is ensuring the stock deduction happens atomically with the order creation.
+    The tricky part of this task is ensuring the stock deduction happens atomically with the order creation. There are
+    two strategies for this:
+
+    * Pessimistic (the default) - see `_place_order_pessimistic`. Products are locked before their stock is checked.
+    * Optimistic - see `_place_order_optimistic`. Stock is deducted only where enough remains, in a single conditional
+      update, without locking the products first.
+
+    Either way, the transaction makes a fixed number of queries however many items are in the order, including one to
+    add the order to the user's `OrderSummary`. Transactions failing due to a deadlock or serialization failure are
+    retried, up to `ORDER_RETRY_ATTEMPTS` times in total.
+
+    With `ORDER_GROUP_COMMIT` enabled, the order is instead handed to a background thread, which places it in a single
+    transaction together with any other orders made concurrently in this process - see
+    `mattshop.orders.group_commit`. This doesn't apply within an existing transaction, which the background thread
+    wouldn't be a part of.
+    """
+    if settings.ORDER_GROUP_COMMIT and allocation is None and not connection.in_atomic_block:
+        from mattshop.orders.group_commit import get_order_batcher, result_timeout
+        return get_order_batcher().submit(user, order_contents).result(timeout=result_timeout())
+
+    quantities = _get_quantities(order_contents)
+    place_order = _get_place_order(allocation)
+
+    def place():
+        with transaction.atomic():
+            order = place_order(user, quantities)
+            record_orders([order])
+        return order
+
+    return _retrying(place)
+
+
+def place_orders(order_requests, all_or_nothing=False, allocation=None, statement_timeout=None):
+    """Places several orders in a single transaction.
+
+    Args:
+        order_requests (list): The orders to place, as a list of (user, order_contents) tuples - see `create_order`.
+        all_or_nothing (bool): Whether to place none of the orders if any of them fail. Otherwise, each order is placed
+            in its own savepoint, and those which fail don't affect the rest.
+        allocation (str): The stock allocation strategy to use - see `create_order`.
+        statement_timeout (float): The most seconds any one statement of the transaction may take (e.g. waiting for a
+            lock) before it's cancelled. No limit beyond the database's own if not given.
+
+    Returns:
+        A list with a result for each of `order_requests`, in the same order - either the newly-created order, or the
+        `OrderError` that it failed with. An unexpected error placing one order (other than a deadlock or serialization
+        failure, which are retried) is logged, and that order fails with an `OrderError`.
+
+    With the pessimistic strategy, every product in the batch is locked up front, in primary key order, so batches
+    can't deadlock with one another. For the same reason, the users' order summaries are updated once for the whole
+    batch, in user id order. Committing many orders at once means paying for one commit (and fsync) rather than one
+    per order.
+    """
+    place_order = _get_place_order(allocation)
+
+    def place_all():
+        results = [None] * len(order_requests)
+        with transaction.atomic():
+            if statement_timeout is not None:
+                with connection.cursor() as cursor:
+                    # `SET LOCAL`, which can't take a bound parameter
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [
+                        '{}ms'.format(int(statement_timeout * 1000))
+                    ])
+            if place_order is _place_order_pessimistic:
+                product_ids = {
+                    order_item['product_id'] for _, order_contents in order_requests for order_item in order_contents
+                }
+                list(Product.objects.select_for_update().filter(
+                    id__in=product_ids, sharded_stock=False
+                ).order_by('id').values_list('id', flat=True))
+
+            for i, (user, order_contents) in enumerate(order_requests):
+                try:
+                    results[i] = place_order(user, _get_quantities(order_contents))
+                except exceptions.OrderError as e:
+                    results[i] = e
+                except Exception as e:
+                    if isinstance(e, OperationalError) and _is_retryable(e):
+                        raise
+                    # rolled back to the order's savepoint, so fails only this order rather than the whole batch
+                    logger.exception("Unexpected error placing order for user %s", user.id)
+                    results[i] = exceptions.OrderError("Order could not be placed")
+                if all_or_nothing and isinstance(results[i], exceptions.OrderError):
+                    transaction.set_rollback(True)
+                    break
+
+            failed = any(isinstance(result, exceptions.OrderError) for result in results)
+            if not (all_or_nothing and failed):
+                record_orders([result for result in results if not isinstance(result, exceptions.OrderError)])
+
+        if all_or_nothing and failed:
+            return [
+                result if isinstance(result, exceptions.OrderError)
+                else exceptions.OrderError("Not placed, as another order in the batch failed")
+                for result in results
+            ]
+        return results
+
+    return _retrying(place_all)
+
+
+def submit_order(user, order_contents):
+    """Accepts an order to be placed later, by `process_pending_orders`.
+
+    Args:
+        user (User): User who created the order.
+        order_contents (list): The contents of the order - see `create_order`.
+
+    Returns:
+        The newly-created `PendingOrder`.
+    """
+    return PendingOrder.objects.create(user=user, contents=order_contents)
+
+
+def process_pending_orders(batch_size):
+    """Places a batch of pending orders, in the order they were submitted.
+
+    The batch is claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so any number of workers can run this concurrently
+    - each claims a different batch, rather than waiting on one another. The orders are placed with `place_orders`, and
+    their outcomes recorded, in the same transaction as they were claimed in. So if a worker dies part-way through, the
+    whole batch is left pending for another worker to pick up.
+
+    Args:
+        batch_size (int): The maximum number of pending orders to place.
+
+    Returns:
+        The number of pending orders processed.
+    """
+    with transaction.atomic():
+        pending_orders = list(
+            PendingOrder.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                status=PendingOrder.PENDING
+            ).select_related('user').order_by('id')[:batch_size]
+        )
+        if not pending_orders:
+            return 0
+
+        results = place_orders([(pending_order.user, pending_order.contents) for pending_order in pending_orders])
+
+        processed_at = datetime.now()
+        for pending_order, result in zip(pending_orders, results):
+            if isinstance(result, exceptions.OrderError):
+                pending_order.status = PendingOrder.FAILED
+                pending_order.message = str(result)
+            else:
+                pending_order.status = PendingOrder.PLACED
+                pending_order.order = result
+            pending_order.processed_at = processed_at
+        PendingOrder.objects.bulk_update(pending_orders, ['status', 'order', 'message', 'processed_at'])
+
+    return len(pending_orders)
+
+
+def _get_quantities(order_contents):
+    """Maps each product ID in an order's contents to the quantity ordered."""
+    quantities = {order_item['product_id']: order_item['quantity'] for order_item in order_contents}
+    if len(quantities) != len(order_contents):
+        raise exceptions.OrderError("Duplicate product specified in the same order")
+    # validated by `CreateOrderItemSerializer`, but pending orders may have been submitted before it checked them
+    if any(quantity < 1 for quantity in quantities.values()):
+        raise exceptions.OrderError("Quantities must be at least 1")
+    return quantities
+
+
+def _get_place_order(allocation):
+    return {
+        PESSIMISTIC: _place_order_pessimistic,
+        OPTIMISTIC: _place_order_optimistic,
+    }[allocation or settings.ORDER_STOCK_ALLOCATION]
+
+
+def _retrying(place):
+    """Calls `place`, retrying it if it fails due to a deadlock or serialization failure."""
+    for attempt in range(settings.ORDER_RETRY_ATTEMPTS):
+        try:
+            return place()
+        except OperationalError as e:
+            if not _is_retryable(e) or attempt + 1 == settings.ORDER_RETRY_ATTEMPTS:
+                raise
+            # back off for a random, exponentially-increasing time, so that retrying transactions don't collide again
+            time.sleep(random.uniform(0, settings.ORDER_RETRY_BACKOFF * 2 ** attempt))
+
+
+def _is_retryable(error):
+    cause = error.__cause__
+    return (getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)) in RETRYABLE_ERROR_CODES
+
+
+def _place_order_pessimistic(user, quantities):
+    """Places an order, first locking its products.
+
     We must ensure that when we check that we have adequate stock to fulfil this order, that further orders for these
     products are blocked until the order has been created, and the stock items have been deducted from the product.
     We do this with django's `select_for_update` queryset method (which maps to a DB row-level locking capability).
     Without this row-level lock, it might be possible for two concurrently-placed orders for the same product to result
     in the same stock being allocated to two separate orders, and an impossible negative stock level being recorded.
+
+    Because those locks block other orders until this transaction commits, the transaction makes a fixed number of
+    queries however many items are in the order: one to lock and read the products (with their prices), one to insert
+    the order, one to insert all of its items, one to deduct all of the stock, and one to adjust the products' catalogue
+    entries to match.
+
+    Products with sharded stock aren't locked here, as that would defeat the point of sharding them - they are read by
+    one further query, and their stock is allocated from their shards (see `_allocate_sharded_stock`).
     """
-    products = Product.objects.select_for_update().filter(
-        id__in=[order_item['product_id'] for order_item in order_contents]
-    )
     with transaction.atomic():
+        # rows are locked in primary key order, so that concurrent orders for overlapping sets of products always
+        # take their locks in the same order, and can't deadlock
+        products = {
+            product.id: product for product in Product.objects.select_for_update().with_current_price().filter(
+                id__in=quantities.keys(), sharded_stock=False
+            ).order_by('id')
+        }
+        products.update(Product.objects.with_current_price().filter(sharded_stock=True).in_bulk(quantities.keys()))
+        _check_products(products, quantities)
+        unsharded_quantities = _unsharded(products, quantities)
 
         # check stock matches order requirements
-        for order_item_request in order_contents:
-            product = products.get(id=order_item_request['product_id'])
-            if order_item_request['quantity'] > product.quantity_in_stock:
+        for product_id, quantity in unsharded_quantities.items():
+            product = products[product_id]
+            if quantity > product.quantity_in_stock:
                 raise exceptions.OutOfStockOrderError(
                     "Insufficient stock level of {} ({}): requested {}, have {}".format(
-                        product.name, product.id, order_item_request['quantity'], product.quantity_in_stock
+                        product.name, product.id, quantity, product.quantity_in_stock
                     )
                 )
 
-        # make the order
-        order = Order.objects.create(user=user, total_price=0)
-        for order_item_request in order_contents:
-            product = products.get(id=order_item_request['product_id'])
-            order_item = OrderItem.objects.create(
-                order=order,
-                product=product,
-                product_price=product.get_current_price(),
-                quantity=order_item_request['quantity']
+        order = _create_order_records(user, products, quantities)
+
+        # deduct stock levels from products
+        if unsharded_quantities:
+            Product.objects.filter(id__in=unsharded_quantities.keys()).update(
+                quantity_in_stock=_stock_deduction(unsharded_quantities)
+            )
+        _allocate_sharded_stock(products, quantities)
+        _adjust_catalogue(quantities)
+        _on_commit_pin_to_primary(user)
+
+    return order
+
+
+def _place_order_optimistic(user, quantities):
+    """Places an order without locking its products up front.
+
+    The order is written first, then stock is deducted with a single update conditional on enough stock remaining
+    (`quantity_in_stock >= requested`) for each product. If fewer rows are updated than there are products in the
+    order, something ran out of stock in the meantime, and the whole order is rolled back.
+
+    The products' rows are only locked by that final update, so are held for the time it takes to commit rather than
+    for the whole order insert - concurrent buyers of the same product spend much less time waiting on one another.
+
+    Products with sharded stock have their stock allocated from their shards (see `_allocate_sharded_stock`).
+    """
+    with transaction.atomic():
+        products = Product.objects.with_current_price().in_bulk(quantities.keys())
+        _check_products(products, quantities)
+        unsharded_quantities = _unsharded(products, quantities)
+
+        order = _create_order_records(user, products, quantities)
+
+        # deduct stock levels from products, where there's enough stock to do so
+        if unsharded_quantities:
+            in_stock = reduce(or_, [
+                Q(id=product_id, quantity_in_stock__gte=quantity)
+                for product_id, quantity in unsharded_quantities.items()
+            ])
+            updated = Product.objects.filter(in_stock).update(
+                quantity_in_stock=_stock_deduction(unsharded_quantities)
             )
-        order.total_price = sum(item.product_price * item.quantity for item in order.items.all())
-        order.save()
+            if updated != len(unsharded_quantities):
+                raise exceptions.OutOfStockOrderError(
+                    "Insufficient stock level of one or more of products {}".format(
+                        sorted(unsharded_quantities.keys())
+                    )
+                )
+        _allocate_sharded_stock(products, quantities)
+        _adjust_catalogue(quantities)
+        _on_commit_pin_to_primary(user)
+
+    return order
+
+
+def _check_products(products, quantities):
+    """Checks every product being ordered exists, and can be sold."""
+    unknown_product_ids = quantities.keys() - products.keys()
+    if unknown_product_ids:
+        raise exceptions.OrderError("Unknown product(s) {}".format(sorted(unknown_product_ids)))
+
+    for product_id in quantities:
+        product = products[product_id]
+        if product.current_price is None:
+            raise exceptions.UnpricedProductOrderError(
+                "No current price for {} ({})".format(product.name, product.id)
+            )
+
+
+def _unsharded(products, quantities):
+    """Filters order quantities down to those for products without sharded stock."""
+    return {
+        product_id: quantity for product_id, quantity in quantities.items() if not products[product_id].sharded_stock
+    }
+
+
+def _allocate_sharded_stock(products, quantities):
+    """Deducts stock for the products with sharded stock in an order, from their stock shards.
+
+    Products are allocated in primary key order, whatever order they were ordered in, so that concurrent orders for
+    overlapping sets of products lock their shards in the same order, and can't deadlock.
+    """
+    for product_id, quantity in sorted(quantities.items()):
+        product = products[product_id]
+        if product.sharded_stock and not allocate_sharded_stock(product_id, quantity):
+            raise exceptions.OutOfStockOrderError(
+                "Insufficient stock level of {} ({}): requested {}".format(product.name, product.id, quantity)
+            )
+
+
+def _create_order_records(user, products, quantities):
+    """Inserts an order and its items, with two queries."""
+    order_items = [
+        OrderItem(
+            product=products[product_id],
+            product_name=products[product_id].name,
+            product_price=products[product_id].current_price,
+            quantity=quantity,
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    order = Order.objects.create(
+        user=user,
+        total_price=sum(order_item.product_price * order_item.quantity for order_item in order_items)
+    )
+    for order_item in order_items:
+        order_item.order = order
+        order_item.created_at = order.created_at
+    OrderItem.objects.bulk_create(order_items)
+    return order
+
+
+def _stock_deduction(quantities):
+    """An expression deducting the ordered quantity from each product's stock, for use in a single `UPDATE`."""
+    return Case(
+        *[When(id=product_id, then=F('quantity_in_stock') - quantity) for product_id, quantity in quantities.items()],
+        default=F('quantity_in_stock'),
+    )
+
+
+def _adjust_catalogue(quantities):
+    # the catalogue read model is adjusted in the order transaction, once its stock is deducted, so its rows are locked
+    # only until the commit. Adjusting it once committed would race `refresh_catalogue`, which could either read the
+    # deducted stock level before the adjustment deducted it again, or write a level read before the order over it
+    adjust_catalogue_stock({product_id: -quantity for product_id, quantity in quantities.items()})
 
-        # deduct stock levels from product
-        for order_item in order.items.all():
-            order_item.product.quantity_in_stock -= order_item.quantity
-            order_item.product.save()
 
-    return order
\ No newline at end of file
+def _on_commit_pin_to_primary(user):
+    # the user's reads stick to the primary database for a while, so their new order shows up in their order history
+    # even if read replicas haven't caught up yet
+    user_id = user.pk
+    transaction.on_commit(lambda: pin_to_primary(user_id))
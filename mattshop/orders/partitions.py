@@ -0,0 +1,262 @@
+"""Monthly partitions of the order tables, and archival of old months to files.
+
+`Order` and `OrderItem` are stored in tables range-partitioned by `created_at` (see migration 0008), with a partition
+for each month - e.g. `orders_order_p2025_01` and `orders_orderitem_p2025_01` - and a default partition for rows outside
+them. Queries filtered by `created_at`, like a page of order history, only read the partitions they need, and a month of
+orders can be removed by dropping its tables, rather than deleting (and vacuuming away) its rows.
+
+Partitions are created ahead of time by `create_order_partitions`, run periodically. Orders for a month without one
+still succeed, going to the default partition, from which they're moved once their month's partition is created.
+
+Months older than `ORDER_ARCHIVE_AFTER_MONTHS` are archived by `archive_order_partitions` - written to a gzipped NDJSON
+file, recorded as an `OrderArchive`, and dropped. Their users' `OrderSummary` totals are kept, and their orders can
+still be read from the file with `read_archive`.
+"""
+import gzip
+import os
+import re
+from datetime import date, datetime
+
+import orjson
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+
+from mattshop.orders.models import Order, OrderArchive, OrderItem, OrderSummary, PendingOrder
+from mattshop.orders.serializers import OrderRowSerializer
+from mattshop.pagination import KeysetPagination
+
+
+# partitioned alike, in an order in which rows can be written - items reference orders
+PARTITIONED_MODELS = (Order, OrderItem)
+ARCHIVE_PAGE_SIZE = 2000
+
+partition_name_re = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+class ArchiveChanged(Exception):
+    pass
+
+
+class ArchivePagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def months_between(first, last):
+    """The months from the one containing `first` to the one containing `last`, inclusive."""
+    month, last = month_start(first), month_start(last)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_name(model, month):
+    return '{}_p{:%Y_%m}'.format(model._meta.db_table, month)
+
+
+def default_partition_name(model):
+    return '{}_default'.format(model._meta.db_table)
+
+
+def partition_months(model=Order):
+    """The months which have a partition of the model's table, in order."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class parent ON parent.oid = inhparent '
+            'JOIN pg_class child ON child.oid = inhrelid WHERE parent.relname = %s',
+            [model._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    matches = filter(None, map(partition_name_re.search, names))
+    return sorted(date(int(match[1]), int(match[2]), 1) for match in matches)
+
+
+def _bounds(month):
+    return [month, add_months(month, 1)]
+
+
+def _create_partition(cursor, month):
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM {} WHERE created_at >= %s AND created_at < %s)'.format(
+            default_partition_name(Order)
+        ),
+        _bounds(month),
+    )
+    moving = cursor.fetchone()[0]
+    if moving:
+        # postgres won't create a partition for rows already in the default partition, so the defaults are detached
+        # while they're moved out - items' first, as they reference orders
+        for model in reversed(PARTITIONED_MODELS):
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+                model._meta.db_table, default_partition_name(model)
+            ))
+
+    for model in PARTITIONED_MODELS:
+        cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+            partition_name(model, month), model._meta.db_table,
+        ), _bounds(month))
+
+    if moving:
+        for model in PARTITIONED_MODELS:
+            cursor.execute(
+                'WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                'INSERT INTO {partition} SELECT * FROM moved'.format(
+                    default=default_partition_name(model), partition=partition_name(model, month),
+                ),
+                _bounds(month),
+            )
+        for model in PARTITIONED_MODELS:
+            cursor.execute('ALTER TABLE {} ATTACH PARTITION {} DEFAULT'.format(
+                model._meta.db_table, default_partition_name(model)
+            ))
+
+
+def create_partitions(first, last):
+    """Creates partitions for the months from the one containing `first` to the one containing `last`, where they
+    don't exist already, moving in any of their orders from the default partition.
+
+    Each month is created in its own short transaction, as creating a partition locks the whole table against writes -
+    for longer if orders have to be moved.
+
+    Returns:
+        The months for which partitions were created.
+    """
+    existing = set(partition_months())
+    created = []
+    for month in months_between(first, last):
+        if month in existing:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            _create_partition(cursor, month)
+        created.append(month)
+    return created
+
+
+def ensure_future_partitions():
+    """Creates partitions from the current month to `ORDER_PARTITION_MONTHS_AHEAD` months ahead."""
+    today = datetime.now()
+    return create_partitions(today, add_months(month_start(today), settings.ORDER_PARTITION_MONTHS_AHEAD))
+
+
+def archivable_months():
+    """The months with partitions which are more than `ORDER_ARCHIVE_AFTER_MONTHS` before the current month."""
+    cutoff = add_months(month_start(datetime.now()), -settings.ORDER_ARCHIVE_AFTER_MONTHS)
+    return [month for month in partition_months() if month < cutoff]
+
+
+def archive_path(month, directory=None):
+    return os.path.join(directory or settings.ORDER_ARCHIVE_DIR, 'orders-{:%Y-%m}.ndjson.gz'.format(month))
+
+
+def _month_orders(month):
+    start, end = _bounds(month)
+    return Order.objects.filter(created_at__gte=start, created_at__lt=end)
+
+
+def write_archive(month, path):
+    """Writes a month's orders to a gzipped NDJSON file, one order per line, as `OrderRowSerializer` represents them
+    along with their `user_id`, newest first. The file is written in place only once complete.
+
+    Returns:
+        The number of orders written.
+    """
+    pagination = ArchivePagination()
+    orders = _month_orders(month).order_by(*pagination.ordering).values_list(
+        *OrderRowSerializer.fields, 'user_id', named=True
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = '{}.partial'.format(path)
+    count = 0
+    with gzip.open(partial_path, 'wb') as archive:
+        page = list(orders[:ARCHIVE_PAGE_SIZE])
+        while page:
+            for row, order in zip(page, OrderRowSerializer(page).data):
+                archive.write(orjson.dumps({**order, 'user_id': row.user_id}) + b'\n')
+            count += len(page)
+            page = list(orders.filter(pagination.rows_after([page[-1].created_at, page[-1].id]))[:ARCHIVE_PAGE_SIZE])
+    os.replace(partial_path, path)
+    return count
+
+
+def _archive_summaries(cursor, totals):
+    """Adds archived orders' totals to their users' summaries, as the part of them from archived orders.
+
+    A user without a summary (whose orders haven't been counted) gets one of just their archived orders.
+    """
+    if not totals:
+        return
+    table = OrderSummary._meta.db_table
+    cursor.execute(
+        'INSERT INTO {table} (user_id, order_count, total_spent, last_order_at, archived_order_count, '
+        'archived_total_spent, archived_last_order_at) VALUES {values} '
+        'ON CONFLICT (user_id) DO UPDATE SET '
+        'archived_order_count = {table}.archived_order_count + EXCLUDED.archived_order_count, '
+        'archived_total_spent = {table}.archived_total_spent + EXCLUDED.archived_total_spent, '
+        'archived_last_order_at = GREATEST({table}.archived_last_order_at, EXCLUDED.archived_last_order_at)'.format(
+            table=table, values=', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(totals)),
+        ),
+        [value for user_id, count, spent, last_order_at in totals for value in (
+            user_id, count, spent, last_order_at, count, spent, last_order_at,
+        )],
+    )
+
+
+def archive_partition(month, directory=None):
+    """Archives a month of orders to a file (see `write_archive`), then drops its partitions.
+
+    Once the file is written, the partitions are detached and dropped in a transaction which also keeps the month's
+    totals in its users' summaries, unlinks its orders from any `PendingOrder`, and records the `OrderArchive`.
+    Detaching locks the order tables, so those locks are taken first - before the summaries', in the order placing an
+    order takes them - and held only briefly. If the month's orders changed since the file was written, nothing is
+    dropped.
+
+    Returns:
+        The `OrderArchive`.
+    """
+    path = archive_path(month, directory)
+    count = write_archive(month, path)
+    totals = list(_month_orders(month).order_by('user_id').values('user_id').annotate(
+        count=Count('id'), spent=Sum('total_price'), last_order_at=Max('created_at'),
+    ).values_list('user_id', 'count', 'spent', 'last_order_at'))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in reversed(PARTITIONED_MODELS):
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+                model._meta.db_table, partition_name(model, month)
+            ))
+        cursor.execute('SELECT COUNT(*) FROM {}'.format(partition_name(Order, month)))
+        if cursor.fetchone()[0] != count or sum(total[1] for total in totals) != count:
+            raise ArchiveChanged("Orders for {:%Y-%m} changed while being archived.".format(month))
+
+        _archive_summaries(cursor, totals)
+        cursor.execute(
+            'UPDATE {pending} SET order_id = NULL WHERE order_id IN (SELECT id FROM {orders})'.format(
+                pending=PendingOrder._meta.db_table, orders=partition_name(Order, month),
+            )
+        )
+        for model in reversed(PARTITIONED_MODELS):
+            cursor.execute('DROP TABLE {}'.format(partition_name(model, month)))
+        return OrderArchive.objects.create(month=month, path=path, order_count=count)
+
+
+def read_archive(archive, user_id):
+    """Reads a user's orders from an archived month's file, as they were archived (see `write_archive`).
+
+    The whole month's file is read, so this is only suitable for occasional lookups, e.g. for support.
+    """
+    with gzip.open(archive.path, 'rb') as lines:
+        for line in lines:
+            order = orjson.loads(line)
+            if order.pop('user_id') == user_id:
+                yield order
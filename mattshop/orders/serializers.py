@@ -1,10 +1,11 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from mattshop.orders.models import Order, OrderItem
+from mattshop.orders.models import Order, OrderItem, OrderSummary, PendingOrder
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = serializers.StringRelatedField()
+    product = serializers.CharField(source='product_name')
 
     class Meta:
         model = OrderItem
@@ -17,9 +18,81 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'created_at', 'total_price', 'items']
 
+class OrderRowSerializer:
+    """A fast equivalent of `OrderSerializer`, with the same output.
+
+    It serializes rows selected with `select`, which are named tuples read straight from the database, rather than model
+    instances - see `CatalogueEntryRowSerializer`. The orders' items are read in one further query, as a prefetch would,
+    unless already read with `afetch_items`.
+    """
+    fields = ('id', 'created_at', 'total_price')
+    item_fields = ('order_id', 'product_name', 'product_price', 'quantity')
+
+    def __init__(self, rows, many=True, context=None, items=None):
+        self.rows = rows
+        self.items = self.fetch_items(rows) if items is None else items
+
+    @classmethod
+    def select(cls, queryset):
+        return queryset.values_list(*cls.fields, named=True)
+
+    @classmethod
+    def items_queryset(cls, rows):
+        # items share their orders' `created_at`, so bounding it lets only the partitions holding the page be read
+        created_at = [row.created_at for row in rows]
+        return OrderItem.objects.filter(
+            order__in=[row.id for row in rows], created_at__range=(min(created_at), max(created_at))
+        ).order_by('id').values_list(*cls.item_fields)
+
+    @classmethod
+    def fetch_items(cls, rows):
+        return list(cls.items_queryset(rows)) if rows else []
+
+    @classmethod
+    async def afetch_items(cls, rows):
+        return [item async for item in cls.items_queryset(rows)] if rows else []
+
+    @property
+    def data(self):
+        items = {row.id: [] for row in self.rows}
+        for order_id, product_name, product_price, quantity in self.items:
+            items[order_id].append({
+                'product': product_name,
+                'product_price': "{:.2f}".format(product_price),
+                'quantity': quantity,
+            })
+        return [
+            {
+                'id': row.id,
+                'created_at': _format_datetime(row.created_at),
+                'total_price': "{:.2f}".format(row.total_price),
+                'items': items[row.id],
+            }
+            for row in self.rows
+        ]
+
+def _format_datetime(value):
+    """Formats a datetime as DRF's `DateTimeField` does, in ISO 8601."""
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+class PendingOrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PendingOrder
+        fields = ['id', 'status', 'order_id', 'message', 'created_at', 'processed_at']
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderSummary
+        fields = ['order_count', 'total_spent', 'last_order_at']
+
+
 class CreateOrderItemSerializer(serializers.Serializer):
     product_id = serializers.IntegerField(required=True)
-    quantity = serializers.IntegerField(required=True)
+    quantity = serializers.IntegerField(required=True, min_value=1)
 
 class CreateOrderSerializer(serializers.Serializer):
     """A serializer to manage the validation of incoming order creation requests."""
@@ -36,3 +109,14 @@ class CreateOrderSerializer(serializers.Serializer):
             raise serializers.ValidationError("Duplicate product specified in the same order.")
 
         return data
+
+class BulkCreateOrderSerializer(serializers.Serializer):
+    """A serializer for requests placing many orders at once.
+
+    Each of `orders` is validated separately with `CreateOrderSerializer`, so that one invalid order needn't stop the
+    rest from being placed.
+    """
+    orders = serializers.ListField(
+        child=serializers.JSONField(), allow_empty=False, max_length=settings.ORDER_BULK_MAX_ORDERS
+    )
+    all_or_nothing = serializers.BooleanField(default=False)
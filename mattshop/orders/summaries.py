@@ -0,0 +1,108 @@
+"""Per-user order summaries - each user's order count, lifetime spend and last order date.
+
+`OrderSummary` rows are maintained incrementally by `record_orders`, in the same transaction as the orders they count,
+so reading a user's totals is a single primary key lookup rather than an aggregate over their whole order history.
+
+Orders written other than through `create_order` or `place_orders` (e.g. by `generate_data`), or deleted, aren't
+reflected until the summaries are rebuilt from `Order` with `rebuild_order_summaries`, which is safe to run while
+orders are being placed. Totals include orders since archived (see `mattshop.orders.partitions`), which are also kept
+in the summaries' `archived_*` fields, so a rebuild doesn't lose them.
+"""
+import multiprocessing
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from mattshop.orders.models import Order, OrderSummary
+
+
+def record_orders(orders):
+    """Adds newly-placed orders to their users' summaries, with a single upsert. Must be called in the transaction
+    the orders were placed in.
+
+    Summaries are written in user id order, so that concurrent transactions recording orders for overlapping sets of
+    users take their row locks in the same order, and can't deadlock.
+    """
+    totals = {}
+    for order in orders:
+        count, spent, last_order_at = totals.get(order.user_id, (0, 0, order.created_at))
+        totals[order.user_id] = (count + 1, spent + order.total_price, max(last_order_at, order.created_at))
+    if not totals:
+        return
+
+    table = OrderSummary._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} (user_id, order_count, total_spent, last_order_at, archived_order_count, '
+            'archived_total_spent, archived_last_order_at) VALUES {values} '
+            'ON CONFLICT (user_id) DO UPDATE SET '
+            'order_count = {table}.order_count + EXCLUDED.order_count, '
+            'total_spent = {table}.total_spent + EXCLUDED.total_spent, '
+            'last_order_at = GREATEST({table}.last_order_at, EXCLUDED.last_order_at)'.format(
+                table=table, values=', '.join(['(%s, %s, %s, %s, 0, 0, NULL)'] * len(totals)),
+            ),
+            [value for user_id, total in sorted(totals.items()) for value in (user_id, *total)],
+        )
+
+
+def rebuild_chunk(start, end):
+    """Recomputes the summaries of users with ids in `[start, end)` from their orders, in one transaction.
+
+    The chunk's summaries are first reset to the totals of their archived orders (see `mattshop.orders.partitions`),
+    creating any that are missing, which locks them, and the totals of their orders in `Order` are then added. Any
+    transaction still recording orders for those users is waited for, and any later one waits for this to commit - so
+    its orders are either counted by the recomputation, or added to the result afterwards, but never both or neither.
+
+    Returns:
+        The number of users in the chunk with unarchived orders.
+    """
+    table = OrderSummary._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} (user_id, order_count, total_spent, last_order_at, archived_order_count, '
+            'archived_total_spent, archived_last_order_at) '
+            'SELECT id, 0, 0, NULL, 0, 0, NULL FROM {users} WHERE id >= %s AND id < %s ORDER BY id '
+            'ON CONFLICT (user_id) DO UPDATE SET order_count = {table}.archived_order_count, '
+            'total_spent = {table}.archived_total_spent, last_order_at = {table}.archived_last_order_at'.format(
+                table=table, users=User._meta.db_table,
+            ),
+            [start, end],
+        )
+        cursor.execute(
+            'UPDATE {table} SET order_count = {table}.order_count + totals.order_count, '
+            'total_spent = {table}.total_spent + totals.total_spent, '
+            'last_order_at = GREATEST({table}.last_order_at, totals.last_order_at) '
+            'FROM (SELECT user_id, COUNT(*) AS order_count, SUM(total_price) AS total_spent, '
+            'MAX(created_at) AS last_order_at FROM {orders} WHERE user_id >= %s AND user_id < %s GROUP BY user_id) '
+            'AS totals WHERE {table}.user_id = totals.user_id'.format(table=table, orders=Order._meta.db_table),
+            [start, end],
+        )
+        return cursor.rowcount
+
+
+def _rebuild_chunk(args):
+    return rebuild_chunk(*args)
+
+
+def rebuild_order_summaries(chunk_size=10000, workers=1):
+    """Recomputes every user's summary from their orders, in chunks of `chunk_size` user ids.
+
+    Args:
+        chunk_size (int): Number of user ids recomputed per transaction.
+        workers (int): Number of processes to recompute chunks in, in parallel.
+
+    Returns:
+        The number of users with orders.
+    """
+    bounds = User.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return 0
+    chunks = [(start, start + chunk_size) for start in range(bounds['first'], bounds['last'] + 1, chunk_size)]
+
+    if workers > 1:
+        # forked workers must each open their own database connection
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            return sum(pool.imap_unordered(_rebuild_chunk, chunks))
+    return sum(map(_rebuild_chunk, chunks))
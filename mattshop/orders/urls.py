@@ -1,9 +1,17 @@
 from django.urls import path
 
-from mattshop.orders.views import OrderListView, OrderCreateView
+from mattshop.orders.views import (
+    OrderArchiveListView, OrderArchiveView, OrderBulkCreateView, OrderCreateView, OrderListView, OrderStatusView,
+    OrderSummaryView,
+)
 
 
 urlpatterns = [
     path('history/', OrderListView.as_view(), name='order-list-view'),
     path('create/', OrderCreateView.as_view(), name='order-create-view'),
+    path('bulk/', OrderBulkCreateView.as_view(), name='order-bulk-create-view'),
+    path('summary/', OrderSummaryView.as_view(), name='order-summary-view'),
+    path('archive/', OrderArchiveListView.as_view(), name='order-archive-list-view'),
+    path('archive/<str:month>/', OrderArchiveView.as_view(), name='order-archive-view'),
+    path('<int:pk>/status/', OrderStatusView.as_view(), name='order-status-view'),
 ]
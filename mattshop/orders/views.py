@@ -1,34 +1,207 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework import status
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.views import APIView
-from rest_framework.generics import ListAPIView
+from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 
+from mattshop.async_api import async_api_view, render
+from mattshop.metrics import TimedListMixin, phase
 from mattshop.orders import exceptions
-from mattshop.orders.operations import create_order
-from mattshop.orders.models import Order
-from mattshop.orders.serializers import OrderSerializer, CreateOrderSerializer
+from mattshop.orders.operations import create_order, place_orders, submit_order
+from mattshop.orders.models import Order, OrderArchive, OrderSummary, PendingOrder
+from mattshop.orders.partitions import read_archive
+from mattshop.orders.serializers import (
+    BulkCreateOrderSerializer, CreateOrderSerializer, OrderRowSerializer, OrderSummarySerializer, PendingOrderSerializer
+)
+from mattshop.pagination import KeysetOrPageNumberPagination
+from mattshop.routers import replica_reads
+
+
+def order_error_message(error):
+    if isinstance(error, exceptions.OutOfStockOrderError):
+        return "One or more items were out of stock in the quantities you requested - order not created."
+    return "{} - order not created.".format(error)
+
+
+class OrderPagination(KeysetOrPageNumberPagination):
+    ordering = ('-created_at', '-id')
 
 
-class OrderListView(ListAPIView):
-    serializer_class = OrderSerializer
+class OrderListView(TimedListMixin, ListAPIView):
+    serializer_class = OrderRowSerializer
+    pagination_class = OrderPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return OrderRowSerializer.select(Order.objects.filter(user=self.request.user))
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads(request.user):
+            return super().list(request, *args, **kwargs)
+
+
+@async_api_view()
+async def order_list_async(request):
+    """An async equivalent of `OrderListView`, for serving under ASGI."""
+    pagination = OrderPagination()
+    with replica_reads(request.user):
+        page = await pagination.apaginate_queryset(
+            OrderRowSerializer.select(Order.objects.filter(user=request.user)), request
+        )
+        items = await OrderRowSerializer.afetch_items(page)
+    with phase('serialization'):
+        data = pagination.get_paginated_response(OrderRowSerializer(page, items=items).data).data
+    return render(data)
 
 
 class OrderCreateView(APIView):
     def put(self, request, *args, **kwargs):
         order_data = CreateOrderSerializer(data=request.data)
-        if not order_data.is_valid():
+        with phase('serialization'):
+            valid = order_data.is_valid()
+        if not valid:
             return Response(order_data.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        if settings.ORDER_ASYNC_SUBMISSION or self.prefers_async(request):
+            return self.submit(request, order_data.validated_data['items'])
+
         try:
             new_order = create_order(request.user, order_data.validated_data['items'])
             return Response({
                 'order_id': new_order.id,
                 'message': "Successfully created order"
             }, status=status.HTTP_201_CREATED)
-        except exceptions.OutOfStockOrderError:
+        except exceptions.OrderError as e:
             return Response({
-                'message': "One or more items were out of stock in the quantities you requested - order not created."
+                'message': order_error_message(e)
             }, status=status.HTTP_400_BAD_REQUEST)
+
+    def prefers_async(self, request):
+        preferences = [preference.strip() for preference in request.headers.get('Prefer', '').split(',')]
+        return 'respond-async' in preferences
+
+    def submit(self, request, order_contents):
+        """Accepts the order to be placed later by the `process_pending_orders` worker, rather than placing it now."""
+        pending_order = submit_order(request.user, order_contents)
+        status_url = reverse('order-status-view', kwargs={'pk': pending_order.id})
+        return Response({
+            'pending_order_id': pending_order.id,
+            'status_url': request.build_absolute_uri(status_url),
+            'message': "Order accepted for processing"
+        }, status=status.HTTP_202_ACCEPTED, headers={
+            'Location': status_url,
+            'Preference-Applied': 'respond-async',
+        })
+
+
+class OrderBulkCreateView(APIView):
+    """Places many orders from one request, in a single transaction.
+
+    Takes `{'orders': [{'items': [...]}, ...], 'all_or_nothing': false}`, each order being as for `OrderCreateView`.
+    Responds with a result for each order, in the same order. By default, each order succeeds or fails on its own. With
+    `all_or_nothing`, no orders are placed unless every one of them can be.
+    """
+    def put(self, request, *args, **kwargs):
+        bulk_data = BulkCreateOrderSerializer(data=request.data)
+        if not bulk_data.is_valid():
+            return Response(bulk_data.errors, status=status.HTTP_400_BAD_REQUEST)
+        all_or_nothing = bulk_data.validated_data['all_or_nothing']
+
+        results = []
+        valid_orders = {}
+        for i, order in enumerate(bulk_data.validated_data['orders']):
+            order_data = CreateOrderSerializer(data=order)
+            if order_data.is_valid():
+                valid_orders[i] = order_data.validated_data['items']
+                results.append(None)
+            else:
+                results.append({'errors': order_data.errors})
+
+        if all_or_nothing and len(valid_orders) < len(results):
+            valid_orders = {}
+        placed = place_orders(
+            [(request.user, order_contents) for order_contents in valid_orders.values()],
+            all_or_nothing=all_or_nothing,
+        ) if valid_orders else []
+
+        for i, result in zip(valid_orders.keys(), placed):
+            if isinstance(result, exceptions.OrderError):
+                results[i] = {'message': order_error_message(result)}
+            else:
+                results[i] = {'order_id': result.id, 'message': "Successfully created order"}
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {'message': "Not placed, as another order in the batch was invalid - order not created."}
+
+        created = len([result for result in results if 'order_id' in result])
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=response_status)
+
+
+class OrderStatusView(RetrieveAPIView):
+    """The status of an order submitted asynchronously, and the id of the order once placed."""
+    serializer_class = PendingOrderSerializer
+
+    def get_queryset(self):
+        return PendingOrder.objects.filter(user=self.request.user)
+
+
+class OrderSummaryView(APIView):
+    """The requesting user's order count, lifetime spend and last order date, from their `OrderSummary`.
+
+    Staff can view any user's summary with `?user=<id>`, e.g. for support tools.
+    """
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if 'user' in request.query_params:
+            if not request.user.is_staff:
+                raise PermissionDenied()
+            user_id = request.query_params['user']
+            user = User.objects.filter(pk=user_id).first() if user_id.isdigit() else None
+            if user is None:
+                raise NotFound()
+
+        with replica_reads(request.user):
+            # a user who has never placed an order has no summary yet
+            summary = OrderSummary.objects.filter(user=user).first() or OrderSummary(user=user)
+        return Response(OrderSummarySerializer(summary).data)
+
+
+class OrderArchiveListView(APIView):
+    """The months of orders which have been archived, newest first - see `mattshop.orders.partitions`."""
+    def get(self, request, *args, **kwargs):
+        months = OrderArchive.objects.order_by('-month').values_list('month', flat=True)
+        return Response({'results': [
+            {
+                'month': '{:%Y-%m}'.format(month),
+                'url': request.build_absolute_uri(
+                    reverse('order-archive-view', kwargs={'month': '{:%Y-%m}'.format(month)})
+                ),
+            }
+            for month in months
+        ]})
+
+
+class OrderArchiveView(APIView):
+    """The requesting user's orders from an archived month, newest first, as `OrderListView` represented them.
+
+    They're read from the month's archive file, which is scanned in full, so this is far slower than order history.
+    """
+    def get(self, request, month, *args, **kwargs):
+        try:
+            month = datetime.strptime(month, '%Y-%m').date()
+        except ValueError:
+            raise NotFound()
+        archive = OrderArchive.objects.filter(month=month).first()
+        if archive is None:
+            raise NotFound()
+        return Response({'results': list(read_archive(archive, request.user.id))})
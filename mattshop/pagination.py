@@ -0,0 +1,169 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only keyset ("cursor") pagination over a unique ordering.
+
+    Rather than counting the whole result set and skipping rows with `OFFSET`, each page is fetched by filtering for
+    rows after the last row of the previous page, e.g. `WHERE (name, id) > (:name, :id)`. With an index matching the
+    ordering, every page costs the same regardless of how deep into the results it is.
+
+    `ordering` must be unique across rows, so should end with the primary key.
+    """
+    ordering = None
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """An async equivalent of `paginate_queryset`, using the async ORM."""
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """Filters the queryset to the requested page, plus one row to tell whether there's a next page."""
+        self.request = request
+        self.model = queryset.model
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.rows_after(position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def rows_after(self, position):
+        """Builds a filter for rows strictly after `position` in the ordering.
+
+        This expands the row comparison `(a, b) > (x, y)` to `a >= x AND (a > x OR (a = x AND b > y))`. The leading
+        `a >= x` is logically redundant, but gives the database a range to scan the index with.
+        """
+        fields = [field.lstrip('-') for field in self.ordering]
+        descending = [field.startswith('-') for field in self.ordering]
+
+        after = Q()
+        for i, field in enumerate(fields):
+            clause = Q(**{'{}__{}'.format(field, 'lt' if descending[i] else 'gt'): position[i]})
+            for previous_field, value in zip(fields[:i], position[:i]):
+                clause &= Q(**{previous_field: value})
+            after |= clause
+
+        leading = Q(**{'{}__{}'.format(fields[0], 'lte' if descending[0] else 'gte'): position[0]})
+        return leading & after
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError()
+            return [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        # `DjangoJSONEncoder` truncates datetimes to milliseconds, which would skip rows later in the same millisecond
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        encoded = base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode('ascii'))
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded.decode('ascii')
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class KeysetOrPageNumberPagination(BasePagination):
+    """Lets the client choose between page number and keyset pagination.
+
+    Page number pagination (`?page=2`) remains the default for backwards compatibility. Passing the `cursor` query
+    parameter, empty for the first page, switches to `KeysetPagination`, which avoids counting the whole result set.
+    Both modes use the same `ordering`.
+    """
+    ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.paginator = KeysetPagination()
+            self.paginator.ordering = self.ordering
+        else:
+            self.paginator = PageNumberPagination()
+            queryset = queryset.order_by(*self.ordering)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """An async equivalent of `paginate_queryset`, using the async ORM."""
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.paginator = KeysetPagination()
+            self.paginator.ordering = self.ordering
+            return await self.paginator.apaginate_queryset(queryset, request, view)
+
+        self.paginator = PageNumberPagination()
+        return await apaginate_page_number(self.paginator, queryset.order_by(*self.ordering), request)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+async def apaginate_page_number(pagination, queryset, request):
+    """An async equivalent of `PageNumberPagination.paginate_queryset`, which counts and fetches with the async ORM.
+
+    Django's `Paginator` would count and fetch synchronously, so it is given the count up front, and the page is built
+    from rows fetched here.
+    """
+    paginator = pagination.django_paginator_class(queryset, pagination.get_page_size(request))
+    paginator.count = await queryset.acount()
+    page_number = pagination.get_page_number(request, paginator)
+    try:
+        number = paginator.validate_number(page_number)
+    except InvalidPage as exc:
+        raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+    bottom = (number - 1) * paginator.per_page
+    objects = [obj async for obj in queryset[bottom:bottom + paginator.per_page]]
+    pagination.page = Page(objects, number, paginator)
+    pagination.request = request
+    return objects
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mattshop.products'
+
+    def ready(self):
+        from mattshop.products import signals  # noqa: F401
@@ -0,0 +1,71 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from mattshop.products.models import ProductPrice
+
+
+VERSION_KEY = 'catalogue:version'
+
+
+def get_catalogue_version():
+    """Returns the current catalogue version, which changes whenever the catalogue may have changed."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # seed from the clock rather than starting at 1, so if the version is ever evicted it can't restart at a
+        # value that pages were previously cached under
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalogue_version():
+    """An async equivalent of `get_catalogue_version`."""
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalogue_version()  # not set (or evicted) - seeding it is enough to invalidate existing pages
+
+
+def catalogue_changed():
+    """Records that the catalogue has changed, bumping the version once the current transaction commits.
+
+    Bumping any earlier would let a concurrent request cache the old data under the new version.
+    """
+    transaction.on_commit(bump_catalogue_version)
+
+
+def catalogue_cache_timeout(now=None):
+    """How long a catalogue page can be cached for - never past the point the next scheduled price takes effect."""
+    now = now or datetime.now()
+    return _cache_timeout(_next_price_changes(now).first(), now)
+
+
+async def acatalogue_cache_timeout(now=None):
+    """An async equivalent of `catalogue_cache_timeout`."""
+    now = now or datetime.now()
+    return _cache_timeout(await _next_price_changes(now).afirst(), now)
+
+
+def _next_price_changes(now):
+    return ProductPrice.objects.filter(effective_from__gt=now).order_by('effective_from').values_list(
+        'effective_from', flat=True
+    )
+
+
+def _cache_timeout(next_price_change, now):
+    timeout = settings.CATALOGUE_CACHE_TIMEOUT
+    if next_price_change is not None:
+        timeout = min(timeout, int((next_price_change - now).total_seconds()))
+    return max(timeout, 0)
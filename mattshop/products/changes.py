@@ -0,0 +1,121 @@
+"""Changes to the product catalogue since a watermark, so clients can keep a copy of it in sync without re-listing it.
+
+Every write to a `CatalogueEntry` sets its `updated_at` - whether from `refresh_catalogue` (including when a scheduled
+price comes into effect, see `activate_scheduled_prices`) or from `adjust_catalogue_stock` as orders deduct stock. A
+client's watermark is a signed token recording the time its last sync started. It asks for entries updated since then,
+ordered by `(updated_at, product_id)`, and gets back those which are listable as changes and the ids of the rest (now
+disabled, out of stock or unpriced) as removed, along with a new watermark. A deleted product's entry is deleted with
+it, so it leaves a `CatalogueTombstone`, which is reported as removed in the same order.
+
+An entry's `updated_at` is set when it's written, but it may only become visible (on the primary, or on a lagging
+replica) some time later, so each sync looks back `CATALOGUE_CHANGES_OVERLAP` seconds before its watermark. Changes in
+the overlap may be returned twice, which is harmless, as applying a change is idempotent.
+
+A sync with more than `CATALOGUE_CHANGES_LIMIT` changes is split across several responses, each watermark continuing
+from the last change returned (as keyset pagination does) until the sync is complete.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+
+from mattshop.pagination import KeysetPagination
+from mattshop.products.models import CatalogueEntry, CatalogueTombstone
+from mattshop.products.serializers import CatalogueEntryRowSerializer
+
+
+SALT = 'mattshop.products.changes'
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+class ChangesPagination(KeysetPagination):
+    ordering = ('updated_at', 'product_id')
+
+
+def encode_watermark(since, after=None, until=None):
+    """Encodes a watermark as a signed token.
+
+    Args:
+        since (datetime): The time from which changes are wanted, or `None` for everything.
+        after (tuple): `(updated_at, product_id)` of the last change returned, if part way through a sync.
+        until (datetime): When the sync started, if part way through it - the `since` of the next sync.
+    """
+    return signing.dumps({
+        'since': since and since.isoformat(),
+        'after': after and [after[0].isoformat(), after[1]],
+        'until': until and until.isoformat(),
+    }, salt=SALT)
+
+
+def decode_watermark(token):
+    """Decodes a watermark from `encode_watermark` to a dict of its arguments, or raises `InvalidWatermark`."""
+    try:
+        payload = signing.loads(token, salt=SALT)
+        return {
+            'since': payload['since'] and datetime.fromisoformat(payload['since']),
+            'after': payload['after'] and (datetime.fromisoformat(payload['after'][0]), int(payload['after'][1])),
+            'until': payload['until'] and datetime.fromisoformat(payload['until']),
+        }
+    except (signing.BadSignature, KeyError, IndexError, TypeError, ValueError):
+        raise InvalidWatermark()
+
+
+def _listable(row):
+    # as `CatalogueEntryQuerySet.listable`. Tombstones have no `enabled`, as their product is gone
+    return 'enabled' in row._fields and row.enabled and row.quantity_in_stock > 0 and row.price is not None
+
+
+def catalogue_changes(token=None, limit=None):
+    """Finds the catalogue entries changed since a watermark.
+
+    Args:
+        token (str): A watermark from a previous call, or `None` to sync the whole catalogue.
+        limit (int): The most changes to return. Defaults to `CATALOGUE_CHANGES_LIMIT`.
+
+    Returns:
+        A dict of the `changes` (as `CatalogueEntryRowSerializer` represents them), the `removed` product ids, the
+        `watermark` to pass next time, and whether there are `more` changes to fetch with it straight away.
+    """
+    watermark = decode_watermark(token) if token else {'since': None, 'after': None, 'until': None}
+    limit = limit or settings.CATALOGUE_CHANGES_LIMIT
+    until = watermark['until'] or datetime.now()
+
+    entries = CatalogueEntry.objects.all()
+    tombstones = CatalogueTombstone.objects.all()
+    if watermark['since'] is None:
+        # a client with nothing yet has nothing to remove
+        entries = entries.listable()
+        tombstones = tombstones.none()
+    else:
+        overlap = timedelta(seconds=settings.CATALOGUE_CHANGES_OVERLAP)
+        entries = entries.filter(updated_at__gt=watermark['since'] - overlap)
+        tombstones = tombstones.filter(updated_at__gt=watermark['since'] - overlap)
+    pagination = ChangesPagination()
+    if watermark['after'] is not None:
+        entries = entries.filter(pagination.rows_after(watermark['after']))
+        tombstones = tombstones.filter(pagination.rows_after(watermark['after']))
+    entries = entries.order_by(*pagination.ordering).values_list(
+        *CatalogueEntryRowSerializer.fields, 'enabled', 'updated_at', named=True
+    )
+    tombstones = tombstones.order_by(*pagination.ordering).values_list('product_id', 'updated_at', named=True)
+
+    # the first `limit + 1` of each, merged, hold the first `limit + 1` overall
+    rows = sorted(
+        list(entries[:limit + 1]) + list(tombstones[:limit + 1]), key=lambda row: (row.updated_at, row.product_id)
+    )[:limit + 1]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if more:
+        token = encode_watermark(watermark['since'], after=(rows[-1].updated_at, rows[-1].product_id), until=until)
+    else:
+        token = encode_watermark(until)
+
+    return {
+        'changes': [CatalogueEntryRowSerializer.to_representation(row) for row in rows if _listable(row)],
+        'removed': [row.product_id for row in rows if not _listable(row)],
+        'watermark': token,
+        'more': more,
+    }
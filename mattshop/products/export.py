@@ -0,0 +1,149 @@
+"""Streaming exports of the whole product catalogue, e.g. for the mobile app to cache it for offline use.
+
+Rather than paging through `/products/list/`, which counts the catalogue for every page, the export reads every
+listable entry in a single query, through a server-side cursor, and encodes them as NDJSON or CSV in chunks of
+`CHUNK_SIZE` rows, optionally gzipping them. Only one chunk is held in memory at a time, however big the catalogue.
+"""
+import csv
+import io
+import re
+import zlib
+from itertools import chain
+
+import orjson
+from django.db import connections, router
+
+from mattshop.products.models import CatalogueEntry
+from mattshop.products.serializers import CatalogueEntryRowSerializer
+from mattshop.routers import replica_reads
+
+
+CHUNK_SIZE = 2000
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv; charset=utf-8',
+}
+
+accepts_gzip_re = re.compile(r'\bgzip\b')
+
+
+def export_queryset():
+    """Rows of every listable catalogue entry, in product id order, read from a replica if there are any.
+
+    The database is chosen here, as the rows are only read as the response streams, after the view has returned.
+    """
+    with replica_reads():
+        using = router.db_for_read(CatalogueEntry)
+    return CatalogueEntryRowSerializer.select(CatalogueEntry.objects.using(using).listable().order_by('product_id'))
+
+
+def _server_side_cursors(queryset):
+    return not connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS')
+
+
+def iter_chunks(queryset):
+    """Yields the queryset's rows in lists of at most `CHUNK_SIZE`, read through a server-side cursor.
+
+    Where server-side cursors are disabled (with `DB_PGBOUNCER`), `iterator` would fetch every row at once, so chunks
+    are instead read by separate queries, paging by product id.
+    """
+    if not _server_side_cursors(queryset):
+        chunk = list(queryset[:CHUNK_SIZE])
+        while chunk:
+            yield chunk
+            if len(chunk) < CHUNK_SIZE:
+                return
+            chunk = list(queryset.filter(product__gt=chunk[-1].product_id)[:CHUNK_SIZE])
+        return
+
+    chunk = []
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def aiter_chunks(queryset):
+    """An async equivalent of `iter_chunks`, using the async ORM."""
+    if not _server_side_cursors(queryset):
+        chunk = [row async for row in queryset[:CHUNK_SIZE]]
+        while chunk:
+            yield chunk
+            if len(chunk) < CHUNK_SIZE:
+                return
+            chunk = [row async for row in queryset.filter(product__gt=chunk[-1].product_id)[:CHUNK_SIZE]]
+        return
+
+    chunk = []
+    async for row in queryset.aiterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_header(export_format):
+    """CSV exports start with a row of column names."""
+    if export_format == CSV:
+        return b'id,name,quantity_in_stock,price\r\n'
+    return b''
+
+
+def encode_chunk(rows, export_format):
+    """Encodes rows as their entries in the catalogue (see `CatalogueEntryRowSerializer`), one per line."""
+    entries = map(CatalogueEntryRowSerializer.to_representation, rows)
+    if export_format == NDJSON:
+        return b''.join(orjson.dumps(entry) + b'\n' for entry in entries)
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(entry.values() for entry in entries)
+    return buffer.getvalue().encode()
+
+
+def stream(export_format, gzip=False):
+    """Streams the export in the given format, as chunks of bytes."""
+    chunks = (encode_chunk(rows, export_format) for rows in iter_chunks(export_queryset()))
+    content = chain([encode_header(export_format)], chunks)
+    return gzip_chunks(content) if gzip else content
+
+
+def astream(export_format, gzip=False):
+    """An async equivalent of `stream`."""
+    async def content():
+        yield encode_header(export_format)
+        async for rows in aiter_chunks(export_queryset()):
+            yield encode_chunk(rows, export_format)
+
+    return agzip_chunks(content()) if gzip else content()
+
+
+def accepts_gzip(request):
+    return bool(accepts_gzip_re.search(request.headers.get('Accept-Encoding', '')))
+
+
+def gzip_chunks(chunks):
+    """Gzips a stream of chunks as it's written."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def agzip_chunks(chunks):
+    """An async equivalent of `gzip_chunks`."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mattshop.products.operations import activate_scheduled_prices
+
+
+class Command(BaseCommand):
+    help = "Updates the catalogue read model for any scheduled prices which have come into effect. Run periodically."
+
+    def handle(self, *args, **options):
+        product_ids = activate_scheduled_prices()
+        print("Activated new prices for {} products.".format(len(product_ids)))
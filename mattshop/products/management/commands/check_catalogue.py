@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mattshop.products.operations import check_catalogue_consistency, refresh_catalogue
+
+
+class Command(BaseCommand):
+    help = "Checks the catalogue read model against the product and price tables, optionally repairing it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Refresh any inconsistent catalogue entries.")
+
+    def handle(self, *args, **options):
+        mismatched = check_catalogue_consistency()
+        if not mismatched:
+            print("Catalogue is consistent.")
+            return
+
+        print("{} inconsistent catalogue entries: {}".format(len(mismatched), mismatched))
+        if not options['repair']:
+            raise CommandError("Catalogue is inconsistent - rerun with --repair to fix.")
+
+        refresh_catalogue(mismatched)
+        print("Repaired {} catalogue entries.".format(len(mismatched)))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mattshop.products.operations import refresh_catalogue
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the catalogue read model from the product and price tables, e.g. after loading fixtures."
+
+    def handle(self, *args, **options):
+        written = refresh_catalogue()
+        print("Refreshed {} catalogue entries.".format(written))
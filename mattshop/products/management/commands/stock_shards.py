@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mattshop.products.models import Product
+from mattshop.products.operations import collapse_stock_shards, enable_stock_sharding, rebalance_stock_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Manages sharded stock for products with very high order rates. 'enable' splits a product's stock across "
+        "--shards counters (or changes the number of shards), 'rebalance' evens stock out across its shards, and "
+        "'collapse' moves it back into a single counter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'rebalance', 'collapse'])
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--shards', type=int, default=8, help="Number of shards to split stock across.")
+
+    def handle(self, *args, **options):
+        product_id = options['product_id']
+        try:
+            if options['action'] == 'enable':
+                enable_stock_sharding(product_id, options['shards'])
+            elif options['action'] == 'rebalance':
+                rebalance_stock_shards(product_id)
+            else:
+                collapse_stock_shards(product_id)
+        except Product.DoesNotExist:
+            raise CommandError("Product {} does not exist.".format(product_id))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        product = Product.objects.with_stock().get(id=product_id)
+        print("Product {} has {} in stock, across {} shards.".format(
+            product_id, product.available_stock, product.stock_shards.count() or 1
+        ))
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:58
+
+from datetime import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_catalogue(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductPrice = apps.get_model('products', 'ProductPrice')
+    CatalogueEntry = apps.get_model('products', 'CatalogueEntry')
+
+    current_prices = ProductPrice.objects.filter(
+        product=OuterRef('pk'), effective_from__lte=datetime.now()
+    ).order_by('-effective_from')
+    products = Product.objects.annotate(
+        current_price=Subquery(current_prices.values('price')[:1]),
+        current_price_effective_from=Subquery(current_prices.values('effective_from')[:1]),
+    )
+    CatalogueEntry.objects.bulk_create([
+        CatalogueEntry(
+            product_id=product.id,
+            name=product.name,
+            enabled=product.enabled,
+            quantity_in_stock=product.quantity_in_stock,
+            price=product.current_price,
+            price_effective_from=product.current_price_effective_from,
+        )
+        for product in products.iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_alter_product_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueEntry',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalogue_entry', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=100)),
+                ('enabled', models.BooleanField()),
+                ('quantity_in_stock', models.IntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('price_effective_from', models.DateTimeField(null=True)),
+            ],
+            options={
+                'ordering': ['name', 'product'],
+                'indexes': [models.Index(condition=models.Q(('enabled', True), ('price__isnull', False), ('quantity_in_stock__gt', 0)), fields=['name', 'product'], name='catalogue_listable_idx')],
+            },
+        ),
+        migrations.RunPython(populate_catalogue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_stockshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogueentry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='catalogueentry',
+            index=models.Index(fields=['updated_at', 'product'], name='catalogue_updated_idx'),
+        ),
+    ]
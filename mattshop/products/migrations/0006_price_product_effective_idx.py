@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_catalogueentry_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productprice',
+            index=models.Index(fields=['product', '-effective_from'], include=('price',), name='price_product_effective_idx'),
+        ),
+        migrations.AlterField(
+            model_name='productprice',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='products.product'),
+        ),
+    ]
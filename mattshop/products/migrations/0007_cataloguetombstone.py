@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_price_product_effective_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueTombstone',
+            fields=[
+                ('product_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at', 'product_id'], name='tombstone_updated_idx')],
+            },
+        ),
+    ]
@@ -1,22 +1,146 @@
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
 from datetime import datetime
 
+
+class ProductQuerySet(models.QuerySet):
+    def with_current_price(self, at=None):
+        """Annotates each product with its currently-effective price as `current_price`.
+
+        This resolves prices for the whole queryset in a single query (via a correlated subquery), rather than one
+        query per product. Products with no effective price are annotated with `None`.
+        """
+        current_prices = ProductPrice.objects.filter(
+            product=OuterRef('pk'),
+            effective_from__lte=at or datetime.now(),
+        ).order_by('-effective_from')
+        return self.annotate(current_price=Subquery(current_prices.values('price')[:1]))
+
+    def with_stock(self):
+        """Annotates each product with its available stock as `available_stock`.
+
+        This is `quantity_in_stock` for most products, or the total across all stock shards for products with sharded
+        stock - see `StockShard`.
+        """
+        shard_totals = StockShard.objects.filter(product=OuterRef('pk')).values('product').annotate(
+            total=Sum('quantity')
+        ).values('total')
+        return self.annotate(available_stock=Case(
+            When(sharded_stock=True, then=Coalesce(Subquery(shard_totals), 0)),
+            default=F('quantity_in_stock'),
+        ))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     enabled = models.BooleanField(default=True)
+    # not maintained for products with sharded stock - use `get_available_stock` or `ProductQuerySet.with_stock`
     quantity_in_stock = models.IntegerField()
+    sharded_stock = models.BooleanField(default=False)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
     def get_current_price(self):
+        """Returns the currently-effective price of this product, or `None` if it has no effective price.
+
+        Uses the `current_price` annotation from `ProductQuerySet.with_current_price` where present, to avoid a query.
+        """
+        if hasattr(self, 'current_price'):
+            return self.current_price
+
         current_price = self.prices.filter(effective_from__lte=datetime.now()).order_by('-effective_from').first()
-        return current_price.price
+        return current_price.price if current_price else None
+
+    def get_available_stock(self):
+        """Returns the stock available for this product, totalling its stock shards if it has them.
+
+        Uses the `available_stock` annotation from `ProductQuerySet.with_stock` where present, to avoid a query.
+        """
+        if hasattr(self, 'available_stock'):
+            return self.available_stock
+        if self.sharded_stock:
+            return self.stock_shards.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+        return self.quantity_in_stock
 
     class Meta:
         ordering = ['name']
 
 class ProductPrice(models.Model):
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices')
+    # indexed by `price_product_effective_idx`, which leads with the product
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices', db_index=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    effective_from = models.DateTimeField(db_index=True)
\ No newline at end of file
+    # finds the next scheduled price to come into effect, across all products
+    effective_from = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            # supports looking up a product's current price - its latest price effective by a given time - reading
+            # only the one index entry it needs. `price` is included so that the lookup doesn't visit the table
+            models.Index(
+                fields=['product', '-effective_from'], include=['price'], name='price_product_effective_idx'
+            ),
+        ]
+
+
+class StockShard(models.Model):
+    """One of several counters a product's stock is split across.
+
+    A single `Product.quantity_in_stock` row is a hotspot for products with very high order rates, as every order
+    updates it. Splitting stock across shards lets concurrent orders each draw from a different row. See
+    `mattshop.products.operations.enable_stock_sharding`.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    quantity = models.IntegerField()
+
+
+class CatalogueEntryQuerySet(models.QuerySet):
+    def listable(self):
+        """Entries which should be shown in the catalogue - enabled, in stock and priced."""
+        return self.filter(enabled=True, quantity_in_stock__gt=0, price__isnull=False)
+
+
+class CatalogueEntry(models.Model):
+    """A denormalized read model of the product catalogue.
+
+    Holds one row per product with its current price resolved, so that catalogue reads are served from a single
+    narrow table rather than filtering `Product` and joining through `ProductPrice`. Entries are maintained by
+    `mattshop.products.operations` - see `refresh_catalogue` and `activate_scheduled_prices`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='catalogue_entry')
+    name = models.CharField(max_length=100)
+    enabled = models.BooleanField()
+    quantity_in_stock = models.IntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    price_effective_from = models.DateTimeField(null=True)
+    # when the entry last changed, for clients syncing changes (see `mattshop.products.changes`). Set explicitly by
+    # `adjust_catalogue_stock`, as `auto_now` isn't applied by `update()`
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CatalogueEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['name', 'product']
+        indexes = [
+            models.Index(
+                fields=['name', 'product'],
+                condition=models.Q(enabled=True, quantity_in_stock__gt=0, price__isnull=False),
+                name='catalogue_listable_idx',
+            ),
+            models.Index(fields=['updated_at', 'product'], name='catalogue_updated_idx'),
+        ]
+
+
+class CatalogueTombstone(models.Model):
+    """A record of a deleted product, whose catalogue entry was deleted with it, so that clients syncing changes (see
+    `mattshop.products.changes`) learn to remove it. Written by the `Product` `post_delete` signal."""
+    product_id = models.BigIntegerField(primary_key=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'product_id'], name='tombstone_updated_idx'),
+        ]
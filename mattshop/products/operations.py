@@ -0,0 +1,267 @@
+import random
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, When
+
+from mattshop.products.cache import catalogue_changed
+from mattshop.products.models import CatalogueEntry, Product, ProductPrice, StockShard
+
+
+CHUNK_SIZE = 2000
+# the fields of a catalogue entry copied from its product and prices
+CATALOGUE_ENTRY_FIELDS = ['name', 'enabled', 'quantity_in_stock', 'price', 'price_effective_from']
+
+
+def _catalogue_source(at):
+    """Products annotated with everything needed to build their catalogue entries, as of the given time."""
+    current_prices = ProductPrice.objects.filter(
+        product=OuterRef('pk'),
+        effective_from__lte=at,
+    ).order_by('-effective_from')
+    return Product.objects.with_current_price(at=at).with_stock().annotate(
+        current_price_effective_from=Subquery(current_prices.values('effective_from')[:1])
+    ).order_by('id')
+
+
+def _iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Iterates over an id-ordered queryset in lists of at most `chunk_size`, paging by id rather than offset."""
+    last_id = None
+    while True:
+        chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def _build_entry(product):
+    return CatalogueEntry(
+        product_id=product.id,
+        name=product.name,
+        enabled=product.enabled,
+        quantity_in_stock=product.available_stock,
+        price=product.current_price,
+        price_effective_from=product.current_price_effective_from,
+    )
+
+
+def refresh_catalogue(product_ids=None, at=None):
+    """Rebuilds catalogue entries from the source `Product` and `ProductPrice` tables.
+
+    Args:
+        product_ids (iterable): IDs of products to refresh. All products are refreshed if not given.
+        at (datetime): The time to resolve current prices at. Defaults to now.
+
+    Returns:
+        The number of entries written - those which were new or changed.
+
+    Each chunk of products is rebuilt in its own transaction, having first locked the products and their stock shards
+    (see `_lock_catalogue_sources`). Orders deduct stock from those rows and adjust catalogue entries by the same amount
+    in one transaction (see `adjust_catalogue_stock`), so an entry is rebuilt either wholly before or wholly after each
+    order, rather than from stock levels read before the order but written after its adjustment.
+    """
+    products = Product.objects.order_by('id')
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    source = _catalogue_source(at=at or datetime.now())
+
+    written = 0
+    updated_at = datetime.now()
+    last_id = None
+    while True:
+        with transaction.atomic():
+            chunk_ids = _lock_catalogue_sources(products if last_id is None else products.filter(id__gt=last_id))
+            if not chunk_ids:
+                break
+            entries = [_build_entry(product) for product in source.filter(id__in=chunk_ids)]
+            written += _upsert_entries(entries, updated_at)
+        last_id = chunk_ids[-1]
+
+    catalogue_changed()
+    return written
+
+
+def _lock_catalogue_sources(products):
+    """Locks the first `CHUNK_SIZE` of an id-ordered queryset of products, and their stock shards, returning their
+    ids. Rows are locked in primary key order, products before shards, as orders lock them."""
+    product_ids = list(products.select_for_update().values_list('id', flat=True)[:CHUNK_SIZE])
+    if product_ids:
+        list(StockShard.objects.select_for_update().filter(product_id__in=product_ids).order_by('id').values_list(
+            'id', flat=True
+        ))
+    return product_ids
+
+
+def _upsert_entries(entries, updated_at):
+    """Writes catalogue entries with a single upsert, returning how many were new or changed.
+
+    Entries which already hold the same values are left alone, keeping their `updated_at`, so a full refresh doesn't
+    send the whole catalogue to every client syncing changes (see `mattshop.products.changes`).
+    """
+    table = CatalogueEntry._meta.db_table
+    columns = [CatalogueEntry._meta.get_field(field).column for field in ['product', *CATALOGUE_ENTRY_FIELDS]]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} ({columns}, updated_at) VALUES {values} '
+            'ON CONFLICT (product_id) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at '
+            'WHERE ({current}) IS DISTINCT FROM ({excluded})'.format(
+                table=table,
+                columns=', '.join(columns),
+                values=', '.join(['({})'.format(', '.join(['%s'] * (len(columns) + 1)))] * len(entries)),
+                updates=', '.join('{0} = EXCLUDED.{0}'.format(column) for column in columns[1:]),
+                current=', '.join('{}.{}'.format(table, column) for column in columns[1:]),
+                excluded=', '.join('EXCLUDED.{}'.format(column) for column in columns[1:]),
+            ),
+            [
+                value for entry in entries
+                for value in (*(getattr(entry, column) for column in columns), updated_at)
+            ],
+        )
+        return cursor.rowcount
+
+
+def adjust_catalogue_stock(stock_deltas):
+    """Applies stock level changes to catalogue entries with a single `UPDATE`.
+
+    Deltas are applied relative to the stored level rather than re-read from `Product`, so concurrent adjustments
+    can be applied in any order without overwriting one another. They should be applied in the same transaction as the
+    stock changes themselves, so that `refresh_catalogue` can't interleave with them.
+
+    Args:
+        stock_deltas (dict): Mapping of product ID to the (usually negative) change in stock level.
+    """
+    if not stock_deltas:
+        return
+    CatalogueEntry.objects.filter(product_id__in=stock_deltas.keys()).update(
+        quantity_in_stock=Case(
+            *[When(product_id=product_id, then=F('quantity_in_stock') + delta)
+              for product_id, delta in stock_deltas.items()],
+            default=F('quantity_in_stock'),
+        ),
+        updated_at=datetime.now(),
+    )
+    catalogue_changed()
+
+
+def activate_scheduled_prices(now=None):
+    """Refreshes catalogue entries for products which have had a new price come into effect.
+
+    A price needs activating if it is effective by `now`, but is newer than the price the catalogue entry holds (or
+    the product has no catalogue entry, or its entry has no price at all).
+
+    Returns:
+        A list of the IDs of products whose entries were refreshed.
+    """
+    now = now or datetime.now()
+    product_ids = list(
+        ProductPrice.objects.filter(effective_from__lte=now).filter(
+            Q(product__catalogue_entry__price_effective_from__isnull=True) |
+            Q(effective_from__gt=F('product__catalogue_entry__price_effective_from'))
+        ).values_list('product_id', flat=True).distinct()
+    )
+    if product_ids:
+        refresh_catalogue(product_ids, at=now)
+    return product_ids
+
+
+def check_catalogue_consistency():
+    """Compares catalogue entries against the source `Product` and `ProductPrice` tables.
+
+    Returns:
+        A list of the IDs of products whose catalogue entry is missing or differs from its source data.
+    """
+    mismatched = []
+    for chunk in _iter_chunks(_catalogue_source(at=datetime.now())):
+        entries = CatalogueEntry.objects.in_bulk([product.id for product in chunk])
+        for product in chunk:
+            expected = _build_entry(product)
+            entry = entries.get(product.id)
+            fields = ['name', 'enabled', 'quantity_in_stock', 'price']
+            if entry is None or any(getattr(entry, field) != getattr(expected, field) for field in fields):
+                mismatched.append(product.id)
+    return mismatched
+
+
+def allocate_sharded_stock(product_id, quantity):
+    """Deducts stock from a product with sharded stock. Must be called within a transaction.
+
+    A random shard is tried first, so that concurrent orders for the product are spread across different rows, then
+    each of the others in turn - deducting only if the shard has enough stock left. If no single shard can satisfy the
+    whole quantity, it is drawn from across all of the shards, locking them (in primary key order) to do so.
+
+    Returns:
+        Whether there was enough stock - if not, no stock is deducted.
+    """
+    shard_ids = list(StockShard.objects.filter(product_id=product_id).values_list('id', flat=True))
+    random.shuffle(shard_ids)
+    for shard_id in shard_ids:
+        if StockShard.objects.filter(id=shard_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            return True
+
+    shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('id'))
+    if sum(shard.quantity for shard in shards) < quantity:
+        return False
+
+    remaining = quantity
+    for shard in shards:
+        drawn = min(shard.quantity, remaining)
+        shard.quantity -= drawn
+        remaining -= drawn
+    StockShard.objects.bulk_update(shards, ['quantity'])
+    return True
+
+
+def _split_stock(product, total, shards):
+    """Replaces a product's stock shards with `shards` new ones, sharing `total` stock as evenly as possible."""
+    product.stock_shards.all().delete()
+    StockShard.objects.bulk_create([
+        StockShard(product=product, quantity=total // shards + (1 if i < total % shards else 0))
+        for i in range(shards)
+    ])
+
+
+def _lock_stock(product_id):
+    """Locks a product and its stock shards, returning the product and its total stock."""
+    product = Product.objects.select_for_update().get(id=product_id)
+    if not product.sharded_stock:
+        return product, product.quantity_in_stock
+    shards = StockShard.objects.select_for_update().filter(product=product).order_by('id')
+    return product, sum(shards.values_list('quantity', flat=True))
+
+
+def enable_stock_sharding(product_id, shards):
+    """Splits a product's stock across `shards` stock shards, so that concurrent orders contend less.
+
+    Once sharded, `Product.quantity_in_stock` is no longer maintained (and is zeroed) - stock levels are the total of
+    the shards. If the product is already sharded, this changes the number of shards.
+    """
+    if shards < 1:
+        raise ValueError("A product needs at least one stock shard")
+
+    with transaction.atomic():
+        product, total = _lock_stock(product_id)
+        _split_stock(product, total, shards)
+        product.sharded_stock = True
+        product.quantity_in_stock = 0
+        product.save()
+
+
+def rebalance_stock_shards(product_id):
+    """Redistributes a sharded product's stock evenly across its shards, as orders may have drained some of them."""
+    with transaction.atomic():
+        product, total = _lock_stock(product_id)
+        if not product.sharded_stock:
+            raise ValueError("Product {} does not have sharded stock".format(product_id))
+        _split_stock(product, total, product.stock_shards.count())
+
+
+def collapse_stock_shards(product_id):
+    """Moves a sharded product's stock back into `Product.quantity_in_stock`, removing its shards."""
+    with transaction.atomic():
+        product, total = _lock_stock(product_id)
+        product.stock_shards.all().delete()
+        product.sharded_stock = False
+        product.quantity_in_stock = total
+        product.save()
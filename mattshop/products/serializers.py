@@ -1,16 +1,68 @@
-from datetime import datetime
-
 from rest_framework import serializers
 
-from mattshop.products.models import Product
+from mattshop.products.models import CatalogueEntry, Product
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    """Serializes products for the catalogue.
+
+    Expects products annotated by `ProductQuerySet.with_current_price` and `ProductQuerySet.with_stock`, otherwise
+    price and stock queries may be made per product.
+    """
+    quantity_in_stock = serializers.SerializerMethodField()
     price = serializers.SerializerMethodField()
 
+    def get_quantity_in_stock(self, obj: Product):
+        return obj.get_available_stock()
+
     def get_price(self, obj: Product):
-        return "{:.2f}".format(obj.get_current_price())
+        price = obj.get_current_price()
+        if price is None:
+            return None
+        return "{:.2f}".format(price)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'quantity_in_stock', 'price']
\ No newline at end of file
+        fields = ['id', 'name', 'quantity_in_stock', 'price']
+
+class CatalogueEntrySerializer(serializers.ModelSerializer):
+    """Serializes catalogue read model entries, with the same output as `ProductSerializer`."""
+    id = serializers.IntegerField(source='product_id')
+    price = serializers.SerializerMethodField()
+
+    def get_price(self, obj: CatalogueEntry):
+        return "{:.2f}".format(obj.price)
+
+    class Meta:
+        model = CatalogueEntry
+        fields = ['id', 'name', 'quantity_in_stock', 'price']
+
+
+class CatalogueEntryRowSerializer:
+    """A fast equivalent of `CatalogueEntrySerializer`, with the same output.
+
+    It serializes rows selected with `select`, which are named tuples read straight from the database, rather than model
+    instances. Each entry's representation is built directly, rather than through DRF's fields, which is several times
+    faster for a page of entries. Like a DRF serializer, its output is `data`.
+    """
+    fields = ('product_id', 'name', 'quantity_in_stock', 'price')
+
+    def __init__(self, rows, many=True, context=None):
+        self.rows = rows
+
+    @classmethod
+    def select(cls, queryset):
+        return queryset.values_list(*cls.fields, named=True)
+
+    @staticmethod
+    def to_representation(row):
+        return {
+            'id': row.product_id,
+            'name': row.name,
+            'quantity_in_stock': row.quantity_in_stock,
+            'price': "{:.2f}".format(row.price),
+        }
+
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.rows]
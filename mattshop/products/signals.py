@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from mattshop.products.cache import catalogue_changed
+from mattshop.products.models import CatalogueTombstone, Product, ProductPrice
+from mattshop.products.operations import refresh_catalogue
+
+
+@receiver(post_save, sender=Product)
+def refresh_catalogue_for_product(sender, instance, raw=False, **kwargs):
+    """Keep the catalogue read model in step with edits to a product."""
+    if raw:
+        return  # e.g. loaddata - run the refresh_catalogue command afterwards
+    refresh_catalogue([instance.id])
+
+
+@receiver(post_save, sender=ProductPrice)
+def refresh_catalogue_for_price(sender, instance, raw=False, **kwargs):
+    """Keep the catalogue read model in step with edits to prices already in effect.
+
+    Future-dated prices are picked up by `activate_scheduled_prices` once they come into effect, but still change the
+    catalogue version, as they may bring forward when cached catalogue pages need to expire.
+    """
+    if raw:
+        return
+    if instance.effective_from > datetime.now():
+        catalogue_changed()
+        return
+    refresh_catalogue([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductPrice)
+def refresh_catalogue_for_deleted_price(sender, instance, **kwargs):
+    """Keep the catalogue read model in step with deleted prices.
+
+    This waits until the deletion commits, as prices are also deleted when their product is. Refreshing straight away
+    would recreate the product's catalogue entry just before the product itself is deleted.
+    """
+    product_id = instance.product_id
+    transaction.on_commit(lambda: refresh_catalogue([product_id]))
+
+
+@receiver(post_delete, sender=Product)
+def record_deleted_product(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted product, as its catalogue entry is deleted with it."""
+    CatalogueTombstone.objects.update_or_create(product_id=instance.id, defaults={'updated_at': datetime.now()})
@@ -1,8 +1,10 @@
 from django.urls import path
 
-from mattshop.products.views import ProductListView
+from mattshop.products.views import ProductChangesView, ProductListView, product_export
 
 
 urlpatterns = [
     path('list/', ProductListView.as_view(), name='product-list-view'),
+    path('export/', product_export, name='product-export'),
+    path('changes/', ProductChangesView.as_view(), name='product-changes-view'),
 ]
@@ -1,11 +1,168 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+from rest_framework import status
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from mattshop.async_api import async_api_view, render
+from mattshop.metrics import TimedListMixin, phase
+from mattshop.pagination import KeysetOrPageNumberPagination
+from mattshop.products import changes, export
+from mattshop.products.cache import (
+    acatalogue_cache_timeout, aget_catalogue_version, catalogue_cache_timeout, get_catalogue_version
+)
+from mattshop.products.models import CatalogueEntry
+from mattshop.products.serializers import CatalogueEntryRowSerializer
+from mattshop.routers import reading_from_replica, replica_reads
+
+
+class ProductPagination(KeysetOrPageNumberPagination):
+    ordering = ('name', 'product_id')
+
+
+def etag_matches(request, etag):
+    return etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+
+
+def page_cache_key(request, version):
+    return 'catalogue:page:{}:{}'.format(version, request.build_absolute_uri())
+
+
+def page_cache_timeout(timeout):
+    """Caps how long a page is cached for if it was read from a replica.
+
+    A replica may not have caught up with the latest catalogue version yet, so its pages are only cached for as long as
+    replicas are expected to lag (`REPLICA_STICKY_SECONDS`), rather than for the whole of the version.
+    """
+    if reading_from_replica():
+        return min(timeout, settings.REPLICA_STICKY_SECONDS)
+    return timeout
+
+
+class ProductListView(TimedListMixin, ListAPIView):
+    """Lists the product catalogue, served from the `CatalogueEntry` read model.
+
+    Pages are cached against the catalogue version, which also serves as the ETag for conditional requests. Any change
+    to the catalogue moves to a new version, so nothing is served stale.
+    """
+    queryset = CatalogueEntryRowSerializer.select(CatalogueEntry.objects.listable())
+    serializer_class = CatalogueEntryRowSerializer
+    pagination_class = ProductPagination
+    permission_classes = [AllowAny]
+
+    def list(self, request, *args, **kwargs):
+        version = get_catalogue_version()
+        etag = '"{}"'.format(version)
+
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache_key = page_cache_key(request, version)
+            data = cache.get(cache_key)
+            if data is None:
+                with replica_reads():
+                    data = super().list(request, *args, **kwargs).data
+                    timeout = page_cache_timeout(catalogue_cache_timeout())
+                cache.set(cache_key, data, timeout=timeout)
+            response = Response(data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)  # clients may store pages, but must revalidate them
+        return response
+
+
+@async_api_view(authenticated=False)
+async def product_list_async(request):
+    """An async equivalent of `ProductListView`, for serving under ASGI. It shares the same cached pages."""
+    version = await aget_catalogue_version()
+    etag = '"{}"'.format(version)
+
+    if etag_matches(request, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        cache_key = page_cache_key(request, version)
+        data = await cache.aget(cache_key)
+        if data is None:
+            pagination = ProductPagination()
+            with replica_reads():
+                page = await pagination.apaginate_queryset(
+                    CatalogueEntryRowSerializer.select(CatalogueEntry.objects.listable()), request
+                )
+                timeout = page_cache_timeout(await acatalogue_cache_timeout())
+            with phase('serialization'):
+                data = pagination.get_paginated_response(CatalogueEntryRowSerializer(page).data).data
+            await cache.aset(cache_key, data, timeout=timeout)
+        response = render(data)
+
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+class ProductChangesView(APIView):
+    """Lists catalogue entries changed since the watermark given as `?since=`, or every entry if there isn't one.
+
+    Clients apply the `changes` and `removed` products to their copy of the catalogue, then pass the returned
+    `watermark` next time. While `more` is true, they should fetch the next response straight away. See
+    `mattshop.products.changes`.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            with replica_reads():
+                data = changes.catalogue_changes(request.query_params.get('since') or None)
+        except changes.InvalidWatermark:
+            return Response({'detail': 'Invalid watermark'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+
+def export_response(request, export_format, etag, stream):
+    """The response to an export request, streaming the export from `stream` (`export.stream` or `export.astream`)."""
+    if export_format not in export.CONTENT_TYPES:
+        formats = ', '.join(export.CONTENT_TYPES)
+        detail = 'Unsupported format "{}" - use one of {}.'.format(export_format, formats)
+        return render({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+
+    if etag_matches(request, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        gzip = export.accepts_gzip(request)
+        response = StreamingHttpResponse(stream(export_format, gzip), content_type=export.CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="catalogue.{}"'.format(export_format)
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        # taken before the export is read, so syncing changes from it (see `ProductChangesView`) misses nothing
+        response['Catalogue-Watermark'] = changes.encode_watermark(datetime.now())
+
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_safe
+def product_export(request):
+    """Streams the whole catalogue as NDJSON (the default) or CSV (`?format=csv`), gzipped if the client accepts it.
 
-from mattshop.products.models import Product
-from mattshop.products.serializers import ProductSerializer
+    The catalogue version serves as a (weak) ETag, as for `ProductListView`, so clients can cheaply check whether their
+    copy is up to date. Nothing is read until the response streams.
+    """
+    export_format = request.GET.get('format', export.NDJSON)
+    etag = 'W/"{}"'.format(get_catalogue_version())
+    return export_response(request, export_format, etag, export.stream)
 
 
-class ProductListView(ListAPIView):
-    queryset = Product.objects.filter(enabled=True, quantity_in_stock__gt=0)
-    serializer_class = ProductSerializer
-    permission_classes = [AllowAny]
\ No newline at end of file
+@require_safe
+async def product_export_async(request):
+    """An async equivalent of `product_export`, for serving under ASGI, which streams without holding a thread."""
+    export_format = request.GET.get('format', export.NDJSON)
+    etag = 'W/"{}"'.format(await aget_catalogue_version())
+    return export_response(request, export_format, etag, export.astream)
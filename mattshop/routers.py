@@ -0,0 +1,71 @@
+"""Routing of reads to read replicas.
+
+Reads only go to a replica where a view has opted in with `replica_reads`, as replicas lag slightly behind the primary.
+Everything else, including every write, uses the primary (`default`) database.
+
+Users who have just written something are pinned to the primary for `REPLICA_STICKY_SECONDS` (see `pin_to_primary`), so
+that e.g. an order they've just placed appears in their order history straight away. Pins are held in the cache, so
+are shared by every process.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+PRIMARY = 'default'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_key(user_id):
+    return 'db:pin:{}'.format(user_id)
+
+
+def pin_to_primary(user_id):
+    """Sends a user's reads to the primary for the next `REPLICA_STICKY_SECONDS`."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(pin_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user is not None and user.is_authenticated and cache.get(pin_key(user.pk)) is not None
+
+
+@contextmanager
+def replica_reads(user=None):
+    """Sends reads made within this block to a replica, unless `user` is pinned to the primary.
+
+    This uses a context variable, so applies to the current thread or async task only.
+    """
+    if not settings.DATABASE_REPLICAS or is_pinned_to_primary(user):
+        yield
+        return
+
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replica():
+    return _replica_reads.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY  # replicas are migrated by replication
@@ -34,13 +34,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mattshop.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
 ]
 
-ROOT_URLCONF = 'mattshop.urls'
+# ASGI serves mattshop.asgi_urls instead, with async read endpoints - see mattshop.asgi
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'mattshop.urls')
 
 TEMPLATES = []
 
@@ -57,9 +59,110 @@ DATABASES = {
         'HOST': os.environ.get('POSTGRES_HOST'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'PORT': os.environ.get('POSTGRES_PORT', 5432),
+        # keep connections open between requests for this many seconds (0 closes them after each request), checking
+        # they still work before reusing them
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
 
+# With DB_POOL, each process keeps a pool of connections (psycopg_pool), which each request borrows from. The pool
+# checks connections before lending them out, and replaces any that have been closed. Pooled connections are managed by
+# the pool, so CONN_MAX_AGE doesn't apply.
+DB_POOL = os.environ.get('DB_POOL', '').lower() in ('1', 'true', 'yes')
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),  # how long a request waits for a free connection
+    }
+
+# With DB_PGBOUNCER, connections go via pgbouncer in transaction pooling mode, where consecutive transactions on the
+# same connection may run on different servers. Server-side cursors and prepared statements don't survive that, so are
+# disabled. Transactions themselves (such as order placement, with its row locks) run on a single server as normal.
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+if DB_PGBOUNCER:
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+# Read replicas, as a comma-separated list of hosts, added as replica1, replica2, etc. Their database name defaults to
+# the primary's. Some read-only endpoints read from a replica (see mattshop.routers), except for users who have written
+# in the last REPLICA_STICKY_SECONDS, whose reads stick to the primary so they see their own writes.
+DATABASE_REPLICAS = []
+for i, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica{}'.format(i + 1)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        NAME=os.environ.get('POSTGRES_REPLICA_DB', DATABASES['default']['NAME']),
+        OPTIONS=dict(DATABASES['default']['OPTIONS']),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['mattshop.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Locally this is per-process memory. Anything running more than one worker process should use a shared cache, so
+# that catalogue versions (and so cached pages) are invalidated across all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Upper bound (in seconds) on how long a rendered catalogue page is cached for. Pages are also invalidated whenever the
+# catalogue changes, and never cached past the point the next scheduled price comes into effect.
+CATALOGUE_CACHE_TIMEOUT = int(os.environ.get('CATALOGUE_CACHE_TIMEOUT', 300))
+
+# How far back (in seconds) before a client's watermark `/products/changes/` looks for changes, to catch entries whose
+# changes committed (or reached the replica read from) after the watermark was issued, and for clock skew between
+# servers. It should exceed the longest catalogue write transaction and the replica lag.
+CATALOGUE_CHANGES_OVERLAP = int(os.environ.get('CATALOGUE_CHANGES_OVERLAP', 60))
+# The most changes returned by one `/products/changes/` response - clients follow the watermark for the rest.
+CATALOGUE_CHANGES_LIMIT = int(os.environ.get('CATALOGUE_CHANGES_LIMIT', 1000))
+
+
+# Orders
+# How stock is allocated to orders - 'pessimistic' locks products before checking their stock, 'optimistic' deducts
+# stock with a conditional update, without locking first. See mattshop.orders.operations.create_order.
+ORDER_STOCK_ALLOCATION = os.environ.get('ORDER_STOCK_ALLOCATION', 'pessimistic')
+
+# How many times to attempt an order transaction which fails due to a deadlock or serialization failure, and the base
+# delay (in seconds) to back off for between attempts.
+ORDER_RETRY_ATTEMPTS = int(os.environ.get('ORDER_RETRY_ATTEMPTS', 3))
+ORDER_RETRY_BACKOFF = float(os.environ.get('ORDER_RETRY_BACKOFF', 0.01))
+
+# Whether to group concurrent orders into shared transactions - see mattshop.orders.group_commit. Orders arriving within
+# ORDER_GROUP_COMMIT_WINDOW seconds of one another are placed together, in batches of up to
+# ORDER_GROUP_COMMIT_MAX_BATCH_SIZE.
+ORDER_GROUP_COMMIT = os.environ.get('ORDER_GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+ORDER_GROUP_COMMIT_WINDOW = float(os.environ.get('ORDER_GROUP_COMMIT_WINDOW', 0.005))
+ORDER_GROUP_COMMIT_MAX_BATCH_SIZE = int(os.environ.get('ORDER_GROUP_COMMIT_MAX_BATCH_SIZE', 50))
+# The most seconds any one statement of a group-commit batch may take, e.g. waiting for a lock, before it's cancelled.
+ORDER_GROUP_COMMIT_STATEMENT_TIMEOUT = float(os.environ.get('ORDER_GROUP_COMMIT_STATEMENT_TIMEOUT', 5))
+
+# Whether orders are always submitted asynchronously, to be placed by the process_pending_orders worker. Otherwise,
+# clients can opt in per request with a `Prefer: respond-async` header.
+ORDER_ASYNC_SUBMISSION = os.environ.get('ORDER_ASYNC_SUBMISSION', '').lower() in ('1', 'true', 'yes')
+
+# The most orders that can be placed in one request to the bulk order endpoint, which are placed in one transaction
+ORDER_BULK_MAX_ORDERS = int(os.environ.get('ORDER_BULK_MAX_ORDERS', 500))
+
+# Orders are stored in monthly partitions - see mattshop.orders.partitions. create_order_partitions keeps partitions
+# created ORDER_PARTITION_MONTHS_AHEAD months ahead of the current month, and archive_order_partitions archives months
+# more than ORDER_ARCHIVE_AFTER_MONTHS before the current month to files in ORDER_ARCHIVE_DIR.
+ORDER_PARTITION_MONTHS_AHEAD = int(os.environ.get('ORDER_PARTITION_MONTHS_AHEAD', 3))
+ORDER_ARCHIVE_AFTER_MONTHS = int(os.environ.get('ORDER_ARCHIVE_AFTER_MONTHS', 12))
+ORDER_ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -80,9 +183,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Authenticated tokens are cached in each process, for up to AUTH_TOKEN_CACHE_TTL seconds, so that most requests don't
+# need to look their token up. With AUTH_TOKEN_CACHE_SHARED, lookups are also shared between processes via the cache.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_CACHE_SHARED = os.environ.get('AUTH_TOKEN_CACHE_SHARED', '').lower() in ('1', 'true', 'yes')
+
+# Signed access tokens (see mattshop.authentication.tokens) are valid for ACCESS_TOKEN_LIFETIME seconds. They are signed
+# with the first of ACCESS_TOKEN_SIGNING_KEYS (comma-separated), and verified with any of them, to allow key rotation.
+ACCESS_TOKEN_LIFETIME = int(os.environ.get('ACCESS_TOKEN_LIFETIME', 300))
+ACCESS_TOKEN_SIGNING_KEYS = os.environ.get('ACCESS_TOKEN_SIGNING_KEYS', SECRET_KEY).split(',')
+
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.TokenAuthentication'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'mattshop.authentication.authentication.CachedTokenAuthentication',
+        'mattshop.authentication.authentication.SignedTokenAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'mattshop.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -100,6 +221,12 @@ USE_I18N = True
 USE_TZ = False
 
 
+# Static files (CSS, JavaScript, Images), e.g. for DRF's browsable API
+# https://docs.djangoproject.com/en/5.0/howto/static-files/
+
+STATIC_URL = 'static/'
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
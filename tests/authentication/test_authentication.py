@@ -0,0 +1,84 @@
+import time
+
+from django.contrib.auth.models import User
+from django.test import Client
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from mattshop.authentication.authentication import TokenCache, token_cache
+
+import pytest
+
+
+def get_history(token):
+    return Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+@pytest.mark.django_db
+def test_cached_token_authentication(django_assert_num_queries):
+    user = User.objects.create_user(username='test')
+    token = Token.objects.create(user=user)
+    get_history(token)
+
+    # just the count of (no) orders - the token is already cached
+    with django_assert_num_queries(1):
+        resp = get_history(token)
+    assert resp.status_code == status.HTTP_200_OK
+    assert token_cache.stats()['hits'] == 1
+    assert token_cache.stats()['misses'] == 1
+
+
+@pytest.mark.django_db
+def test_deleted_token_uncached():
+    user = User.objects.create_user(username='test')
+    token = Token.objects.create(user=user)
+    assert get_history(token).status_code == status.HTTP_200_OK
+
+    token.delete()
+    assert get_history(token).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_deactivated_user_uncached():
+    user = User.objects.create_user(username='test')
+    token = Token.objects.create(user=user)
+    assert get_history(token).status_code == status.HTTP_200_OK
+
+    user.is_active = False
+    user.save()
+    assert get_history(token).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_token_cache_lru():
+    cache = TokenCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_token_cache_ttl(monkeypatch):
+    cache = TokenCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    now = time.monotonic()
+    monkeypatch.setattr('mattshop.authentication.authentication.time.monotonic', lambda: now + 61)
+
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_token_cache_shared():
+    cache = TokenCache(max_size=2, ttl=60, shared=True)
+    cache.set('a', 1)
+    other_process_cache = TokenCache(max_size=2, ttl=60, shared=True)
+
+    assert other_process_cache.get('a') == 1
+    assert other_process_cache.stats()['shared_hits'] == 1
+
+    cache.delete('a')
+    assert TokenCache(max_size=2, ttl=60, shared=True).get('a') is None
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from mattshop.orders.models import Order, OrderItem, OrderSummary
+from mattshop.products.models import CatalogueEntry, Product, ProductPrice
+
+import pytest
+
+
+def generate(seed='test', **options):
+    call_command(
+        'generate_data',
+        users=20, products=30, orders=200, chunk_size=40, seed=seed, prefix='gen', until=datetime(2026, 1, 1),
+        **options,
+    )
+
+
+def snapshot():
+    """The generated data, without the ids, which depend on the database's sequences rather than the seed."""
+    return {
+        'tokens': sorted(Token.objects.values_list('user__username', 'key')),
+        'prices': sorted(ProductPrice.objects.values_list('product__name', 'price', 'effective_from')),
+        'products': sorted(Product.objects.values_list('name', 'enabled', 'quantity_in_stock')),
+        'orders': sorted(Order.objects.values_list('user__username', 'total_price', 'created_at')),
+        'items': sorted(OrderItem.objects.values_list(
+            'order__user__username', 'order__created_at', 'product_name', 'product_price', 'quantity'
+        )),
+    }
+
+
+def clear():
+    Order.objects.all().delete()
+    Product.objects.all().delete()
+    User.objects.all().delete()
+
+
+@pytest.mark.django_db
+def test_generate_data():
+    generate()
+
+    assert User.objects.count() == Token.objects.count() == 20
+    assert Product.objects.count() == CatalogueEntry.objects.count() == 30
+    assert ProductPrice.objects.count() == 90
+    assert Order.objects.count() == 200
+    assert sum(OrderSummary.objects.values_list('order_count', flat=True)) == 200
+    for order in Order.objects.prefetch_related('items')[:20]:
+        assert 1 <= len(order.items.all()) <= 5
+        assert order.total_price == sum(item.product_price * item.quantity for item in order.items.all())
+
+    resp = Client().post('/auth/login/', {'username': 'gen0', 'password': 'loadtest'})
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json()['token'] == Token.objects.get(user__username='gen0').key
+
+
+@pytest.mark.django_db
+def test_generate_data_deterministic():
+    generate()
+    first = snapshot()
+    clear()
+
+    generate()
+    assert snapshot() == first
+
+    clear()
+    generate(seed='other')
+    assert snapshot()['tokens'] != first['tokens']
@@ -0,0 +1,120 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.test import Client, override_settings
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from mattshop.authentication.authentication import SignedTokenAuthentication
+from mattshop.authentication.tokens import InvalidAccessToken, issue_access_token, verify_access_token
+from mattshop.orders.models import Order
+from mattshop.products.factories import ProductFactory
+
+import pytest
+
+
+def login():
+    User.objects.create_user(username='test', password='thisismypassword')
+    resp = Client().post('/auth/login/', json.dumps({
+        'username': 'test',
+        'password': 'thisismypassword'
+    }), content_type='application/json')
+    return json.loads(resp.content)
+
+
+@pytest.mark.django_db
+def test_login_issues_access_token(django_assert_num_queries):
+    tokens = login()
+    assert tokens['token'] == Token.objects.get().key
+    assert tokens['expires_in'] == 300
+
+    # just the count of (no) orders - there's no authentication query
+    with django_assert_num_queries(1):
+        resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}')
+    assert resp.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_access_token_places_order():
+    tokens = login()
+    product = ProductFactory(quantity_in_stock=1)
+    resp = Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': product.id, 'quantity': 1}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}')
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert Order.objects.get().user == User.objects.get()
+
+
+@pytest.mark.django_db
+def test_access_token_user_read_only():
+    tokens = login()
+    user = User.objects.get()
+    user.is_staff = True
+    user.save()
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}')
+    access_token_user, _ = SignedTokenAuthentication().authenticate(request)
+
+    assert access_token_user.pk == user.pk
+    assert not access_token_user.is_staff
+    for method in (access_token_user.save, access_token_user.delete):
+        with pytest.raises(NotImplementedError):
+            method()
+    # the real user is untouched
+    assert User.objects.get().username == 'test'
+    assert Client().get(
+        '/healthcheck/database/', HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}'
+    ).status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('header', ['Bearer nonsense', 'Bearer', 'Bearer a b'])
+def test_invalid_access_token(header):
+    resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=header)
+    assert resp.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_refresh_access_token():
+    tokens = login()
+    resp = Client().post('/auth/token/refresh/', json.dumps({
+        'refresh_token': tokens['token']
+    }), content_type='application/json')
+    access_token = json.loads(resp.content)['access_token']
+
+    assert verify_access_token(access_token) == User.objects.get().id
+
+
+@pytest.mark.django_db
+def test_refresh_access_token_inactive_user():
+    tokens = login()
+    User.objects.update(is_active=False)
+    resp = Client().post('/auth/token/refresh/', json.dumps({
+        'refresh_token': tokens['token']
+    }), content_type='application/json')
+
+    assert resp.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_access_token_expires():
+    user = User(pk=1)
+    token, lifetime = issue_access_token(user, now=time.time() - 301)
+
+    with pytest.raises(InvalidAccessToken):
+        verify_access_token(token)
+
+
+def test_access_token_key_rotation():
+    user = User(pk=1)
+    with override_settings(ACCESS_TOKEN_SIGNING_KEYS=['old']):
+        token, _ = issue_access_token(user)
+
+    with override_settings(ACCESS_TOKEN_SIGNING_KEYS=['new', 'old']):
+        assert verify_access_token(token) == 1
+
+    with override_settings(ACCESS_TOKEN_SIGNING_KEYS=['new']):
+        with pytest.raises(InvalidAccessToken):
+            verify_access_token(token)
@@ -0,0 +1,29 @@
+import pytest
+
+from django.core.cache import cache
+
+from mattshop.authentication.authentication import token_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """The cache outlives each test's database transaction, so clear it to stop cached data leaking between tests."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """Likewise for the in-process cache of authenticated tokens."""
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def read_from_primary(request, settings):
+    """Only the primary connection sees each test's uncommitted data, so read replicas are only used by tests of
+    them."""
+    if 'replica' not in request.keywords:
+        settings.DATABASE_REPLICAS = []
@@ -0,0 +1,50 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import Client
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from mattshop.healthcheck.views import connection_stats
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_database_stats():
+    user = get_user_model().objects.create_user(username='test', is_staff=True)
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().get('/healthcheck/database/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_200_OK
+    stats = json.loads(resp.content)
+    assert stats['mode'] == connection_stats(connection)['mode']
+    assert stats['conn_health_checks'] is True
+
+
+@pytest.mark.django_db
+def test_database_stats_requires_staff():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().get('/healthcheck/database/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pooled_connection_stats():
+    settings_dict = dict(connection.settings_dict, CONN_MAX_AGE=0, OPTIONS={'pool': {'min_size': 1, 'max_size': 2}})
+    pooled_connection = type(connections['default'])(settings_dict, alias='pooled')
+    try:
+        with pooled_connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        stats = connection_stats(pooled_connection)
+        assert stats['mode'] == 'pool'
+        assert stats['pool']['pool_max'] == 2
+        assert stats['pool']['requests_num'] >= 1
+    finally:
+        pooled_connection.close()
+        pooled_connection.close_pool()
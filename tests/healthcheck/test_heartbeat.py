@@ -1,8 +1,17 @@
-from django.test import Client
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client
 
 from rest_framework import status
 
+import pytest
+
 
 def test_heartbeat():
     resp = Client().get('/healthcheck/heartbeat/')
     assert resp.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.urls('mattshop.asgi_urls')
+def test_heartbeat_async():
+    resp = async_to_sync(AsyncClient().get)('/healthcheck/heartbeat/')
+    assert resp.status_code == status.HTTP_200_OK
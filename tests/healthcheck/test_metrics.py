@@ -0,0 +1,143 @@
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, override_settings
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from mattshop.metrics import Histogram, measure, request_duration, request_queries
+from mattshop.orders import group_commit
+from mattshop.orders.group_commit import OrderBatcher, get_order_batcher
+from mattshop.orders.operations import OPTIMISTIC, create_order
+from mattshop.products.factories import ProductFactory
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_histograms():
+    request_duration.clear()
+    request_queries.clear()
+
+
+def get_metrics(is_staff=True):
+    user = get_user_model().objects.create_user(username='scraper', is_staff=is_staff)
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client().get(
+        '/healthcheck/metrics/', HTTP_AUTHORIZATION=f'Token {token.key}',
+        # as Prometheus sends it
+        HTTP_ACCEPT='application/openmetrics-text;version=1.0.0,text/plain;version=0.0.4;q=0.5,*/*;q=0.1',
+    )
+
+
+def server_timing(resp):
+    return {
+        metric.split(';')[0]: metric.split(';')[1] for metric in resp['Server-Timing'].split(', ')
+    }
+
+
+@pytest.mark.django_db
+def test_server_timing():
+    ProductFactory(quantity_in_stock=1)
+    resp = Client().get('/products/list/')
+
+    timings = server_timing(resp)
+    assert set(timings) == {'total', 'db', 'lock_wait', 'serialization', 'queries'}
+    assert float(timings['total'][len('dur='):]) > 0
+    assert timings['queries'] == 'desc="3"'
+
+
+@pytest.mark.django_db
+def test_server_timing_lock_wait():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=1)
+    resp = Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': product.id, 'quantity': 1}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert float(server_timing(resp)['lock_wait'][len('dur='):]) > 0
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(ORDER_GROUP_COMMIT=True)
+def test_server_timing_group_commit(monkeypatch):
+    monkeypatch.setattr(group_commit, '_order_batcher', OrderBatcher(max_batch_size=10, window=0.01))
+    # so the batcher's connection is closed after each batch, rather than kept open beyond the test
+    monkeypatch.setitem(connection.settings_dict, 'CONN_MAX_AGE', 0)
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=1)
+    resp = Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': product.id, 'quantity': 1}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    # the order was placed on the batcher's thread, but its queries are still the request's
+    assert resp.status_code == status.HTTP_201_CREATED
+    timings = server_timing(resp)
+    assert float(timings['lock_wait'][len('dur='):]) > 0
+    assert float(timings['db'][len('dur='):]) >= float(timings['lock_wait'][len('dur='):])
+
+
+@pytest.mark.django_db
+def test_measure():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=1)
+    with measure() as metrics:
+        create_order(user, [{'product_id': product.id, 'quantity': 1}], allocation=OPTIMISTIC)
+
+    assert metrics.db_queries > 0
+    # the optimistic strategy's conditional stock update
+    assert 0 < metrics.lock_wait <= metrics.db_time
+    assert metrics.deadlocks == metrics.serialization_failures == 0
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint():
+    Client().get('/products/list/')
+    Client().get('/healthcheck/heartbeat/')
+    resp = get_metrics()
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp['Content-Type'].startswith('text/plain')
+    metrics = resp.content.decode()
+    assert 'mattshop_request_phase_seconds_count{view="ProductListView",phase="total"} 1' in metrics
+    assert 'mattshop_request_phase_seconds_count{view="heartbeat",phase="total"} 1' in metrics
+    assert 'mattshop_request_db_queries_bucket{view="heartbeat",le="0"} 1' in metrics
+    assert re.search(r'^mattshop_auth_token_cache_hits_total \d+$', metrics, re.MULTILINE)
+
+
+@pytest.mark.django_db
+@override_settings(ORDER_GROUP_COMMIT=True)
+def test_metrics_endpoint_group_commit(monkeypatch):
+    monkeypatch.setattr(get_order_batcher(), 'batch_sizes', {1: 2, 7: 1})
+    metrics = get_metrics().content.decode()
+
+    assert 'mattshop_order_group_commit_batch_size_bucket{le="1"} 2' in metrics
+    assert 'mattshop_order_group_commit_batch_size_bucket{le="10"} 3' in metrics
+    assert 'mattshop_order_group_commit_batch_size_sum 9' in metrics
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_requires_staff():
+    assert Client().get('/healthcheck/metrics/').status_code == status.HTTP_401_UNAUTHORIZED
+    assert get_metrics(is_staff=False).status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_histogram():
+    histogram = Histogram('test', "A test histogram.", ('view',), (1, 5))
+    histogram.observe(0.5, 'a')
+    histogram.observe(3, 'a', count=2)
+
+    assert histogram.expose().splitlines() == [
+        '# HELP test A test histogram.',
+        '# TYPE test histogram',
+        'test_bucket{view="a",le="1"} 1',
+        'test_bucket{view="a",le="5"} 3',
+        'test_bucket{view="a",le="+Inf"} 3',
+        'test_sum{view="a"} 6.5',
+        'test_count{view="a"} 3',
+    ]
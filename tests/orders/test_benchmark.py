@@ -0,0 +1,46 @@
+from django.db import connection
+
+from mattshop.orders.benchmark import HOT, SPREAD, run_benchmark
+from mattshop.orders.models import Order
+from mattshop.orders.operations import OPTIMISTIC, PESSIMISTIC
+from mattshop.products.models import Product
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def close_connections(monkeypatch):
+    # the clients' threads close their connections once they're done, so none are left open when the test database
+    # is torn down
+    monkeypatch.setitem(connection.settings_dict, 'CONN_MAX_AGE', 0)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('allocation', [PESSIMISTIC, OPTIMISTIC])
+@pytest.mark.parametrize('workload', [HOT, SPREAD])
+def test_benchmark_doesnt_oversell(workload, allocation):
+    result = run_benchmark(workload=workload, clients=6, orders=5, allocation=allocation, products=3)
+
+    assert result['orders'] == 30
+    assert result['errors'] == 0
+    assert result['stock']['consistent']
+    # demand outstrips stock, so products sell out
+    assert result['stock']['final'] < result['stock']['initial']
+    assert result['failed'] > 0
+    assert result['latency_ms']['p50'] <= result['latency_ms']['p99'] <= result['latency_ms']['max']
+
+    # everything the benchmark created is deleted
+    assert not Order.objects.exists()
+    assert not Product.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_through_api(live_server):
+    result = run_benchmark(workload=HOT, clients=4, orders=5, url=live_server.url)
+
+    assert result['target'] == live_server.url
+    assert result['orders'] == 20
+    assert result['placed'] == 10
+    assert result['errors'] == 0
+    assert result['stock']['consistent']
+    assert result['mean_lock_wait_ms'] > 0
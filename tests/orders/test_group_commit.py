@@ -0,0 +1,146 @@
+import threading
+from concurrent.futures import TimeoutError
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, transaction
+from django.test import override_settings
+
+from mattshop.products.factories import ProductFactory
+from mattshop.orders import exceptions, group_commit
+from mattshop.orders.group_commit import OrderBatcher
+from mattshop.orders.models import Order
+from mattshop.orders.operations import create_order, place_orders
+from mattshop.products.models import Product
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_place_batch():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=4, prices__price=2)
+    batcher = OrderBatcher(max_batch_size=10, window=0.01)
+    batch = [
+        (user, [{'product_id': product.id, 'quantity': quantity}], group_commit.Future(), None)
+        for quantity in (3, 3, 1)
+    ]
+
+    batcher.place_batch(batch)
+
+    assert isinstance(batch[0][2].result(), Order)
+    assert isinstance(batch[1][2].exception(), exceptions.OutOfStockOrderError)
+    assert isinstance(batch[2][2].result(), Order)
+    assert batcher.stats() == {'batches': 1, 'orders': 3, 'batch_sizes': {3: 1}}
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 0
+
+@pytest.mark.django_db
+@override_settings(ORDER_STOCK_ALLOCATION='optimistic')
+def test_place_batch_isolates_unexpected_errors():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=4, prices__price=2)
+    batcher = OrderBatcher(max_batch_size=10, window=0.01)
+    batch = [
+        (user, [{'product_id': product.id, 'quantity': quantity}], group_commit.Future(), None)
+        for quantity in (1, 2 ** 40, 1)  # the second is too large for the database
+    ]
+
+    batcher.place_batch(batch)
+
+    assert isinstance(batch[0][2].result(), Order)
+    assert isinstance(batch[1][2].exception(), exceptions.OrderError)
+    assert isinstance(batch[2][2].result(), Order)
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(ORDER_GROUP_COMMIT=True)
+def test_order_create_group_commit(monkeypatch):
+    batcher = OrderBatcher(max_batch_size=10, window=0.2)
+    monkeypatch.setattr(group_commit, '_order_batcher', batcher)
+    # so the batcher's connection is closed after each batch, rather than kept open beyond the test
+    monkeypatch.setitem(connection.settings_dict, 'CONN_MAX_AGE', 0)
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=4, prices__price=2)
+
+    results = []
+
+    def buyer():
+        try:
+            results.append(create_order(user, [{'product_id': product.id, 'quantity': 1}]))
+        except exceptions.OrderError as e:
+            results.append(e)
+        finally:
+            connection.close()
+
+    buyers = [threading.Thread(target=buyer) for _ in range(6)]
+    for thread in buyers:
+        thread.start()
+    for thread in buyers:
+        thread.join()
+
+    assert len([result for result in results if isinstance(result, Order)]) == 4
+    assert len([result for result in results if isinstance(result, exceptions.OutOfStockOrderError)]) == 2
+    # all of the orders arrived within the window, so were placed together
+    assert batcher.stats()['orders'] == 6
+    assert batcher.stats()['batches'] < 6
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 0
+
+
+def test_batcher_survives_failed_batch(monkeypatch):
+    batcher = OrderBatcher(max_batch_size=10, window=0.01)
+    error = RuntimeError("metrics unavailable")
+
+    def place_batch(batch):
+        raise error
+
+    monkeypatch.setattr(batcher, 'place_batch', place_batch)
+    futures = [batcher.submit(None, []) for _ in range(2)]
+    for future in futures:
+        assert future.exception(timeout=5) is error
+
+    thread = batcher._thread
+    assert batcher.submit(None, []).exception(timeout=5) is error
+    assert batcher._thread is thread  # still running
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(ORDER_GROUP_COMMIT=True)
+def test_order_create_group_commit_timeout(monkeypatch):
+    batcher = OrderBatcher(max_batch_size=10, window=0.01)
+    placing = threading.Event()
+    monkeypatch.setattr(batcher, 'place_batch', lambda batch: placing.wait(5))
+    monkeypatch.setattr(group_commit, '_order_batcher', batcher)
+    monkeypatch.setattr(group_commit, 'result_timeout', lambda: 0.1)
+
+    try:
+        with pytest.raises(TimeoutError):
+            create_order(get_user_model().objects.create_user(username='test'), [])
+    finally:
+        placing.set()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_place_orders_statement_timeout():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=4, prices__price=2)
+    locked, release = threading.Event(), threading.Event()
+
+    def lock_product():
+        try:
+            with transaction.atomic():
+                Product.objects.select_for_update().get(id=product.id)
+                locked.set()
+                release.wait(5)
+        finally:
+            connection.close()
+
+    locker = threading.Thread(target=lock_product)
+    locker.start()
+    try:
+        locked.wait(5)
+        with pytest.raises(OperationalError):
+            place_orders([(user, [{'product_id': product.id, 'quantity': 1}])], statement_timeout=0.1)
+    finally:
+        release.set()
+        locker.join()
+    assert place_orders([(user, [{'product_id': product.id, 'quantity': 1}])], statement_timeout=0.1)[0].id
@@ -1,9 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from mattshop.products.factories import ProductFactory
-from mattshop.orders import exceptions
-from mattshop.orders.models import Order
-from mattshop.orders.operations import create_order
+from mattshop.orders import exceptions, operations
+from mattshop.orders.models import Order, PendingOrder
+from mattshop.orders.operations import create_order, process_pending_orders, submit_order
+from mattshop.products.models import CatalogueEntry, Product
+from mattshop.products.operations import enable_stock_sharding, refresh_catalogue
 
 import pytest
 
@@ -81,3 +86,279 @@ def test_order_create_view_some_out_of_stock():
 
     orders = Order.objects.filter(user=user)
     assert orders.count() == 0
+
+@pytest.mark.django_db
+def test_order_create_view_unpriced():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=2, prices=None)
+
+    with pytest.raises(exceptions.UnpricedProductOrderError):
+        create_order(user, [{'product_id': product.id, 'quantity': 1}])
+
+    orders = Order.objects.filter(user=user)
+    assert orders.count() == 0
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('allocation', [operations.PESSIMISTIC, operations.OPTIMISTIC])
+def test_order_create_updates_catalogue(allocation, django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=12, prices__price=50)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        create_order(user, [{'product_id': product.id, 'quantity': 3}], allocation=allocation)
+    # adjusted with the stock, so a refresh in between the order and its commit callbacks doesn't deduct it twice
+    assert CatalogueEntry.objects.get(product=product).quantity_in_stock == 9
+    refresh_catalogue([product.id])
+    for callback in callbacks:
+        callback()
+    assert CatalogueEntry.objects.get(product=product).quantity_in_stock == 9
+
+@pytest.mark.django_db
+def test_order_create_unknown_product():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=2)
+
+    with pytest.raises(exceptions.OrderError):
+        create_order(user, [
+            {'product_id': product.id, 'quantity': 1},
+            {'product_id': product.id + 1000, 'quantity': 1},
+        ])
+
+    orders = Order.objects.filter(user=user)
+    assert orders.count() == 0
+
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 2
+
+@pytest.mark.django_db
+def test_order_create_constant_queries():
+    """The number of queries made placing an order shouldn't depend on how many products are in it."""
+    user = get_user_model().objects.create_user(username='test')
+    products = [ProductFactory(quantity_in_stock=5) for _ in range(6)]
+
+    with CaptureQueriesContext(connection) as single_item_queries:
+        create_order(user, [{'product_id': products[0].id, 'quantity': 1}])
+    with CaptureQueriesContext(connection) as multiple_item_queries:
+        create_order(user, [{'product_id': product.id, 'quantity': 2} for product in products[1:]])
+
+    assert len(single_item_queries) == len(multiple_item_queries)
+    for product in products[1:]:
+        product.refresh_from_db()
+        assert product.quantity_in_stock == 3
+
+@pytest.mark.django_db
+def test_order_create_optimistic():
+    user = get_user_model().objects.create_user(username='test')
+    product1 = ProductFactory(quantity_in_stock=12, prices__price=12)
+    product2 = ProductFactory(quantity_in_stock=7, prices__price=15)
+
+    order = create_order(user, [
+        {'product_id': product1.id, 'quantity': 2},
+        {'product_id': product2.id, 'quantity': 1},
+    ], allocation=operations.OPTIMISTIC)
+
+    assert order.total_price == 39
+    product1.refresh_from_db()
+    assert product1.quantity_in_stock == 10
+    product2.refresh_from_db()
+    assert product2.quantity_in_stock == 6
+
+@pytest.mark.django_db
+def test_order_create_optimistic_some_out_of_stock():
+    user = get_user_model().objects.create_user(username='test')
+    product1 = ProductFactory(quantity_in_stock=1)
+    product2 = ProductFactory(quantity_in_stock=20)
+
+    with pytest.raises(exceptions.OutOfStockOrderError):
+        create_order(user, [
+            {'product_id': product1.id, 'quantity': 2},
+            {'product_id': product2.id, 'quantity': 1}
+        ], allocation=operations.OPTIMISTIC)
+
+    assert Order.objects.filter(user=user).count() == 0
+    product2.refresh_from_db()
+    assert product2.quantity_in_stock == 20
+
+class DeadlockDetected(Exception):
+    pgcode = '40P01'
+
+@pytest.mark.django_db
+@override_settings(ORDER_RETRY_ATTEMPTS=3, ORDER_RETRY_BACKOFF=0)
+def test_order_create_retries_deadlocks(monkeypatch):
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5)
+    place_order = operations._place_order_pessimistic
+    attempts = []
+
+    def deadlocking_place_order(*args):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OperationalError() from DeadlockDetected()
+        return place_order(*args)
+
+    monkeypatch.setattr(operations, '_place_order_pessimistic', deadlocking_place_order)
+    order = create_order(user, [{'product_id': product.id, 'quantity': 1}])
+
+    assert len(attempts) == 3
+    assert order.items.count() == 1
+
+@pytest.mark.django_db
+@override_settings(ORDER_RETRY_ATTEMPTS=2, ORDER_RETRY_BACKOFF=0)
+def test_order_create_gives_up_retrying(monkeypatch):
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5)
+
+    def deadlocking_place_order(*args):
+        raise OperationalError() from DeadlockDetected()
+
+    monkeypatch.setattr(operations, '_place_order_pessimistic', deadlocking_place_order)
+    with pytest.raises(OperationalError):
+        create_order(user, [{'product_id': product.id, 'quantity': 1}])
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('allocation', [operations.PESSIMISTIC, operations.OPTIMISTIC])
+def test_order_create_sharded_stock(allocation):
+    user = get_user_model().objects.create_user(username='test')
+    sharded_product = ProductFactory(quantity_in_stock=8, prices__price=10)
+    enable_stock_sharding(sharded_product.id, 4)
+    product = ProductFactory(quantity_in_stock=5, prices__price=1)
+
+    order = create_order(user, [
+        {'product_id': sharded_product.id, 'quantity': 3},
+        {'product_id': product.id, 'quantity': 1},
+    ], allocation=allocation)
+
+    assert order.total_price == 31
+    assert Product.objects.with_stock().get(id=sharded_product.id).available_stock == 5
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 4
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('allocation', [operations.PESSIMISTIC, operations.OPTIMISTIC])
+def test_order_create_sharded_stock_in_id_order(allocation, monkeypatch):
+    """Shards are allocated in product id order, so orders listing the same products differently can't deadlock."""
+    user = get_user_model().objects.create_user(username='test')
+    products = [ProductFactory(quantity_in_stock=8, prices__price=10) for _ in range(3)]
+    for product in products:
+        enable_stock_sharding(product.id, 2)
+    allocated = []
+    allocate = operations.allocate_sharded_stock
+
+    def recording_allocate(product_id, quantity):
+        allocated.append(product_id)
+        return allocate(product_id, quantity)
+
+    monkeypatch.setattr(operations, 'allocate_sharded_stock', recording_allocate)
+
+    create_order(user, [
+        {'product_id': product.id, 'quantity': 1} for product in reversed(products)
+    ], allocation=allocation)
+
+    assert allocated == [product.id for product in products]
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('allocation', [operations.PESSIMISTIC, operations.OPTIMISTIC])
+def test_order_create_sharded_stock_out_of_stock(allocation):
+    user = get_user_model().objects.create_user(username='test')
+    sharded_product = ProductFactory(quantity_in_stock=8)
+    enable_stock_sharding(sharded_product.id, 4)
+    product = ProductFactory(quantity_in_stock=5)
+
+    with pytest.raises(exceptions.OutOfStockOrderError):
+        create_order(user, [
+            {'product_id': sharded_product.id, 'quantity': 9},
+            {'product_id': product.id, 'quantity': 1},
+        ], allocation=allocation)
+
+    assert Order.objects.filter(user=user).count() == 0
+    assert Product.objects.with_stock().get(id=sharded_product.id).available_stock == 8
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 5
+
+@pytest.mark.django_db
+def test_place_orders():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+
+    results = operations.place_orders([
+        (user, [{'product_id': product.id, 'quantity': 3}]),
+        (user, [{'product_id': product.id, 'quantity': 3}]),
+        (user, [{'product_id': product.id, 'quantity': 2}]),
+    ])
+
+    assert isinstance(results[0], Order)
+    assert isinstance(results[1], exceptions.OutOfStockOrderError)
+    assert isinstance(results[2], Order)
+    assert Order.objects.filter(user=user).count() == 2
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 0
+
+@pytest.mark.django_db
+def test_place_orders_all_or_nothing():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+
+    results = operations.place_orders([
+        (user, [{'product_id': product.id, 'quantity': 3}]),
+        (user, [{'product_id': product.id, 'quantity': 3}]),
+        (user, [{'product_id': product.id, 'quantity': 2}]),
+    ], all_or_nothing=True)
+
+    assert all(isinstance(result, exceptions.OrderError) for result in results)
+    assert isinstance(results[1], exceptions.OutOfStockOrderError)
+    assert Order.objects.filter(user=user).count() == 0
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 5
+
+@pytest.mark.django_db
+def test_process_pending_orders():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    pending_orders = [submit_order(user, [{'product_id': product.id, 'quantity': quantity}]) for quantity in (3, 3, 2)]
+
+    assert process_pending_orders(2) == 2
+    assert process_pending_orders(2) == 1
+    assert process_pending_orders(2) == 0
+
+    statuses = [PendingOrder.objects.get(id=pending_order.id) for pending_order in pending_orders]
+    assert [pending_order.status for pending_order in statuses] == [
+        PendingOrder.PLACED, PendingOrder.FAILED, PendingOrder.PLACED
+    ]
+    assert statuses[0].order.total_price == 6
+    assert statuses[1].order is None
+    assert 'Insufficient stock' in statuses[1].message
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 0
+
+@pytest.mark.django_db
+def test_place_orders_isolates_unexpected_errors():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+
+    results = operations.place_orders([
+        (user, [{'product_id': product.id, 'quantity': 1}]),
+        # too large for the item's quantity column, so fails with a database error after the order is written
+        (user, [{'product_id': product.id, 'quantity': 2 ** 40}]),
+        (user, [{'product_id': product.id, 'quantity': 1}]),
+    ], allocation=operations.OPTIMISTIC)
+
+    assert isinstance(results[0], Order)
+    assert isinstance(results[1], exceptions.OrderError)
+    assert isinstance(results[2], Order)
+    assert Order.objects.filter(user=user).count() == 2
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 3
+
+
+@pytest.mark.django_db
+def test_process_pending_orders_invalid_quantity():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    # submitted directly, as it would fail validation through the API
+    pending_orders = [submit_order(user, [{'product_id': product.id, 'quantity': quantity}]) for quantity in (-1, 2)]
+
+    assert process_pending_orders(10) == 2
+    statuses = [PendingOrder.objects.get(id=pending_order.id) for pending_order in pending_orders]
+    assert [pending_order.status for pending_order in statuses] == [PendingOrder.FAILED, PendingOrder.PLACED]
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 3
@@ -0,0 +1,149 @@
+from datetime import date, datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from mattshop.orders.factories import OrderFactory
+from mattshop.orders.models import Order, OrderArchive, OrderItem, OrderSummary, PendingOrder
+from mattshop.orders.partitions import (
+    add_months, archive_partition, create_partitions, ensure_future_partitions, month_start, partition_months,
+    partition_name, read_archive,
+)
+from mattshop.orders.summaries import rebuild_order_summaries
+
+import pytest
+
+
+def order_at(user, created_at, total_price=10):
+    """An order (and its items) dated `created_at`, moved to the partition for then."""
+    order = OrderFactory(user=user, total_price=total_price)
+    with connection.cursor() as cursor:
+        # the order's items reference it by `(id, created_at)`, so are only consistent once both are moved
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        Order.objects.filter(id=order.id).update(created_at=created_at)
+        OrderItem.objects.filter(order=order).update(created_at=created_at)
+        # partitions can't be detached with checks pending, so they're made now
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    order.refresh_from_db()
+    return order
+
+
+def partition_count(model, month):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM {}'.format(partition_name(model, month)))
+        return cursor.fetchone()[0]
+
+
+def get(user, url):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client().get(url, HTTP_AUTHORIZATION='Token {}'.format(token.key))
+
+
+@pytest.mark.django_db
+def test_future_partitions(settings):
+    this_month = month_start(datetime.now())
+    months = partition_months()
+    assert [add_months(this_month, i) for i in range(4)] == months[-4:]
+
+    assert ensure_future_partitions() == []
+    settings.ORDER_PARTITION_MONTHS_AHEAD = 5
+    assert ensure_future_partitions() == [add_months(this_month, 4), add_months(this_month, 5)]
+    assert partition_months() == months + [add_months(this_month, 4), add_months(this_month, 5)]
+
+
+@pytest.mark.django_db
+def test_create_partition_moves_default_rows():
+    user = get_user_model().objects.create_user(username='test')
+    order = order_at(user, datetime(2031, 5, 2, 12))
+
+    assert create_partitions(datetime(2031, 4, 1), datetime(2031, 5, 31)) == [date(2031, 4, 1), date(2031, 5, 1)]
+    assert partition_count(Order, date(2031, 5, 1)) == 1
+    assert partition_count(OrderItem, date(2031, 5, 1)) == order.items.count() == 1
+    assert partition_count(Order, date(2031, 4, 1)) == 0
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM orders_order_default')
+        assert cursor.fetchone()[0] == 0
+    assert Order.objects.get(id=order.id).created_at == datetime(2031, 5, 2, 12)
+    # creating a partition which exists already does nothing
+    assert create_partitions(datetime(2031, 5, 1), datetime(2031, 5, 1)) == []
+
+
+@pytest.mark.django_db
+def test_archive_partition(tmp_path):
+    users = [get_user_model().objects.create_user(username='test{}'.format(i)) for i in range(2)]
+    create_partitions(datetime(2020, 1, 1), datetime(2020, 1, 1))
+    archived = [
+        order_at(users[0], datetime(2020, 1, 5), total_price=10),
+        order_at(users[0], datetime(2020, 1, 20), total_price=15),
+        order_at(users[1], datetime(2020, 1, 10), total_price=20),
+    ]
+    recent = OrderFactory(user=users[0], total_price=5)
+    pending = PendingOrder.objects.create(user=users[0], contents=[], status=PendingOrder.PLACED, order=archived[0])
+    rebuild_order_summaries()
+    history = get(users[0], '/orders/history/').json()['results']
+
+    archive = archive_partition(date(2020, 1, 1), str(tmp_path))
+    assert archive.order_count == 3
+    assert archive.path == str(tmp_path / 'orders-2020-01.ndjson.gz')
+    assert date(2020, 1, 1) not in partition_months()
+    assert list(Order.objects.values_list('id', flat=True)) == [recent.id]
+    assert not OrderItem.objects.filter(order__in=[order.id for order in archived]).exists()
+    pending.refresh_from_db()
+    assert pending.order_id is None
+
+    # the history served before archival, less the remaining order
+    assert list(read_archive(archive, users[0].id)) == history[1:]
+    assert [order['id'] for order in read_archive(archive, users[1].id)] == [archived[2].id]
+
+    for _ in range(2):  # kept by a rebuild
+        summary = OrderSummary.objects.get(user=users[0])
+        assert (summary.order_count, summary.total_spent) == (3, 30)
+        assert (summary.archived_order_count, summary.archived_total_spent) == (2, 25)
+        assert summary.last_order_at == recent.created_at
+        assert summary.archived_last_order_at == datetime(2020, 1, 20)
+        rebuild_order_summaries()
+
+
+@pytest.mark.django_db
+def test_archive_order_partitions_command(settings, tmp_path, capsys):
+    settings.ORDER_ARCHIVE_DIR = str(tmp_path)
+    user = get_user_model().objects.create_user(username='test')
+    create_partitions(datetime(2020, 1, 1), datetime(2020, 2, 1))
+    order_at(user, datetime(2020, 1, 5))
+
+    call_command('archive_order_partitions')
+    assert list(OrderArchive.objects.order_by('month').values_list('month', 'order_count')) == [
+        (date(2020, 1, 1), 1), (date(2020, 2, 1), 0),
+    ]
+    assert (tmp_path / 'orders-2020-01.ndjson.gz').exists()
+    assert 'Archived 2 months.' in capsys.readouterr().out
+
+    with pytest.raises(CommandError):
+        call_command('archive_order_partitions', '--month', '2020-01')
+    with pytest.raises(CommandError):
+        call_command('archive_order_partitions', '--month', '{:%Y-%m}'.format(datetime.now()))
+
+
+@pytest.mark.django_db
+def test_order_archive_views(tmp_path):
+    user = get_user_model().objects.create_user(username='test')
+    other = get_user_model().objects.create_user(username='other')
+    create_partitions(datetime(2020, 1, 1), datetime(2020, 1, 1))
+    order = order_at(user, datetime(2020, 1, 5))
+    order_at(other, datetime(2020, 1, 6))
+    archive_partition(date(2020, 1, 1), str(tmp_path))
+
+    resp = get(user, '/orders/archive/')
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json() == {'results': [{'month': '2020-01', 'url': 'http://testserver/orders/archive/2020-01/'}]}
+
+    resp = get(user, '/orders/archive/2020-01/')
+    assert resp.status_code == status.HTTP_200_OK
+    assert [archived['id'] for archived in resp.json()['results']] == [order.id]
+    assert get(user, '/orders/archive/2020-02/').status_code == status.HTTP_404_NOT_FOUND
+    assert get(user, '/orders/archive/january/').status_code == status.HTTP_404_NOT_FOUND
+    assert Client().get('/orders/archive/').status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,34 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from rest_framework.renderers import JSONRenderer
+
+from mattshop.orders.factories import OrderFactory, OrderItemFactory
+from mattshop.orders.models import Order
+from mattshop.orders.serializers import OrderRowSerializer, OrderSerializer
+from mattshop.renderers import FastJSONRenderer
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_order_row_serializer_matches():
+    user = get_user_model().objects.create_user(username='test')
+    order = OrderFactory(user=user, total_price='10.5')
+    OrderItemFactory(order=order, product_price='0.1', product_name='Tea ☕')
+    OrderFactory(user=user)
+    orders = Order.objects.filter(user=user).order_by('id')
+
+    expected = OrderSerializer(orders.prefetch_related('items'), many=True).data
+    rows = list(OrderRowSerializer.select(orders))
+    data = OrderRowSerializer(rows).data
+    assert data == expected
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(expected)
+
+    items = async_to_sync(OrderRowSerializer.afetch_items)(rows)
+    assert OrderRowSerializer(rows, items=items).data == expected
+
+
+@pytest.mark.django_db
+def test_order_row_serializer_empty(django_assert_num_queries):
+    with django_assert_num_queries(0):
+        assert OrderRowSerializer([]).data == []
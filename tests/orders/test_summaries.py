@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Count, Max, Sum
+
+from mattshop.orders import operations
+from mattshop.orders.factories import OrderFactory
+from mattshop.orders.models import Order, OrderSummary
+from mattshop.orders.operations import create_order
+from mattshop.orders.summaries import rebuild_order_summaries
+from mattshop.products.factories import ProductFactory
+
+import pytest
+
+
+def expected_summaries():
+    return {
+        totals['user']: (totals['order_count'], totals['total_spent'], totals['last_order_at'])
+        for totals in Order.objects.values('user').annotate(
+            order_count=Count('id'), total_spent=Sum('total_price'), last_order_at=Max('created_at')
+        )
+    }
+
+
+def summaries():
+    return {
+        summary.user_id: (summary.order_count, summary.total_spent, summary.last_order_at)
+        for summary in OrderSummary.objects.filter(order_count__gt=0)
+    }
+
+
+@pytest.mark.django_db
+def test_create_order_updates_summary():
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=5, prices__price='2.50')
+
+    create_order(user, [{'product_id': product.id, 'quantity': 1}])
+    order = create_order(user, [{'product_id': product.id, 'quantity': 2}])
+
+    summary = OrderSummary.objects.get(user=user)
+    assert summary.order_count == 2
+    assert summary.total_spent == Decimal('7.50')
+    assert summary.last_order_at == order.created_at
+
+
+@pytest.mark.django_db
+def test_place_orders_updates_summaries():
+    users = [get_user_model().objects.create_user(username='test{}'.format(i)) for i in range(2)]
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+
+    operations.place_orders([
+        (users[1], [{'product_id': product.id, 'quantity': 3}]),
+        (users[0], [{'product_id': product.id, 'quantity': 3}]),  # out of stock
+        (users[0], [{'product_id': product.id, 'quantity': 1}]),
+        (users[1], [{'product_id': product.id, 'quantity': 1}]),
+    ])
+    assert summaries() == expected_summaries()
+    assert OrderSummary.objects.get(user=users[1]).order_count == 2
+
+    operations.place_orders([
+        (users[0], [{'product_id': product.id, 'quantity': 1}]),
+        (users[1], [{'product_id': product.id, 'quantity': 1}]),  # out of stock
+    ], all_or_nothing=True)
+    assert OrderSummary.objects.get(user=users[0]).order_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_rebuild_order_summaries(workers):
+    users = [get_user_model().objects.create_user(username='test{}'.format(i)) for i in range(5)]
+    for i, user in enumerate(users[:4]):
+        for _ in range(i + 1):
+            OrderFactory(user=user)
+    # a summary left behind by a deleted order
+    OrderSummary.objects.create(user=users[4], order_count=1, total_spent=10)
+
+    assert rebuild_order_summaries(chunk_size=2, workers=workers) == 4
+    assert summaries() == expected_summaries()
+    assert OrderSummary.objects.get(user=users[4]).order_count == 0
+
+
+@pytest.mark.django_db
+def test_rebuild_order_summaries_command(capsys):
+    user = get_user_model().objects.create_user(username='test')
+    OrderFactory(user=user, total_price=5)
+    OrderFactory(user=user, total_price=7)
+
+    call_command('rebuild_order_summaries')
+    assert summaries() == expected_summaries()
+    assert 'of 1 users' in capsys.readouterr().out
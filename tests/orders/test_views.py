@@ -1,13 +1,18 @@
+import base64
 import json
+from datetime import datetime, timedelta
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
-from django.test import Client
+from django.core.management import call_command
+from django.test import AsyncClient, Client
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 
-from mattshop.orders.models import Order
+from mattshop.orders.models import Order, OrderItem, PendingOrder
 from mattshop.orders.factories import OrderFactory
+from mattshop.orders.operations import process_pending_orders
 
 import pytest
 
@@ -85,6 +90,52 @@ def test_order_history_pages():
     results = json.loads(resp.content)['results']
     assert len(results) == 5
 
+@pytest.mark.django_db
+def test_order_history_cursor_pages():
+    user = get_user_model().objects.create_user(username='test')
+    orders = [OrderFactory(user=user) for _ in range(25)]
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().get('/orders/history/?cursor=', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert resp.status_code == status.HTTP_200_OK
+    page1 = json.loads(resp.content)
+    assert len(page1['results']) == 20
+
+    resp = Client().get(page1['next'], HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert resp.status_code == status.HTTP_200_OK
+    page2 = json.loads(resp.content)
+    assert len(page2['results']) == 5
+    assert page2['next'] is None
+
+    # newest first
+    ids = [order['id'] for order in page1['results'] + page2['results']]
+    assert ids == [order.id for order in reversed(orders)]
+
+
+@pytest.mark.django_db
+def test_order_history_cursor_pages_same_millisecond():
+    user = get_user_model().objects.create_user(username='test')
+    orders = [OrderFactory(user=user) for _ in range(25)]
+    # as close together as orders placed in one batch
+    start = datetime.now().replace(microsecond=0)
+    for i, order in enumerate(orders):
+        Order.objects.filter(id=order.id).update(created_at=start + timedelta(microseconds=10 * i))
+        OrderItem.objects.filter(order=order).update(created_at=start + timedelta(microseconds=10 * i))
+    token, _ = Token.objects.get_or_create(user=user)
+
+    page1 = Client().get('/orders/history/?cursor=', HTTP_AUTHORIZATION=f'Token {token.key}').json()
+    page2 = Client().get(page1['next'], HTTP_AUTHORIZATION=f'Token {token.key}').json()
+    ids = [order['id'] for order in page1['results'] + page2['results']]
+    assert ids == [order.id for order in reversed(orders)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cursor', ['notacursor', base64.urlsafe_b64encode(b'["x", "y"]').decode()])
+def test_order_history_invalid_cursor(cursor):
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().get(f'/orders/history/?cursor={cursor}', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+
 
 @pytest.mark.django_db
 def test_order_create_view():
@@ -133,3 +184,257 @@ def test_order_view_out_of_stock():
 
     orders = Order.objects.filter(user=user)
     assert orders.count() == 0
+
+
+@pytest.mark.django_db
+def test_order_history_query_count(django_assert_num_queries):
+    user = get_user_model().objects.create_user(username='test')
+    for _ in range(20):
+        OrderFactory(user=user)
+    token, _ = Token.objects.get_or_create(user=user)
+
+    # authentication, count, orders, order items - however many orders and items there are
+    with django_assert_num_queries(4):
+        resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert len(json.loads(resp.content)['results']) == 20
+
+
+@pytest.mark.django_db
+def test_order_history_shows_product_name_at_time_of_order():
+    user = get_user_model().objects.create_user(username='test')
+    order = OrderFactory(user=user, items__product__name='rice (kgs)')
+    product = order.items.get().product
+    product.name = 'brown rice (kgs)'
+    product.save()
+
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert json.loads(resp.content)['results'][0]['items'][0]['product'] == 'rice (kgs)'
+
+
+@pytest.mark.django_db
+def test_order_view_unknown_product():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    resp = Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': 12345, 'quantity': 1}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert Order.objects.filter(user=user).count() == 0
+
+
+@pytest.mark.django_db
+def test_order_view_negative_quantity():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    for prefer in ('', 'respond-async'):
+        resp = Client().put('/orders/create/', json.dumps({
+            'items': [{'product_id': product.id, 'quantity': -1}]
+        }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_PREFER=prefer)
+        assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert Order.objects.filter(user=user).count() == 0
+    assert PendingOrder.objects.filter(user=user).count() == 0
+
+
+@pytest.mark.django_db
+def test_order_create_view_respond_async():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=12, prices__price=50)
+    resp = Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': product.id, 'quantity': 3}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_PREFER='respond-async')
+
+    assert resp.status_code == status.HTTP_202_ACCEPTED
+    pending_order = PendingOrder.objects.get(user=user)
+    assert json.loads(resp.content)['pending_order_id'] == pending_order.id
+    assert resp['Location'] == f'/orders/{pending_order.id}/status/'
+    assert pending_order.contents == [{'product_id': product.id, 'quantity': 3}]
+    assert Order.objects.filter(user=user).count() == 0
+
+
+@pytest.mark.django_db
+def test_order_status_view():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=12, prices__price=50)
+    pending_order = PendingOrder.objects.create(user=user, contents=[{'product_id': product.id, 'quantity': 3}])
+
+    resp = Client().get(f'/orders/{pending_order.id}/status/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert json.loads(resp.content)['status'] == PendingOrder.PENDING
+    assert json.loads(resp.content)['order_id'] is None
+
+    process_pending_orders(10)
+
+    resp = Client().get(f'/orders/{pending_order.id}/status/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert json.loads(resp.content)['status'] == PendingOrder.PLACED
+    assert json.loads(resp.content)['order_id'] == Order.objects.get(user=user).id
+
+
+@pytest.mark.django_db
+def test_order_status_view_other_users_order():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    other_user = get_user_model().objects.create_user(username='other')
+    pending_order = PendingOrder.objects.create(user=other_user, contents=[{'product_id': 1, 'quantity': 3}])
+
+    resp = Client().get(f'/orders/{pending_order.id}/status/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_order_bulk_create_view():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    resp = Client().put('/orders/bulk/', json.dumps({
+        'orders': [
+            {'items': [{'product_id': product.id, 'quantity': 3}]},
+            {'items': [{'product_id': product.id, 'quantity': 3}]},
+            {'items': []},
+            {'items': [{'product_id': product.id, 'quantity': 2}]},
+        ]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_207_MULTI_STATUS
+    results = json.loads(resp.content)['results']
+    orders = Order.objects.filter(user=user).order_by('id')
+    assert [result.get('order_id') for result in results] == [orders[0].id, None, None, orders[1].id]
+    assert 'out of stock' in results[1]['message']
+    assert 'errors' in results[2]
+
+
+@pytest.mark.django_db
+def test_order_bulk_create_view_negative_quantity():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    resp = Client().put('/orders/bulk/', json.dumps({
+        'orders': [
+            {'items': [{'product_id': product.id, 'quantity': 1}]},
+            {'items': [{'product_id': product.id, 'quantity': -1}]},
+            {'items': [{'product_id': product.id, 'quantity': 1}]},
+        ]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_207_MULTI_STATUS
+    results = json.loads(resp.content)['results']
+    orders = Order.objects.filter(user=user).order_by('id')
+    assert [result.get('order_id') for result in results] == [orders[0].id, None, orders[1].id]
+    assert 'errors' in results[1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('second_order', [
+    {'items': [{'product_id': 1, 'quantity': 1}, {'product_id': 1, 'quantity': 1}]},
+    {'items': [{'product_id': 12345, 'quantity': 1}]},
+])
+def test_order_bulk_create_view_all_or_nothing(second_order):
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=5, prices__price=2)
+    resp = Client().put('/orders/bulk/', json.dumps({
+        'orders': [{'items': [{'product_id': product.id, 'quantity': 1}]}, second_order],
+        'all_or_nothing': True,
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    results = json.loads(resp.content)['results']
+    assert 'not created' in results[0]['message']
+    assert Order.objects.filter(user=user).count() == 0
+    product.refresh_from_db()
+    assert product.quantity_in_stock == 5
+
+
+@pytest.mark.django_db
+def test_order_bulk_create_view_query_count(django_assert_max_num_queries):
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    products = [ProductFactory(quantity_in_stock=5, prices__price=2) for _ in range(10)]
+
+    # authentication, the transaction and its product locks, then a fixed number of queries per order, including its
+    # savepoint and catalogue adjustment, and one to update order summaries - and all of them in one transaction
+    with django_assert_max_num_queries(5 + 8 * len(products)):
+        resp = Client().put('/orders/bulk/', json.dumps({
+            'orders': [{'items': [{'product_id': product.id, 'quantity': 1}]} for product in products],
+        }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert Order.objects.filter(user=user).count() == len(products)
+
+
+def get_async(path, **headers):
+    return async_to_sync(AsyncClient().get)(path, headers=headers)
+
+
+@pytest.mark.django_db
+def test_order_list_async_matches_sync(settings):
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    for _ in range(3):
+        OrderFactory(user=user)
+    sync_resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    settings.ROOT_URLCONF = 'mattshop.asgi_urls'
+    async_resp = get_async('/orders/history/', Authorization=f'Token {token.key}')
+
+    assert async_resp.status_code == status.HTTP_200_OK
+    assert async_resp.content == sync_resp.content
+    assert len(json.loads(async_resp.content)['results']) == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.urls('mattshop.asgi_urls')
+@pytest.mark.parametrize('header', [{}, {'Authorization': 'Token nonsense'}])
+def test_order_list_async_requires_authentication(header):
+    resp = get_async('/orders/history/', **header)
+    assert resp.status_code == status.HTTP_401_UNAUTHORIZED
+    assert resp['WWW-Authenticate'] == 'Token'
+
+
+def get_summary(user, query=''):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client().get('/orders/summary/' + query, HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+@pytest.mark.django_db
+def test_order_summary(django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=10, prices__price=25)
+
+    resp = get_summary(user)
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json() == {'order_count': 0, 'total_spent': '0.00', 'last_order_at': None}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Client().put(
+            '/orders/create/', {'items': [{'product_id': product.id, 'quantity': 2}]},
+            content_type='application/json', HTTP_AUTHORIZATION=f'Token {user.auth_token.key}',
+        )
+    summary = get_summary(user).json()
+    assert summary['order_count'] == 1
+    assert summary['total_spent'] == '50.00'
+    assert summary['last_order_at'] is not None
+
+
+@pytest.mark.django_db
+def test_order_summary_requires_authentication():
+    resp = Client().get('/orders/summary/')
+    assert resp.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_order_summary_other_users():
+    user = get_user_model().objects.create_user(username='test')
+    other = get_user_model().objects.create_user(username='other')
+    staff = get_user_model().objects.create_user(username='staff', is_staff=True)
+    OrderFactory(user=other, total_price=5)
+    call_command('rebuild_order_summaries')
+
+    assert get_summary(user, '?user={}'.format(other.id)).status_code == status.HTTP_403_FORBIDDEN
+    resp = get_summary(staff, '?user={}'.format(other.id))
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json()['total_spent'] == '5.00'
+    assert get_summary(staff, '?user=nobody').status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from django.test import override_settings
+
+from mattshop.products.cache import bump_catalogue_version, catalogue_cache_timeout, get_catalogue_version
+from mattshop.products.factories import ProductFactory, ProductPriceFactory
+
+import pytest
+
+
+def test_bump_catalogue_version():
+    version = get_catalogue_version()
+    bump_catalogue_version()
+    assert get_catalogue_version() == version + 1
+
+
+@pytest.mark.django_db
+def test_catalogue_version_changes_on_price_save(django_capture_on_commit_callbacks):
+    product = ProductFactory()
+    version = get_catalogue_version()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductPriceFactory(product=product, effective_from=datetime.now() + timedelta(days=1))
+
+    assert get_catalogue_version() != version
+
+
+@pytest.mark.django_db
+@override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+def test_catalogue_cache_timeout():
+    now = datetime.now()
+    assert catalogue_cache_timeout(now=now) == 300
+
+    ProductPriceFactory(product=ProductFactory(), effective_from=now + timedelta(seconds=60))
+    assert catalogue_cache_timeout(now=now) == 60
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from mattshop.products.factories import ProductFactory, ProductPriceFactory
+from mattshop.products.models import Product
 
 import pytest
 
@@ -27,4 +28,24 @@ def test_get_current_price_with_future_price():
     ProductPriceFactory(product=product, price=120, effective_from=datetime(2022, 1, 1))
     ProductPriceFactory(product=product, price=140, effective_from=datetime(2249, 1, 1))
 
-    assert product.get_current_price() == 120
\ No newline at end of file
+    assert product.get_current_price() == 120
+
+@pytest.mark.django_db
+def test_get_current_price_no_price():
+    product = ProductFactory(prices=None)
+
+    assert product.get_current_price() is None
+
+@pytest.mark.django_db
+def test_with_current_price():
+    product1 = ProductFactory(prices__price=10)
+    ProductPriceFactory(product=product1, price=100, effective_from=datetime(2021, 1, 1))
+    ProductPriceFactory(product=product1, price=140, effective_from=datetime(2249, 1, 1))
+    product2 = ProductFactory(prices__price=20)
+    product3 = ProductFactory(prices=None)
+
+    products = {product.id: product for product in Product.objects.with_current_price()}
+
+    assert products[product1.id].current_price == 100
+    assert products[product2.id].current_price == 20
+    assert products[product3.id].current_price is None
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+from mattshop.products.factories import ProductFactory, ProductPriceFactory
+from mattshop.products.models import CatalogueEntry, Product
+from mattshop.products.operations import (
+    activate_scheduled_prices, adjust_catalogue_stock, allocate_sharded_stock, check_catalogue_consistency,
+    collapse_stock_shards, enable_stock_sharding, rebalance_stock_shards, refresh_catalogue
+)
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_catalogue_entry_created_with_product():
+    product = ProductFactory(name='rice (kgs)', quantity_in_stock=5, prices__price=10)
+
+    entry = CatalogueEntry.objects.get(product=product)
+    assert entry.name == 'rice (kgs)'
+    assert entry.enabled
+    assert entry.quantity_in_stock == 5
+    assert entry.price == 10
+
+@pytest.mark.django_db
+def test_catalogue_entry_follows_product_edits():
+    product = ProductFactory(quantity_in_stock=5)
+    product.quantity_in_stock = 3
+    product.enabled = False
+    product.save()
+
+    entry = CatalogueEntry.objects.get(product=product)
+    assert entry.quantity_in_stock == 3
+    assert not entry.enabled
+
+@pytest.mark.django_db
+def test_catalogue_entry_ignores_future_prices_until_activated():
+    product = ProductFactory(prices__price=10)
+    price = ProductPriceFactory(product=product, price=20, effective_from=datetime.now() + timedelta(hours=1))
+
+    assert CatalogueEntry.objects.get(product=product).price == 10
+    assert activate_scheduled_prices() == []
+
+    assert activate_scheduled_prices(now=price.effective_from) == [product.id]
+    assert CatalogueEntry.objects.get(product=product).price == 20
+
+@pytest.mark.django_db
+def test_activate_scheduled_prices_for_unpriced_product():
+    product = ProductFactory(prices=None)
+    price = ProductPriceFactory(product=product, price=20, effective_from=datetime.now() + timedelta(hours=1))
+    assert CatalogueEntry.objects.get(product=product).price is None
+
+    assert activate_scheduled_prices(now=price.effective_from) == [product.id]
+    assert CatalogueEntry.objects.get(product=product).price == 20
+
+@pytest.mark.django_db
+def test_adjust_catalogue_stock():
+    product1 = ProductFactory(quantity_in_stock=5)
+    product2 = ProductFactory(quantity_in_stock=7)
+
+    adjust_catalogue_stock({product1.id: -2, product2.id: -7})
+
+    assert CatalogueEntry.objects.get(product=product1).quantity_in_stock == 3
+    assert CatalogueEntry.objects.get(product=product2).quantity_in_stock == 0
+
+@pytest.mark.django_db
+def test_check_catalogue_consistency():
+    product1 = ProductFactory(quantity_in_stock=5)
+    product2 = ProductFactory(quantity_in_stock=5)
+    assert check_catalogue_consistency() == []
+
+    # bypass signals, as an out-of-band update would
+    Product.objects.filter(id=product2.id).update(quantity_in_stock=1)
+    assert check_catalogue_consistency() == [product2.id]
+
+    refresh_catalogue([product2.id])
+    assert check_catalogue_consistency() == []
+    assert CatalogueEntry.objects.get(product=product1).quantity_in_stock == 5
+    assert CatalogueEntry.objects.get(product=product2).quantity_in_stock == 1
+
+@pytest.mark.django_db
+def test_catalogue_entry_deleted_with_product(django_capture_on_commit_callbacks):
+    product = ProductFactory()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.delete()
+
+    assert not CatalogueEntry.objects.exists()
+
+@pytest.mark.django_db
+def test_catalogue_entry_follows_deleted_price(django_capture_on_commit_callbacks):
+    product = ProductFactory(prices__price=10)
+    ProductPriceFactory(product=product, price=20, effective_from=datetime(2021, 1, 1))
+    assert CatalogueEntry.objects.get(product=product).price == 20
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.prices.get(price=20).delete()
+
+    assert CatalogueEntry.objects.get(product=product).price == 10
+
+@pytest.mark.django_db
+def test_enable_stock_sharding():
+    product = ProductFactory(quantity_in_stock=10)
+
+    enable_stock_sharding(product.id, 3)
+
+    product.refresh_from_db()
+    assert product.sharded_stock
+    assert sorted(product.stock_shards.values_list('quantity', flat=True)) == [3, 3, 4]
+    assert product.get_available_stock() == 10
+    assert CatalogueEntry.objects.get(product=product).quantity_in_stock == 10
+
+@pytest.mark.django_db
+def test_rebalance_stock_shards():
+    product = ProductFactory(quantity_in_stock=10)
+    enable_stock_sharding(product.id, 2)
+    product.stock_shards.filter(id=product.stock_shards.first().id).update(quantity=0)
+
+    rebalance_stock_shards(product.id)
+
+    assert list(product.stock_shards.order_by('id').values_list('quantity', flat=True)) == [3, 2]
+
+@pytest.mark.django_db
+def test_collapse_stock_shards():
+    product = ProductFactory(quantity_in_stock=10)
+    enable_stock_sharding(product.id, 4)
+
+    collapse_stock_shards(product.id)
+
+    product.refresh_from_db()
+    assert not product.sharded_stock
+    assert product.quantity_in_stock == 10
+    assert not product.stock_shards.exists()
+
+@pytest.mark.django_db
+def test_allocate_sharded_stock():
+    product = ProductFactory(quantity_in_stock=9)
+    enable_stock_sharding(product.id, 3)
+
+    assert allocate_sharded_stock(product.id, 2)
+    assert Product.objects.with_stock().get(id=product.id).available_stock == 7
+
+    # more than any one shard holds - drawn from several
+    assert allocate_sharded_stock(product.id, 6)
+    assert Product.objects.with_stock().get(id=product.id).available_stock == 1
+
+    assert not allocate_sharded_stock(product.id, 2)
+    assert Product.objects.with_stock().get(id=product.id).available_stock == 1
@@ -0,0 +1,21 @@
+from rest_framework.renderers import JSONRenderer
+
+from mattshop.products.factories import ProductFactory, ProductPriceFactory
+from mattshop.products.models import CatalogueEntry
+from mattshop.products.serializers import CatalogueEntryRowSerializer, CatalogueEntrySerializer
+from mattshop.renderers import FastJSONRenderer
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_catalogue_entry_row_serializer_matches():
+    ProductFactory(name='Café "☃"', quantity_in_stock=3)
+    ProductPriceFactory(product=ProductFactory(quantity_in_stock=1), price='12.5')
+    ProductFactory(quantity_in_stock=0)
+    entries = CatalogueEntry.objects.listable().order_by('name')
+
+    expected = CatalogueEntrySerializer(entries, many=True).data
+    data = CatalogueEntryRowSerializer(CatalogueEntryRowSerializer.select(entries)).data
+    assert data == expected
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(expected)
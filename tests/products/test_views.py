@@ -1,10 +1,23 @@
+import base64
+import csv
+import gzip
+import io
 import json
+from datetime import datetime, timedelta
 
-from django.test import Client
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, Client
 
 from rest_framework import status
 
-from mattshop.products.factories import ProductFactory
+from mattshop.orders.operations import create_order
+from mattshop.products import export
+from mattshop.products.factories import ProductFactory, ProductPriceFactory
+from mattshop.products.models import Product
+from mattshop.products.operations import activate_scheduled_prices, refresh_catalogue
 
 import pytest
 
@@ -73,4 +86,349 @@ def test_product_list_view_pages():
     resp = Client().get('/products/list/?page=2')
     assert resp.status_code == status.HTTP_200_OK
     product_data = json.loads(resp.content)['results']
-    assert len(product_data) == 5
\ No newline at end of file
+    assert len(product_data) == 5
+
+@pytest.mark.django_db
+def test_product_list_view_excludes_unpriced_products():
+    ProductFactory(name='rice (kgs)', quantity_in_stock=5, prices__price='10.00')
+    ProductFactory(name='beans (kgs)', quantity_in_stock=5, prices=None)
+    resp = Client().get('/products/list/')
+    assert resp.status_code == status.HTTP_200_OK
+    product_data = json.loads(resp.content)['results']
+    assert [product['name'] for product in product_data] == ['rice (kgs)']
+
+
+@pytest.mark.django_db
+def test_product_list_view_query_count(django_assert_num_queries):
+    for _ in range(20):
+        ProductFactory(quantity_in_stock=2)
+
+    # one query to count, one to fetch the page (including prices), one to find when to expire it from the cache
+    with django_assert_num_queries(3):
+        resp = Client().get('/products/list/')
+    assert len(json.loads(resp.content)['results']) == 20
+
+
+@pytest.mark.django_db
+def test_product_list_view_cursor_pages():
+    for _ in range(25):  # enough to cause paging - with identical names, so paging must tie-break on id
+        ProductFactory(name='rice (kgs)', quantity_in_stock=2)
+
+    resp = Client().get('/products/list/?cursor=')
+    assert resp.status_code == status.HTTP_200_OK
+    page1 = json.loads(resp.content)
+    assert 'count' not in page1
+    assert len(page1['results']) == 20
+
+    resp = Client().get(page1['next'])
+    assert resp.status_code == status.HTTP_200_OK
+    page2 = json.loads(resp.content)
+    assert len(page2['results']) == 5
+    assert page2['next'] is None
+
+    ids = [product['id'] for product in page1['results'] + page2['results']]
+    assert ids == sorted(ids)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cursor', ['notacursor', base64.urlsafe_b64encode(b'["x", "y"]').decode()])
+def test_product_list_view_invalid_cursor(cursor):
+    resp = Client().get(f'/products/list/?cursor={cursor}')
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_product_list_view_not_modified(django_capture_on_commit_callbacks):
+    product = ProductFactory(quantity_in_stock=2)
+    resp = Client().get('/products/list/')
+    assert resp.status_code == status.HTTP_200_OK
+    etag = resp['ETag']
+
+    resp = Client().get('/products/list/', HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+    assert resp.content == b''
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.quantity_in_stock = 1
+        product.save()
+
+    resp = Client().get('/products/list/', HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp['ETag'] != etag
+    assert json.loads(resp.content)['results'][0]['quantity_in_stock'] == 1
+
+
+@pytest.mark.django_db
+def test_product_list_view_cached_until_catalogue_changes(django_assert_num_queries):
+    ProductFactory(quantity_in_stock=2)
+    Client().get('/products/list/')
+
+    with django_assert_num_queries(0):
+        resp = Client().get('/products/list/')
+    assert len(json.loads(resp.content)['results']) == 1
+
+
+def get_async(path, **headers):
+    return async_to_sync(AsyncClient().get)(path, headers=headers)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path', [
+    '/products/list/',
+    '/products/list/?page=2',
+    '/products/list/?cursor=',
+])
+def test_product_list_async_matches_sync(path, settings):
+    for _ in range(25):
+        ProductFactory(quantity_in_stock=1)
+    sync_resp = Client().get(path)
+    cache.clear()  # so the async view renders the page afresh
+
+    settings.ROOT_URLCONF = 'mattshop.asgi_urls'
+    async_resp = get_async(path)
+
+    assert async_resp.status_code == status.HTTP_200_OK
+    assert async_resp.content == sync_resp.content
+    assert 'ETag' in async_resp
+
+
+@pytest.mark.django_db
+@pytest.mark.urls('mattshop.asgi_urls')
+def test_product_list_async_not_modified():
+    resp = get_async('/products/list/')
+    resp = get_async('/products/list/', If_None_Match=resp['ETag'])
+    assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+@pytest.mark.urls('mattshop.asgi_urls')
+def test_product_list_async_invalid_page():
+    resp = get_async('/products/list/?page=5')
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+
+
+def get_export(path, **headers):
+    resp = Client().get(path, headers=headers)
+    return resp, b''.join(resp.streaming_content)
+
+
+def get_export_async(path, **headers):
+    async def get():
+        resp = await AsyncClient().get(path, headers=headers)
+        return resp, b''.join([chunk async for chunk in resp.streaming_content])
+    return async_to_sync(get)()
+
+
+def listed_products():
+    return sorted(Client().get('/products/list/?page_size=100').json()['results'], key=lambda product: product['id'])
+
+
+@pytest.mark.django_db
+def test_product_export_ndjson():
+    for _ in range(5):
+        ProductFactory(name='Café "☃"', quantity_in_stock=1)
+    ProductFactory(quantity_in_stock=0)
+    resp, content = get_export('/products/export/')
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp['Content-Type'] == 'application/x-ndjson'
+    assert resp['ETag'].startswith('W/')
+    assert [json.loads(line) for line in content.decode().splitlines()] == listed_products()
+
+
+@pytest.mark.django_db
+def test_product_export_csv():
+    for _ in range(5):
+        ProductFactory(quantity_in_stock=1)
+    resp, content = get_export('/products/export/?format=csv')
+
+    assert resp['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.DictReader(io.StringIO(content.decode())))
+    assert rows == [{key: str(value) for key, value in product.items()} for product in listed_products()]
+
+
+@pytest.mark.django_db
+def test_product_export_gzip():
+    for _ in range(5):
+        ProductFactory(quantity_in_stock=1)
+    _, content = get_export('/products/export/')
+    resp, compressed = get_export('/products/export/', Accept_Encoding='gzip, deflate')
+
+    assert resp['Content-Encoding'] == 'gzip'
+    assert resp['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(compressed) == content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('server_side_cursors', [True, False])
+def test_product_export_chunks(server_side_cursors, monkeypatch, django_assert_num_queries):
+    monkeypatch.setattr(export, 'CHUNK_SIZE', 2)
+    monkeypatch.setitem(connection.settings_dict, 'DISABLE_SERVER_SIDE_CURSORS', not server_side_cursors)
+    for _ in range(5):
+        ProductFactory(quantity_in_stock=1)
+
+    # one query through a server-side cursor, otherwise one per chunk
+    with django_assert_num_queries(1 if server_side_cursors else 3):
+        chunks = list(export.iter_chunks(export.export_queryset()))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [row.product_id for chunk in chunks for row in chunk] == [product['id'] for product in listed_products()]
+
+
+@pytest.mark.django_db
+def test_product_export_not_modified():
+    resp, _ = get_export('/products/export/')
+    resp = Client().get('/products/export/', headers={'If-None-Match': resp['ETag']})
+    assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+def test_product_export_invalid_format():
+    resp = Client().get('/products/export/?format=xml')
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path', ['/products/export/', '/products/export/?format=csv'])
+def test_product_export_async_matches_sync(path, settings):
+    for _ in range(5):
+        ProductFactory(quantity_in_stock=1)
+    _, content = get_export(path)
+
+    settings.ROOT_URLCONF = 'mattshop.asgi_urls'
+    resp, async_content = get_export_async(path)
+    assert resp.status_code == status.HTTP_200_OK
+    assert async_content == content
+
+    _, compressed = get_export_async(path, Accept_Encoding='gzip')
+    assert gzip.decompress(compressed) == content
+
+
+def get_changes(watermark=None):
+    resp = Client().get('/products/changes/', {'since': watermark} if watermark else {})
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()
+
+
+@pytest.mark.django_db
+def test_product_changes(settings, django_capture_on_commit_callbacks):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    ordered = ProductFactory(quantity_in_stock=5, prices__price=10)
+    disabled = ProductFactory(quantity_in_stock=5)
+    unchanged = ProductFactory(quantity_in_stock=5)
+    ProductFactory(quantity_in_stock=0)
+
+    # a first sync has everything listable
+    data = get_changes()
+    assert sorted(product['id'] for product in data['changes']) == sorted([ordered.id, disabled.id, unchanged.id])
+    assert data['removed'] == []
+    assert not data['more']
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create_order(get_user_model().objects.create_user(username='test'), [
+            {'product_id': ordered.id, 'quantity': 2},
+        ])
+    disabled.enabled = False
+    disabled.save()
+
+    data = get_changes(data['watermark'])
+    assert data['changes'] == [{'id': ordered.id, 'name': ordered.name, 'quantity_in_stock': 3, 'price': '10.00'}]
+    assert data['removed'] == [disabled.id]
+
+    assert get_changes(data['watermark'])['changes'] == []
+
+
+@pytest.mark.django_db
+def test_product_changes_scheduled_price(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    product = ProductFactory(quantity_in_stock=5, prices__price=10)
+    ProductPriceFactory(product=product, price=20, effective_from=datetime.now() + timedelta(hours=1))
+    watermark = get_changes()['watermark']
+
+    assert get_changes(watermark)['changes'] == []
+    activate_scheduled_prices(now=datetime.now() + timedelta(hours=2))
+    assert [product['price'] for product in get_changes(watermark)['changes']] == ['20.00']
+
+
+@pytest.mark.django_db
+def test_product_changes_overlap(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 60
+    product = ProductFactory(quantity_in_stock=5)
+    watermark = get_changes()['watermark']
+
+    # changes written just before the watermark may not have been visible when it was issued, so are repeated
+    assert [change['id'] for change in get_changes(watermark)['changes']] == [product.id]
+
+
+@pytest.mark.django_db
+def test_product_changes_more(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    settings.CATALOGUE_CHANGES_LIMIT = 2
+    products = [ProductFactory(quantity_in_stock=1) for _ in range(5)]
+
+    synced = []
+    data = {'watermark': None, 'more': True}
+    while data['more']:
+        data = get_changes(data['watermark'])
+        assert len(data['changes']) <= 2
+        synced += [product['id'] for product in data['changes']]
+    assert synced == [product.id for product in products]
+
+    products[0].name = 'renamed'
+    products[0].save()
+    assert [product['name'] for product in get_changes(data['watermark'])['changes']] == ['renamed']
+
+
+@pytest.mark.django_db
+def test_product_changes_deleted(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    settings.CATALOGUE_CHANGES_LIMIT = 1
+    deleted, renamed = ProductFactory(quantity_in_stock=1), ProductFactory(quantity_in_stock=1)
+    data = {'watermark': None, 'more': True}
+    while data['more']:
+        data = get_changes(data['watermark'])
+    watermark = data['watermark']
+
+    deleted_id = deleted.id
+    deleted.delete()
+    renamed.name = 'renamed'
+    renamed.save()
+
+    # paged through with the changed entries, in the order they changed
+    data = get_changes(watermark)
+    assert (data['changes'], data['removed'], data['more']) == ([], [deleted_id], True)
+    data = get_changes(data['watermark'])
+    assert ([change['id'] for change in data['changes']], data['removed']) == ([renamed.id], [])
+    assert get_changes(data['watermark'])['removed'] == []
+    # a first sync has nothing to remove
+    assert get_changes()['removed'] == []
+
+
+@pytest.mark.django_db
+def test_product_changes_refresh_catalogue(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    products = [ProductFactory(quantity_in_stock=1) for _ in range(3)]
+    watermark = get_changes()['watermark']
+
+    assert refresh_catalogue() == 0
+    # bypassing the signals which would keep its catalogue entry current
+    Product.objects.filter(id=products[1].id).update(name='renamed')
+    assert refresh_catalogue() == 1
+    assert [change['name'] for change in get_changes(watermark)['changes']] == ['renamed']
+
+
+@pytest.mark.django_db
+def test_product_changes_invalid_watermark():
+    resp = Client().get('/products/changes/', {'since': 'not-a-watermark'})
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_product_export_watermark(settings):
+    settings.CATALOGUE_CHANGES_OVERLAP = 0
+    product = ProductFactory(quantity_in_stock=1)
+    resp, _ = get_export('/products/export/')
+    assert get_changes(resp['Catalogue-Watermark'])['changes'] == []
+
+    product.quantity_in_stock = 2
+    product.save()
+    assert [change['quantity_in_stock'] for change in get_changes(resp['Catalogue-Watermark'])['changes']] == [2]
@@ -0,0 +1,128 @@
+"""Checks the hot queries are served by indexes, by examining their query plans.
+
+The database is seeded with `generate_data`, but a test database is far too small for the planner's cost-based choices
+to be meaningful - with a few hundred rows, a sequential scan and a sort is often genuinely cheapest. So plans are made
+with sequential scans and explicit sorts disabled (`enable_seqscan`, `enable_sort`). The planner then only uses them
+when there's no index able to serve the query, which is the regression these tests look for. As the planner may still
+fall back to a poorly-matched index (e.g. scanning all of `ProductPrice` by `effective_from` to find one product's
+price), each query must also use the index intended for it.
+"""
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+
+from mattshop.orders.models import Order, OrderItem, OrderSummary, PendingOrder
+from mattshop.orders.partitions import month_start, partition_name
+from mattshop.orders.serializers import OrderRowSerializer
+from mattshop.orders.views import OrderPagination
+from mattshop.pagination import KeysetPagination
+from mattshop.products.changes import ChangesPagination
+from mattshop.products.models import CatalogueEntry, Product, ProductPrice
+from mattshop.products.views import ProductPagination
+
+import pytest
+
+
+# node types which mean a query isn't using an index as intended
+DISALLOWED_NODES = {'Seq Scan', 'Sort', 'Incremental Sort'}
+
+
+@pytest.fixture
+def seeded():
+    call_command(
+        'generate_data', users=50, products=200, orders=1000, seed='plans', prefix='plans', until=datetime(2026, 1, 1),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_sort = off')
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def parent_indexes():
+    """The indexes of partitioned tables (e.g. `Order`'s), by the names of their partitions' indexes."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, parent.relname FROM pg_inherits JOIN pg_class parent ON parent.oid = inhparent "
+            "JOIN pg_class child ON child.oid = inhrelid WHERE child.relkind = 'i'"
+        )
+        return dict(cursor.fetchall())
+
+
+def assert_indexed(queryset, index):
+    nodes = list(plan_nodes(json.loads(queryset.explain(format='json'))[0]['Plan']))
+    assert not [node for node in nodes if node['Node Type'] in DISALLOWED_NODES], queryset.explain()
+    parents = parent_indexes()
+    indexes = [parents.get(node.get('Index Name'), node.get('Index Name')) for node in nodes]
+    assert index in indexes, queryset.explain()
+
+
+def keyset_page(queryset, ordering, position):
+    pagination = KeysetPagination()
+    pagination.ordering = ordering
+    return queryset.filter(pagination.rows_after(position)).order_by(*ordering)[:pagination.page_size + 1]
+
+
+@pytest.mark.django_db
+def test_order_history_plans(seeded):
+    user = User.objects.filter(username__startswith='plans').first()
+    orders = Order.objects.filter(user=user)
+    last = orders.order_by(*OrderPagination.ordering)[5]
+
+    assert_indexed(orders.order_by(*OrderPagination.ordering)[:20], 'order_user_created_idx')
+    assert_indexed(keyset_page(orders, OrderPagination.ordering, [last.created_at, last.id]), 'order_user_created_idx')
+    assert_indexed(OrderSummary.objects.filter(user=user), 'orders_ordersummary_pkey')
+    # a page's items are read only from the partitions holding the page's orders
+    page = OrderRowSerializer.select(orders.order_by(*OrderPagination.ordering)[:20])
+    items = OrderRowSerializer.items_queryset(page)
+    nodes = list(plan_nodes(json.loads(items.explain(format='json'))[0]['Plan']))
+    assert {node['Relation Name'] for node in nodes if 'Relation Name' in node} == {
+        partition_name(OrderItem, month_start(row.created_at)) for row in page
+    }, items.explain()
+
+
+@pytest.mark.django_db
+def test_current_price_plans(seeded):
+    product_ids = list(Product.objects.values_list('id', flat=True)[:20])
+
+    assert_indexed(
+        Product.objects.with_current_price().filter(id__in=product_ids).order_by(), 'price_product_effective_idx'
+    )
+    # the next scheduled price, which bounds how long catalogue pages are cached
+    assert_indexed(
+        ProductPrice.objects.filter(effective_from__gt=datetime(2025, 6, 1)).order_by('effective_from')[:1],
+        'products_productprice_effective_from_b6d35fc1',
+    )
+
+
+@pytest.mark.django_db
+def test_catalogue_plans(seeded):
+    entries = CatalogueEntry.objects.listable()
+    last = entries.order_by(*ProductPagination.ordering)[25]
+
+    assert_indexed(entries.order_by(*ProductPagination.ordering)[:20], 'catalogue_listable_idx')
+    assert_indexed(
+        keyset_page(entries, ProductPagination.ordering, [last.name, last.product_id]), 'catalogue_listable_idx'
+    )
+    assert_indexed(entries.order_by('product_id'), 'products_catalogueentry_pkey')  # the export
+    assert_indexed(
+        CatalogueEntry.objects.filter(updated_at__gt=datetime.now() - timedelta(minutes=1)).order_by(
+            *ChangesPagination.ordering
+        )[:1000],
+        'catalogue_updated_idx',
+    )
+
+
+@pytest.mark.django_db
+def test_pending_order_queue_plan(seeded):
+    assert_indexed(
+        PendingOrder.objects.filter(status=PendingOrder.PENDING).order_by('id')[:50], 'pending_order_queue_idx'
+    )
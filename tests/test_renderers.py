@@ -0,0 +1,36 @@
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+
+from mattshop.renderers import FastJSONRenderer
+
+import pytest
+
+
+@pytest.mark.parametrize('data', [
+    {'id': 1, 'name': 'Tea', 'price': '1.50', 'enabled': True, 'next': None},
+    [{'price': Decimal('12.50')}, {'price': Decimal('0.10')}],
+    {'created_at': datetime(2024, 1, 2, 3, 4, 5, 6789), 'on': date(2024, 1, 2)},
+    {'created_at': datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)},
+    {'name': 'café ☃ "quoted" \\ / \n\t\x01 \u2028 \u2029'},
+    {'detail': [ErrorDetail('Not found.', code='not_found')], 'message': gettext_lazy('Not found.')},
+    {1: 'one', 'id': uuid.UUID('12345678-1234-5678-1234-567812345678')},
+    [],
+])
+def test_fast_json_renderer(data):
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_fast_json_renderer_indent():
+    data = {'results': [{'id': 1}]}
+    assert FastJSONRenderer().render(data, 'application/json; indent=2') == JSONRenderer().render(
+        data, 'application/json; indent=2'
+    )
+
+
+def test_fast_json_renderer_none():
+    assert FastJSONRenderer().render(None) == b''
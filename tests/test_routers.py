@@ -0,0 +1,96 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.authtoken.models import Token
+
+from mattshop.orders.models import Order
+from mattshop.orders.operations import create_order
+from mattshop.products.factories import ProductFactory
+from mattshop.routers import ReplicaRouter, is_pinned_to_primary, pin_to_primary, replica_reads
+
+import pytest
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+def test_router_reads_from_replica():
+    router = ReplicaRouter()
+    assert router.db_for_read(Order) == 'default'
+    with replica_reads(AnonymousUser()):
+        assert router.db_for_read(Order) == 'replica1'
+        assert router.db_for_write(Order) == 'default'
+    assert router.db_for_read(Order) == 'default'
+
+
+def test_router_without_replicas():
+    with replica_reads():
+        assert ReplicaRouter().db_for_read(Order) == 'default'
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+def test_router_pinned_user_reads_from_primary():
+    user = get_user_model()(pk=1)
+    pin_to_primary(user.pk)
+
+    with replica_reads(user):
+        assert ReplicaRouter().db_for_read(Order) == 'default'
+    with replica_reads(get_user_model()(pk=2)):
+        assert ReplicaRouter().db_for_read(Order) == 'replica1'
+
+
+@pytest.mark.django_db
+@override_settings(DATABASE_REPLICAS=['replica1'])
+def test_placing_order_pins_user_to_primary(django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create_user(username='test')
+    product = ProductFactory(quantity_in_stock=1)
+
+    assert not is_pinned_to_primary(user)
+    with django_capture_on_commit_callbacks(execute=True):
+        create_order(user, [{'product_id': product.id, 'quantity': 1}])
+    assert is_pinned_to_primary(user)
+
+
+# These run against a real replica, e.g. with POSTGRES_REPLICA_HOSTS=localhost. In tests, replicas mirror the test
+# database.
+requires_replica = pytest.mark.skipif(not settings.DATABASE_REPLICAS, reason="No read replica configured")
+
+
+@requires_replica
+@pytest.mark.replica
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_order_history_reads_from_replica_until_user_orders():
+    user = get_user_model().objects.create_user(username='test')
+    token, _ = Token.objects.get_or_create(user=user)
+    product = ProductFactory(quantity_in_stock=1)
+    replica = connections[settings.DATABASE_REPLICAS[0]]
+
+    with CaptureQueriesContext(replica) as replica_queries:
+        Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert len(replica_queries) > 0
+
+    Client().put('/orders/create/', json.dumps({
+        'items': [{'product_id': product.id, 'quantity': 1}]
+    }), content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    with CaptureQueriesContext(replica) as replica_queries:
+        resp = Client().get('/orders/history/', HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert len(replica_queries) == 0
+    assert len(json.loads(resp.content)['results']) == 1
+
+
+@requires_replica
+@pytest.mark.replica
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_product_list_reads_from_replica():
+    ProductFactory()
+    replica = connections[settings.DATABASE_REPLICAS[0]]
+
+    with CaptureQueriesContext(replica) as replica_queries:
+        resp = Client().get('/products/list/')
+    assert len(replica_queries) > 0
+    assert len(json.loads(resp.content)['results']) == 1